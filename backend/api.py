@@ -1,11 +1,94 @@
-from fastapi import FastAPI, HTTPException
+import time
+
+_import_start = time.perf_counter()
+
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import TYPE_CHECKING, Dict, List, Literal, Optional
+import hmac
+import json
 import os
-from .chat_bot import SmartLibrarian
 
-app = FastAPI(title="Smart Librarian API", description="AI-powered book recommendation system")
+from .metrics import METRICS, MetricsMiddleware, cache_samples
+
+if TYPE_CHECKING:
+    from .chat_bot import SmartLibrarian
+
+# The librarian (OpenAI clients, vector store, caches) is created on a worker
+# thread once the server is up, so the port opens immediately, /health answers
+# at once and /ready reports when requests can be served. Endpoints that need
+# it wait for startup to finish.
+librarian: Optional["SmartLibrarian"] = None
+_librarian_task: Optional[asyncio.Future] = None
+_startup_error: Optional[str] = None
+startup_timings: Dict[str, float] = {}
+
+
+def create_librarian() -> "SmartLibrarian":
+    """Import the chat stack, open the prebuilt index and warm it up, timing each step"""
+    start = time.perf_counter()
+    from .chat_bot import SmartLibrarian
+    startup_timings['import_chat_bot'] = round(time.perf_counter() - start, 4)
+
+    start = time.perf_counter()
+    instance = SmartLibrarian()
+    startup_timings['init'] = round(time.perf_counter() - start, 4)
+
+    for step, seconds in instance.warm_up().items():
+        startup_timings[f'warm_up_{step}'] = round(seconds, 4)
+    return instance
+
+
+def start_librarian() -> asyncio.Future:
+    """Start creating the librarian in the background, once per process"""
+    global _librarian_task
+    if _librarian_task is None:
+        _librarian_task = asyncio.ensure_future(run_in_threadpool(create_librarian))
+    return _librarian_task
+
+
+async def get_librarian() -> "SmartLibrarian":
+    """The shared librarian, waiting for startup if it is still in progress"""
+    global librarian, _librarian_task, _startup_error
+    if librarian is None:
+        task = start_librarian()
+        try:
+            librarian = await asyncio.shield(task)
+            _startup_error = None
+        except Exception as e:
+            # Let the next request retry instead of failing forever
+            _librarian_task = None
+            _startup_error = str(e)
+            raise HTTPException(status_code=503, detail=f"Librarian failed to start: {str(e)}")
+    return librarian
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    task = start_librarian()
+    task.add_done_callback(_record_startup)
+    yield
+    if librarian is not None:
+        librarian.close()
+
+
+def _record_startup(task: asyncio.Future):
+    global librarian, _startup_error
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        _startup_error = str(task.exception())
+        print(f"Warning: librarian failed to start: {_startup_error}")
+    else:
+        librarian = task.result()
+
+
+app = FastAPI(title="Smart Librarian API", description="AI-powered book recommendation system", lifespan=lifespan)
 
 # Enable CORS for frontend
 app.add_middleware(
@@ -17,18 +100,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize the chatbot
-librarian = SmartLibrarian()
+# Request latency and counts per route; SERVER_TIMING adds per-stage timings to responses
+app.add_middleware(
+    MetricsMiddleware,
+    server_timing=os.getenv("SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+)
 
 
 class ChatRequest(BaseModel):
     message: str
+    mode: Optional[Literal["tool", "single_pass"]] = None
+    # Continue a conversation: the same id on every turn (any client-chosen string)
+    session_id: Optional[str] = Field(default=None, min_length=1, max_length=128)
+
+
+class BatchChatRequest(BaseModel):
+    messages: List[str]
+    mode: Optional[Literal["tool", "single_pass"]] = None
+    concurrency: Optional[int] = Field(default=None, ge=1, le=64)
+
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    limit: int = Field(default=5, ge=1, le=100)
+    author: Optional[str] = None
+    genre: Optional[str] = None
+    mode: Optional[Literal["hybrid", "vector", "lexical"]] = None
 
 
 class ChatResponse(BaseModel):
     response: str
     inappropriate_content: bool
     recommended_books: Optional[List[str]] = None
+    usage: Optional[Dict[str, int]] = None
+    cached: Optional[str] = None
+    session_id: Optional[str] = None
 
 
 class HealthResponse(BaseModel):
@@ -46,54 +152,303 @@ async def health_check():
     return HealthResponse(status="healthy", message="API is operational")
 
 
+@app.get("/ready")
+async def ready(response: Response):
+    """
+    Readiness check: 200 once the index is open and requests can be served,
+    503 while starting up or after a failed start
+    """
+    if librarian is None:
+        response.status_code = 503
+        status = "failed" if _startup_error else "starting"
+        return {"status": status, "error": _startup_error, "timings": startup_timings}
+
+    return {
+        "status": "ready",
+        "books": len(librarian.vector_store.title_index),
+        "catalog_version": librarian.vector_store.catalog_version,
+        "snapshot": librarian.snapshots.current.name if librarian.snapshots is not None else None,
+        "timings": startup_timings
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus metrics: per-stage latency histograms, request, token and
+    error counters, and cache hit rates
+    """
+    samples = []
+    if librarian is not None:
+        samples = cache_samples(
+            librarian.response_cache.stats(),
+            librarian.vector_store.embedding_function.stats(),
+            librarian.openai.stats(),
+            len(librarian.vector_store.title_index),
+            len(librarian.sessions)
+        )
+    return PlainTextResponse(METRICS.render(samples), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """
     Chat endpoint for book recommendations
     """
-    try:
-        if not request.message.strip():
-            raise HTTPException(status_code=400, detail="Message cannot be empty")
+    if not request.message.strip():
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
 
-        result = librarian.get_book_recommendation(request.message)
+    librarian = await get_librarian()
+    try:
+        result = await librarian.aget_book_recommendation(request.message, request.mode, request.session_id)
 
         return ChatResponse(
             response=result["response"],
             inappropriate_content=result["inappropriate_content"],
-            recommended_books=result.get("recommended_books")
+            recommended_books=result.get("recommended_books"),
+            usage=result.get("usage"),
+            cached=result.get("cached"),
+            session_id=result.get("session_id")
         )
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Chat endpoint streaming the recommendation as server-sent events
+    """
+    if not request.message.strip():
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+
+    librarian = await get_librarian()
+
+    async def event_stream():
+        # The 200 and headers are already sent, so a failure can only be reported as an event
+        try:
+            async for event in librarian.astream_book_recommendation(
+                    request.message, request.mode, request.session_id):
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+        except Exception as e:
+            error = {"response": f"Internal server error: {str(e)}", "inappropriate_content": False}
+            yield f"event: error\ndata: {json.dumps(error)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest):
+    """
+    Recommendations for many messages, streamed as JSON lines in completion order
+    """
+    if not request.messages:
+        raise HTTPException(status_code=400, detail="Messages cannot be empty")
+    # As on /chat, so a blank item never reaches retrieval and the completions
+    blank = [index for index, message in enumerate(request.messages) if not message.strip()]
+    if blank:
+        raise HTTPException(
+            status_code=400, detail=f"Messages cannot be empty (items {', '.join(map(str, blank))})"
+        )
+
+    librarian = await get_librarian()
+
+    async def result_lines():
+        async for result in librarian.aget_book_recommendations_batch(
+                request.messages, request.mode, request.concurrency):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(result_lines(), media_type="application/x-ndjson")
+
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    """
+    A conversation's retained history: recent turns, notes on older ones and its token size
+    """
+    librarian = await get_librarian()
+    session = await run_in_threadpool(librarian.sessions.get, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {
+        "session_id": session.session_id,
+        "turns": [{"role": turn["role"], "content": turn["content"]} for turn in session.turns],
+        "notes": [note["text"] for note in session.notes],
+        "recent_books": session.titles,
+        "history_tokens": session.history_tokens
+    }
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """
+    Forget a conversation
+    """
+    librarian = await get_librarian()
+    if not await run_in_threadpool(librarian.sessions.delete, session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"deleted": session_id}
+
+
 @app.get("/books")
-async def get_all_books():
+async def get_all_books(request: Request, offset: int = Query(0, ge=0), limit: Optional[int] = Query(None, ge=1)):
     """
-    Get list of all available books
+    Available books in alphabetical order, optionally one page (offset/limit) at a time.
+    Responses carry an ETag of the catalog; send it as If-None-Match to get
+    304 Not Modified while the catalog is unchanged
     """
+    librarian = await get_librarian()
+    vector_store = librarian.vector_store
     try:
-        books = librarian.vector_store.get_all_titles()
-        return {"books": books}
+        etag = f'"{vector_store.titles_digest()[:20]}-{offset}-{limit or ""}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+
+        books, total = vector_store.get_titles_page(offset, limit)
+        return JSONResponse({"books": books, "total": total, "offset": offset, "limit": limit}, headers=headers)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching books: {str(e)}")
 
 
+@app.get("/books/{title:path}/similar")
+async def similar_books(title: str, limit: int = Query(5, ge=1, le=100)):
+    """
+    Books most similar to a catalog book, from the precomputed neighbour table
+    """
+    librarian = await get_librarian()
+    with librarian.pin():
+        if librarian.vector_store.neighbor_table is None:
+            raise HTTPException(status_code=404, detail="Neighbour table not built; run backend.build_index")
+        result = await run_in_threadpool(librarian.vector_store.similar_books, title, n_results=limit)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return result
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Hit rates and savings of the response and embedding caches
+    """
+    librarian = await get_librarian()
+    return {
+        "responses": librarian.response_cache.stats(),
+        "embeddings": librarian.vector_store.embedding_function.stats()
+    }
+
+
+def search_filters(author: Optional[str], genre: Optional[str]) -> Dict[str, str]:
+    return {field: value for field, value in (("author", author), ("genre", genre)) if value}
+
+
 @app.get("/search")
-async def search_books(query: str, limit: int = 5):
+async def search_books(query: str, limit: int = 5, author: Optional[str] = None, genre: Optional[str] = None,
+                       mode: Optional[Literal["hybrid", "vector", "lexical"]] = None):
     """
-    Search books by query
+    Search books by query, optionally only among an author's or genre's books
     """
+    if not query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+
+    librarian = await get_librarian()
     try:
-        if not query.strip():
-            raise HTTPException(status_code=400, detail="Query cannot be empty")
+        with librarian.pin():
+            results = await run_in_threadpool(
+                librarian.vector_store.search_books,
+                query, n_results=limit, filters=search_filters(author, genre), mode=mode
+            )
+        return {"results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Search error: {str(e)}")
+
 
-        results = librarian.vector_store.search_books(query, n_results=limit)
+@app.post("/search/batch")
+async def search_books_batch(request: BatchSearchRequest):
+    """
+    Search books for many queries at once; each result holds parallel
+    titles, summaries and distances lists, ranked closest first
+    """
+    if not request.queries or any(not query.strip() for query in request.queries):
+        raise HTTPException(status_code=400, detail="Queries cannot be empty")
+
+    librarian = await get_librarian()
+    try:
+        with librarian.pin():
+            results = await run_in_threadpool(
+                librarian.vector_store.search_columns,
+                request.queries, n_results=request.limit, filters=search_filters(request.author, request.genre),
+                mode=request.mode
+            )
         return {"results": results}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Search error: {str(e)}")
 
 
+def check_admin_token(token: Optional[str]):
+    """Admin endpoints are off unless ADMIN_TOKEN is set, and then need it in X-Admin-Token"""
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_TOKEN")
+    if not token or not hmac.compare_digest(token, expected):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+async def get_snapshots(token: Optional[str]):
+    check_admin_token(token)
+    librarian = await get_librarian()
+    if librarian.snapshots is None:
+        raise HTTPException(status_code=409, detail="Index snapshots are disabled; set INDEX_SNAPSHOTS=true")
+    return librarian.snapshots
+
+
+@app.get("/admin/snapshots")
+async def snapshot_status(x_admin_token: Optional[str] = Header(None)):
+    """
+    Served, published and available index snapshots, with requests still in flight on each
+    """
+    snapshots = await get_snapshots(x_admin_token)
+    return snapshots.stats()
+
+
+@app.post("/admin/snapshots")
+async def build_snapshot(full: bool = False, x_admin_token: Optional[str] = Header(None)):
+    """
+    Ingest the catalog file into a new snapshot, publish it and switch to it.
+    Requests keep being served from the current snapshot meanwhile; other
+    workers switch within SNAPSHOT_WATCH_INTERVAL seconds
+    """
+    snapshots = await get_snapshots(x_admin_token)
+    from .vector_store import CATALOG_PATH
+
+    try:
+        manifest = await run_in_threadpool(
+            snapshots.build, CATALOG_PATH, not full, int(os.getenv("SNAPSHOT_NEIGHBORS", 10))
+        )
+        await run_in_threadpool(snapshots.load_current)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=400, detail=f"Catalog not found: {str(e)}")
+    return manifest
+
+
+@app.post("/admin/snapshots/reload")
+async def reload_snapshot(x_admin_token: Optional[str] = Header(None)):
+    """
+    Switch this worker to the published snapshot now, without waiting for the watcher
+    """
+    snapshots = await get_snapshots(x_admin_token)
+    await run_in_threadpool(snapshots.load_current)
+    return snapshots.stats()
+
+
+startup_timings['import_api'] = round(time.perf_counter() - _import_start, 4)
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,48 @@
+"""
+Build or update the search index from the catalog file, offline.
+
+Serving processes then open the prebuilt index without ingesting
+(INGEST_ON_STARTUP=auto skips ingestion once the store has books).
+After ingestion it precomputes the nearest neighbours of every book for
+/books/{title}/similar and "books like ..." questions.
+
+With INDEX_SNAPSHOTS=true the index is built as a new immutable snapshot
+and published; running servers switch to it without a restart.
+
+    python -m backend.build_index [--catalog ./data/book_summaries.txt] [--full] [--batch-size 256]
+                                  [--neighbors 10 | --no-neighbors]
+"""
+import argparse
+import json
+
+from .snapshots import create_snapshot_manager
+from .vector_store import CATALOG_PATH, VectorStore
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--catalog", default=CATALOG_PATH, help="book summaries file to ingest")
+    parser.add_argument("--full", action="store_true", help="wipe the store and re-embed every book")
+    parser.add_argument("--batch-size", type=int, default=None, help="books embedded per batch")
+    parser.add_argument("--neighbors", type=int, default=10, help="similar books stored per book")
+    parser.add_argument("--no-neighbors", action="store_true", help="skip building the neighbour table")
+    args = parser.parse_args(argv)
+
+    neighbors = 0 if args.no_neighbors else args.neighbors
+
+    snapshots = create_snapshot_manager()
+    if snapshots is not None:
+        manifest = snapshots.build(args.catalog, incremental=not args.full, neighbors=neighbors,
+                                   batch_size=args.batch_size)
+        print(json.dumps(manifest, indent=2))
+        return
+
+    vector_store = VectorStore()
+    report = vector_store.load_books_from_file(args.catalog, incremental=not args.full, batch_size=args.batch_size)
+    if neighbors:
+        report['neighbors'] = vector_store.build_neighbors(neighbors)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,159 +1,942 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
 import openai
 import json
-from typing import List, Dict
+import re
+import time
+import itertools
+import numpy as np
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
 import os
 from dotenv import load_dotenv
-from .vector_store import VectorStore, get_summary_by_title
+from .content_filter import ProfanityFilter
+from .metrics import METRICS, stage
+from .openai_client import get_gateway
+from .passages import passage_excerpt
+from .response_cache import ResponseCache
+from .sessions import Session, create_session_store
+from .snapshots import create_snapshot_manager
+from .tokens import count_tokens, truncate_to_tokens
+from .vector_store import CATALOG_PATH, VectorStore, lookup_summary
 
 load_dotenv()
 
 
+CHAT_MODEL = "gpt-4o-mini"
+
+# When the catalog file is ingested at startup (see _ingest_on_startup)
+INGEST_POLICIES = ('auto', 'always', 'never')
+
+TOOL_MODE = "tool"
+SINGLE_PASS_MODE = "single_pass"
+RECOMMENDATION_MODES = (TOOL_MODE, SINGLE_PASS_MODE)
+
+# "books like X", "something similar to X": answered from the neighbour table
+SIMILAR_QUERY = re.compile(
+    r"\b(?:books?|novels?|something|anything|reads?|titles?)\s+(?:similar\s+to|like)\s+"
+    r"(?P<title>.+?)\s*[?.!]*\s*$",
+    re.IGNORECASE
+)
+# Characters of each neighbour's summary quoted in a similar-books answer
+SIMILAR_SUMMARY_CHARS = 200
+
+# Tool the model can call for detailed summaries
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_summary_by_title",
+            "description": "Get a detailed summary for a specific book title",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "title": {
+                        "type": "string",
+                        "description": "The exact title of the book"
+                    }
+                },
+                "required": ["title"]
+            }
+        }
+    }
+]
+
+
 class SmartLibrarian:
-    def __init__(self):
-        self.client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        self.vector_store = VectorStore()
+    def __init__(self, vector_store: Optional[VectorStore] = None):
+        # Process-wide OpenAI clients: pooled connections, timeouts, retries, rate limits
+        self.openai = get_gateway()
+
+        # Vector search is blocking, so async callers run it on a bounded pool
+        self.search_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('SEARCH_THREADS', 4)),
+            thread_name_prefix='vector-search'
+        )
+
+        # With INDEX_SNAPSHOTS the store is the published snapshot's, swapped while serving
+        self.snapshots = None
+        self._vector_store = vector_store
+        if vector_store is None:
+            self.snapshots = create_snapshot_manager()
+            if self.snapshots is not None:
+                self._open_snapshot(os.getenv('INGEST_ON_STARTUP', 'auto'))
+            else:
+                self._vector_store = VectorStore()
+                self._ingest_on_startup(os.getenv('INGEST_ON_STARTUP', 'auto'))
+
+        # Which titles the system prompt lists as available: "candidates" (only the
+        # retrieved books), "top_n" (candidates plus the first PROMPT_TITLE_LIMIT
+        # catalog titles) or "all" (the whole catalog, grows with its size)
+        self.prompt_titles = os.getenv('PROMPT_TITLES', 'candidates')
+        self.prompt_title_limit = int(os.getenv('PROMPT_TITLE_LIMIT', 50))
+
+        # "tool": short context, the model fetches summaries with a second completion.
+        # "single_pass": full summaries of the candidates go in the first prompt,
+        # within SINGLE_PASS_TOKEN_BUDGET tokens, and the tool is only for other books.
+        self.recommendation_mode = self._check_mode(os.getenv('RECOMMENDATION_MODE', TOOL_MODE))
+        self.single_pass_token_budget = int(os.getenv('SINGLE_PASS_TOKEN_BUDGET', 1500))
+
+        # Tokens of each candidate quoted in a "tool" mode prompt: its best-matching
+        # passages when passages are indexed, else the start of its summary
+        self.prompt_excerpt_tokens = int(os.getenv('PROMPT_EXCERPT_TOKENS', 50))
+
+        # Batch jobs: queries retrieved per chunk and completions in flight at once
+        self.batch_chunk_size = int(os.getenv('BATCH_CHUNK_SIZE', 64))
+        self.batch_concurrency = int(os.getenv('BATCH_CONCURRENCY', 8))
+
+        # Exact and embedding-similarity cache of recent results, reset on catalog changes
+        self.response_cache = ResponseCache(
+            self.vector_store.embedding_function,
+            max_entries=int(os.getenv('RESPONSE_CACHE_SIZE', 1000)),
+            ttl_seconds=float(os.getenv('RESPONSE_CACHE_TTL', 3600)),
+            similarity_threshold=float(os.getenv('RESPONSE_CACHE_THRESHOLD', 0.95))
+        )
+
+        # Conversations: recent turns verbatim within SESSION_HISTORY_TOKENS, older
+        # ones compacted into notes within SESSION_NOTES_TOKENS
+        self.sessions = create_session_store()
+        self.session_history_tokens = int(os.getenv('SESSION_HISTORY_TOKENS', 1000))
+        self.session_notes_tokens = int(os.getenv('SESSION_NOTES_TOKENS', 200))
+
+        # "Books like <title>" answered from the precomputed neighbour table, without
+        # OpenAI calls, when the title matches a catalog title this closely
+        self.similar_fast_path = os.getenv('SIMILAR_FAST_PATH', 'true').lower() not in ('0', 'false', 'no')
+        self.similar_title_threshold = float(os.getenv('SIMILAR_TITLE_THRESHOLD', 0.8))
+        self.similar_results = int(os.getenv('SIMILAR_RESULTS', 3))
+
+        # Inappropriate words, compiled once into a single-pass whole-word filter
+        self.content_filter = ProfanityFilter.from_file(
+            os.getenv('INAPPROPRIATE_WORDS_PATH', './data/inappropriate_words.txt')
+        )
+        self.inappropriate_words = self.content_filter.words
+
+    def _ingest_on_startup(self, policy: str):
+        """Sync the catalog file into the store: "always", "never" or "auto" (only if the store is empty).
+
+        Serving processes normally open an index prebuilt with
+        `python -m backend.build_index` and skip ingestion.
+        """
+        if policy not in INGEST_POLICIES:
+            raise ValueError(f"Unknown INGEST_ON_STARTUP '{policy}', expected one of {', '.join(INGEST_POLICIES)}")
+        if policy == 'never' or (policy == 'auto' and self.vector_store.backend.count() > 0):
+            return
 
         # Load books into vector store
         try:
-            self.vector_store.load_books_from_file('./data/book_summaries.txt')
+            self.vector_store.load_books_from_file(
+                CATALOG_PATH,
+                incremental=os.getenv('INGEST_MODE', 'incremental') != 'full'
+            )
         except FileNotFoundError:
             print("Warning: book_summaries.txt not found. Please ensure the file exists in the data directory.")
 
-        # Define inappropriate words (you can expand this list)
-        self.inappropriate_words = [
-            'fuck', 'shit', 'damn', 'bitch', 'bastard', 'asshole',
-            'motherfucker', 'cocksucker', 'cunt', 'piss'
-        ]
+    def _open_snapshot(self, policy: str):
+        """Serve the published snapshot, first building one from the catalog file if policy says so.
+
+        "auto" builds only when nothing is published yet, "always" builds a new
+        snapshot on every start. New snapshots published later (by
+        backend.build_index or POST /admin/snapshots) are picked up every
+        SNAPSHOT_WATCH_INTERVAL seconds.
+        """
+        if policy not in INGEST_POLICIES:
+            raise ValueError(f"Unknown INGEST_ON_STARTUP '{policy}', expected one of {', '.join(INGEST_POLICIES)}")
+        if policy == 'always' or (policy == 'auto' and self.snapshots.published() is None):
+            try:
+                self.snapshots.build(
+                    CATALOG_PATH,
+                    incremental=os.getenv('INGEST_MODE', 'incremental') != 'full',
+                    neighbors=int(os.getenv('SNAPSHOT_NEIGHBORS', 10))
+                )
+            except FileNotFoundError:
+                print("Warning: book_summaries.txt not found. Please ensure the file exists in the data directory.")
+
+        if not self.snapshots.load_current():
+            raise RuntimeError(f"No index snapshot published in {self.snapshots.root}; run backend.build_index")
+        self.snapshots.start_watching(float(os.getenv('SNAPSHOT_WATCH_INTERVAL', 5)))
+
+    @property
+    def vector_store(self) -> VectorStore:
+        """Store requests search: the fixed one, or the pinned (else current) snapshot's"""
+        if self.snapshots is None:
+            return self._vector_store
+        return self.snapshots.store()
+
+    def pin(self):
+        """Context manager serving a whole request from one index snapshot (no-op without snapshots)"""
+        return self.snapshots.pin() if self.snapshots is not None else contextlib.nullcontext()
+
+    def warm_up(self) -> Dict[str, float]:
+        """Load what the first request would otherwise wait for; returns seconds per step"""
+        timings = {}
+        start = time.perf_counter()
+        len(self.vector_store.title_index)
+        timings['title_index'] = time.perf_counter() - start
+
+        # Sorted title list and its ETag for /books
+        start = time.perf_counter()
+        self.vector_store.titles_digest()
+        timings['book_list'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        count_tokens("warm up", CHAT_MODEL)
+        timings['tokenizer'] = time.perf_counter() - start
+        return timings
+
+    def close(self):
+        """Stop the search thread pool and the snapshot watcher"""
+        self.search_executor.shutdown(wait=False)
+        if self.snapshots is not None:
+            self.snapshots.close()
 
     def contains_inappropriate_language(self, message: str) -> bool:
         """Check if message contains inappropriate language"""
-        message_lower = message.lower()
-        return any(word in message_lower for word in self.inappropriate_words)
+        return self.content_filter.contains(message)
+
+    def get_book_recommendation(self, user_query: str, mode: Optional[str] = None,
+                                session_id: Optional[str] = None) -> Dict:
+        """Get book recommendation with RAG and tool calling.
 
-    def get_book_recommendation(self, user_query: str) -> Dict:
-        """Get book recommendation with RAG and tool calling"""
+        With a session_id the conversation so far is sent along and books
+        from earlier turns stay in context, so follow-up questions work.
+        """
+        with self.pin():
+            return self._get_book_recommendation(user_query, mode, session_id)
+
+    def _get_book_recommendation(self, user_query: str, mode: Optional[str], session_id: Optional[str]) -> Dict:
+        mode = self._check_mode(mode or self.recommendation_mode)
 
         # Check for inappropriate language
-        if self.contains_inappropriate_language(user_query):
-            return {
-                "response": "I appreciate your interest in book recommendations, but I'd prefer to keep our conversation respectful. Could you please rephrase your request without offensive language? I'm here to help you find amazing books to read!",
-                "inappropriate_content": True
-            }
+        with stage('content_filter'):
+            inappropriate = self.contains_inappropriate_language(user_query)
+        if inappropriate:
+            return self._inappropriate_response()
 
-        # Search vector store for relevant books
-        relevant_books = self.vector_store.search_books(user_query, n_results=3)
+        session = self._load_session(session_id)
 
-        if not relevant_books:
-            return {
-                "response": "I couldn't find any books matching your criteria in my current database. Could you try a different theme or provide more details about what you're looking for?",
-                "inappropriate_content": False
-            }
+        similar = self._similar_books_answer(user_query)
+        if similar is not None:
+            return self._save_exchange(session, user_query, similar)
 
-        # Prepare context for the LLM
-        context = "Based on your interests, here are some relevant books from my database:\n\n"
-        for book in relevant_books:
-            context += f"**{book['title']}**: {book['summary'][:200]}...\n\n"
+        # Answers depend on earlier turns once a conversation has started
+        use_cache = session is None or not session.turns
 
-        # Define the tool for getting detailed summaries
-        tools = [
-            {
-                "type": "function",
-                "function": {
-                    "name": "get_summary_by_title",
-                    "description": "Get a detailed summary for a specific book title",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "title": {
-                                "type": "string",
-                                "description": "The exact title of the book"
-                            }
-                        },
-                        "required": ["title"]
-                    }
-                }
-            }
-        ]
+        # Serve repeated and near-duplicate queries from the response cache
+        catalog_version = self.vector_store.catalog_version
+        query_vector = None
+        if use_cache:
+            with stage('cache_lookup'):
+                cached, query_vector = self.response_cache.lookup(user_query, mode, catalog_version)
+            if cached is not None:
+                return self._save_exchange(session, user_query, self._cached_response(cached))
 
-        # Create the system prompt
-        system_prompt = f"""You are a knowledgeable and friendly librarian AI assistant. Your job is to recommend books based on user interests and provide engaging, conversational responses.
+        start = time.perf_counter()
+        result = self._recommend(user_query, mode, session, query_vector)
+        if use_cache and self._cacheable(result):
+            with stage('cache_store'):
+                self.response_cache.store(
+                    user_query, mode, result, time.perf_counter() - start, catalog_version, query_vector
+                )
+        return self._save_exchange(session, user_query, result)
 
-Context from book database:
-{context}
+    def _recommend(self, user_query: str, mode: str, session: Optional[Session] = None,
+                   query_vector: Optional[np.ndarray] = None) -> Dict:
+        # Search vector store for relevant books
+        with stage('retrieval'):
+            relevant_books = self._retrieve(user_query, session, query_vector)
+        return self._recommend_from_books(user_query, relevant_books, mode, session)
 
-Guidelines:
-1. Recommend 1-2 books that best match the user's request
-2. Be conversational and enthusiastic about books
-3. After making your recommendation, use the get_summary_by_title tool to provide a detailed summary
-4. Explain why you think the book(s) would be a good fit for the user
-5. Keep your initial response concise but engaging
+    def _retrieve(self, user_query: str, session: Optional[Session] = None,
+                  query_vector: Optional[np.ndarray] = None) -> List[Dict]:
+        """Books for the query, followed by books from the session's earlier turns.
 
-Available books in the database: {', '.join(self.vector_store.get_all_titles())}"""
+        query_vector is the query's embedding when the response cache already computed it.
+        """
+        relevant_books = self.vector_store.search_books(user_query, n_results=3, query_embedding=query_vector)
+        if session is not None and session.titles:
+            found = {book['title'] for book in relevant_books}
+            relevant_books += self.vector_store.get_books([title for title in session.titles if title not in found])
+        return relevant_books
 
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_query}
-        ]
+    def _recommend_from_books(self, user_query: str, relevant_books: List[Dict], mode: str,
+                              session: Optional[Session] = None) -> Dict:
+        if not relevant_books:
+            return self._no_results_response()
 
         try:
+            with stage('prompt'):
+                messages = self._build_messages(user_query, relevant_books, mode, session)
+            usage = self._new_usage()
+
             # Get initial recommendation
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages,
-                tools=tools,
-                tool_choice="auto",
-                temperature=0.7
-            )
+            with stage('completion_first'):
+                response = self.openai.chat_completion(**self._completion_args(messages, with_tools=True))
+            self._record_usage(usage, response.usage)
 
             assistant_message = response.choices[0].message
             full_response = assistant_message.content or ""
 
             # Handle tool calls
             if assistant_message.tool_calls:
-                messages.append({
-                    "role": "assistant",
-                    "content": assistant_message.content,
-                    "tool_calls": assistant_message.tool_calls
-                })
+                with stage('tool_execution'):
+                    self._append_tool_results(messages, assistant_message)
 
-                for tool_call in assistant_message.tool_calls:
-                    if tool_call.function.name == "get_summary_by_title":
-                        function_args = json.loads(tool_call.function.arguments)
-                        title = function_args["title"]
+                # Get final response with tool results
+                with stage('completion_second'):
+                    final_response = self.openai.chat_completion(**self._completion_args(messages))
+                self._record_usage(usage, final_response.usage)
 
-                        # Get detailed summary
-                        detailed_summary = get_summary_by_title(title)
+                full_response = final_response.choices[0].message.content
 
-                        # Add tool response to messages
-                        messages.append({
-                            "tool_call_id": tool_call.id,
-                            "role": "tool",
-                            "name": "get_summary_by_title",
-                            "content": detailed_summary
-                        })
+            return self._recommendation_response(full_response, relevant_books, usage)
 
-                # Get final response with tool results
-                final_response = self.client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=messages,
-                    temperature=0.7
+        except Exception as e:
+            return self._error_response(e)
+
+    async def aget_book_recommendation(self, user_query: str, mode: Optional[str] = None,
+                                       session_id: Optional[str] = None) -> Dict:
+        """Async get_book_recommendation: non-blocking completions and vector search"""
+        with self.pin():
+            return await self._aget_book_recommendation(user_query, mode, session_id)
+
+    async def _aget_book_recommendation(self, user_query: str, mode: Optional[str],
+                                        session_id: Optional[str]) -> Dict:
+        mode = self._check_mode(mode or self.recommendation_mode)
+
+        with stage('content_filter'):
+            inappropriate = self.contains_inappropriate_language(user_query)
+        if inappropriate:
+            return self._inappropriate_response()
+
+        session = await self._run_blocking(self._load_session, session_id) if session_id else None
+
+        similar = await self._run_blocking(self._similar_books_answer, user_query)
+        if similar is not None:
+            return await self._run_blocking(self._save_exchange, session, user_query, similar)
+
+        use_cache = session is None or not session.turns
+
+        catalog_version = self.vector_store.catalog_version
+        query_vector = None
+        if use_cache:
+            with stage('cache_lookup'):
+                cached, query_vector = await self._run_blocking(
+                    self.response_cache.lookup, user_query, mode, catalog_version
+                )
+            if cached is not None:
+                return await self._run_blocking(
+                    self._save_exchange, session, user_query, self._cached_response(cached)
                 )
 
+        start = time.perf_counter()
+        result = await self._arecommend(user_query, mode, session, query_vector)
+        if use_cache and self._cacheable(result):
+            with stage('cache_store'):
+                await self._run_blocking(
+                    self.response_cache.store, user_query, mode, result, time.perf_counter() - start,
+                    catalog_version, query_vector
+                )
+        return await self._run_blocking(self._save_exchange, session, user_query, result)
+
+    async def _arecommend(self, user_query: str, mode: str, session: Optional[Session] = None,
+                          query_vector: Optional[np.ndarray] = None) -> Dict:
+        with stage('retrieval'):
+            relevant_books = await self._run_blocking(self._retrieve, user_query, session, query_vector)
+        return await self._arecommend_from_books(user_query, relevant_books, mode, session)
+
+    async def _arecommend_from_books(self, user_query: str, relevant_books: List[Dict], mode: str,
+                                     session: Optional[Session] = None) -> Dict:
+        if not relevant_books:
+            return self._no_results_response()
+
+        try:
+            with stage('prompt'):
+                messages = self._build_messages(user_query, relevant_books, mode, session)
+            usage = self._new_usage()
+            with stage('completion_first'):
+                response = await self.openai.achat_completion(
+                    **self._completion_args(messages, with_tools=True)
+                )
+            self._record_usage(usage, response.usage)
+
+            assistant_message = response.choices[0].message
+            full_response = assistant_message.content or ""
+
+            if assistant_message.tool_calls:
+                with stage('tool_execution'):
+                    self._append_tool_results(messages, assistant_message)
+                with stage('completion_second'):
+                    final_response = await self.openai.achat_completion(**self._completion_args(messages))
+                self._record_usage(usage, final_response.usage)
                 full_response = final_response.choices[0].message.content
 
-            return {
-                "response": full_response,
-                "inappropriate_content": False,
-                "recommended_books": [book['title'] for book in relevant_books[:2]]
+            return self._recommendation_response(full_response, relevant_books, usage)
+
+        except Exception as e:
+            return self._error_response(e)
+
+    def get_book_recommendations_batch(self, queries: Iterable[str], mode: Optional[str] = None,
+                                       concurrency: Optional[int] = None) -> Iterator[Dict]:
+        """Recommendations for many queries, yielded as they complete.
+
+        Queries are retrieved BATCH_CHUNK_SIZE at a time with one embedding
+        request and one multi-query search per chunk; completions then run on up
+        to `concurrency` threads. Each result carries the query's "index" and a
+        failing item yields an "error" entry without stopping the batch. At most
+        one chunk plus `concurrency` items are in flight, so memory stays flat
+        however many queries there are.
+        """
+        mode = self._check_mode(mode or self.recommendation_mode)
+        concurrency = concurrency or self.batch_concurrency
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='batch-completions') as executor:
+            pending = set()
+            for items in self._batch_chunks(queries):
+                while len(pending) >= concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+
+                for index, query, prepared in self._prepare_batch(items):
+                    pending.add(executor.submit(self._batch_item, index, query, prepared, mode))
+
+            for future in as_completed(pending):
+                yield future.result()
+
+    async def aget_book_recommendations_batch(self, queries: Iterable[str], mode: Optional[str] = None,
+                                              concurrency: Optional[int] = None) -> AsyncIterator[Dict]:
+        """Async get_book_recommendations_batch: completions fan out on the event loop"""
+        mode = self._check_mode(mode or self.recommendation_mode)
+        concurrency = concurrency or self.batch_concurrency
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_item(index: int, query: str, prepared) -> Dict:
+            async with semaphore:
+                return await self._abatch_item(index, query, prepared, mode)
+
+        pending = set()
+        try:
+            for items in self._batch_chunks(queries):
+                while len(pending) >= concurrency:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield task.result()
+
+                for index, query, prepared in await self._run_blocking(self._prepare_batch, items):
+                    pending.add(asyncio.create_task(run_item(index, query, prepared)))
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            # The consumer went away (e.g. client disconnect): stop outstanding work
+            for task in pending:
+                task.cancel()
+
+    def _batch_chunks(self, queries: Iterable[str]) -> Iterator[List[Tuple[int, str]]]:
+        """(index, query) pairs in chunks of batch_chunk_size"""
+        indexed = enumerate(queries)
+        while True:
+            items = list(itertools.islice(indexed, self.batch_chunk_size))
+            if not items:
+                return
+            yield items
+
+    def _prepare_batch(self, items: List[Tuple[int, str]]) -> List[Tuple[int, str, object]]:
+        """Screen a chunk of queries and retrieve books for the rest in one search.
+
+        Each item comes back with either a final result dict (inappropriate
+        query, failed retrieval) or the list of retrieved books.
+        """
+        with self.pin():
+            return self._prepare_batch_items(items)
+
+    def _prepare_batch_items(self, items: List[Tuple[int, str]]) -> List[Tuple[int, str, object]]:
+        prepared = {}
+        searchable = []
+        for index, query in items:
+            if self.contains_inappropriate_language(query):
+                prepared[index] = self._inappropriate_response()
+            else:
+                searchable.append((index, query))
+
+        try:
+            with stage('batch_retrieval'):
+                books = self.vector_store.search_books_many([query for _, query in searchable], n_results=3)
+            prepared.update({index: relevant_books for (index, _), relevant_books in zip(searchable, books)})
+        except Exception as e:
+            prepared.update({index: self._error_response(e) for index, _ in searchable})
+
+        return [(index, query, prepared[index]) for index, query in items]
+
+    def _batch_item(self, index: int, query: str, prepared, mode: str) -> Dict:
+        try:
+            with self.pin():
+                result = prepared if isinstance(prepared, dict) else self._recommend_from_books(query, prepared, mode)
+        except Exception as e:
+            result = self._error_response(e)
+        return {"index": index, "message": query, **result}
+
+    async def _abatch_item(self, index: int, query: str, prepared, mode: str) -> Dict:
+        try:
+            if isinstance(prepared, dict):
+                result = prepared
+            else:
+                with self.pin():
+                    result = await self._arecommend_from_books(query, prepared, mode)
+        except Exception as e:
+            result = self._error_response(e)
+        return {"index": index, "message": query, **result}
+
+    async def astream_book_recommendation(self, user_query: str, mode: Optional[str] = None,
+                                          session_id: Optional[str] = None) -> AsyncIterator[Dict]:
+        """Stream a recommendation as events while both completion phases generate.
+
+        Yields dicts with an "event" name and "data": "books" once retrieval is
+        done, "tool_call" for each summary lookup the model requests, "token" for
+        every text chunk, and finally "done" with the same result dict that
+        get_book_recommendation returns (or "error", after which nothing follows).
+        """
+        try:
+            with self.pin():
+                async for event in self._astream_book_recommendation(user_query, mode, session_id):
+                    yield event
+        except Exception as e:
+            # No snapshot to pin; failures inside the stream already end it with an error event
+            yield {"event": "error", "data": self._error_response(e)}
+
+    async def _astream_book_recommendation(self, user_query: str, mode: Optional[str],
+                                           session_id: Optional[str]) -> AsyncIterator[Dict]:
+        mode = self._check_mode(mode or self.recommendation_mode)
+        if self.contains_inappropriate_language(user_query):
+            for event in self._fixed_response_events(self._inappropriate_response()):
+                yield event
+            return
+
+        # Headers are sent before the first event, so every failure has to end the stream with an error event
+        try:
+            session = await self._run_blocking(self._load_session, session_id) if session_id else None
+
+            similar = await self._run_blocking(self._similar_books_answer, user_query)
+            if similar is not None:
+                similar = await self._run_blocking(self._save_exchange, session, user_query, similar)
+                for event in self._fixed_response_events(similar):
+                    yield event
+                return
+
+            use_cache = session is None or not session.turns
+
+            catalog_version = self.vector_store.catalog_version
+            query_vector = None
+            if use_cache:
+                with stage('cache_lookup'):
+                    cached, query_vector = await self._run_blocking(
+                        self.response_cache.lookup, user_query, mode, catalog_version
+                    )
+                if cached is not None:
+                    cached = await self._run_blocking(
+                        self._save_exchange, session, user_query, self._cached_response(cached)
+                    )
+                    for event in self._fixed_response_events(cached):
+                        yield event
+                    return
+
+            start = time.perf_counter()
+            with stage('retrieval'):
+                relevant_books = await self._run_blocking(self._retrieve, user_query, session, query_vector)
+
+            if not relevant_books:
+                for event in self._fixed_response_events(self._no_results_response()):
+                    yield event
+                return
+
+            yield {
+                "event": "books",
+                "data": {"books": [{"title": book['title'], "distance": book['distance']} for book in relevant_books]}
             }
 
+            messages = self._build_messages(user_query, relevant_books, mode, session)
+            usage = self._new_usage()
+
+            first = {}
+            async for event in self._astream_completion(messages, first, with_tools=True):
+                yield event
+            self._record_usage(usage, first["usage"])
+            full_response = first["content"]
+
+            if first["tool_calls"]:
+                for tool_call in first["tool_calls"]:
+                    yield {
+                        "event": "tool_call",
+                        "data": {"name": tool_call.function.name, "arguments": tool_call.function.arguments}
+                    }
+                with stage('tool_execution'):
+                    self._append_tool_results(messages, ChatCompletionMessage(
+                        role="assistant",
+                        content=first["content"] or None,
+                        tool_calls=first["tool_calls"]
+                    ))
+
+                if full_response:
+                    full_response += "\n\n"
+                    yield {"event": "token", "data": {"content": "\n\n"}}
+
+                final = {}
+                async for event in self._astream_completion(messages, final):
+                    yield event
+                self._record_usage(usage, final["usage"])
+                full_response += final["content"]
+
+            result = self._recommendation_response(full_response, relevant_books, usage)
+            if use_cache:
+                await self._run_blocking(
+                    self.response_cache.store, user_query, mode, result, time.perf_counter() - start,
+                    catalog_version, query_vector
+                )
+            result = await self._run_blocking(self._save_exchange, session, user_query, result)
+            yield {"event": "done", "data": result}
+
         except Exception as e:
+            yield {"event": "error", "data": self._error_response(e)}
+
+    async def _astream_completion(self, messages: List[Dict], collected: Dict,
+                                  with_tools: bool = False) -> AsyncIterator[Dict]:
+        """Yield token events from a streamed completion.
+
+        The full text and the tool calls reassembled from their deltas are left
+        in collected["content"] and collected["tool_calls"], and the usage the
+        stream's last chunk reports (or None) in collected["usage"].
+        """
+        stream = await self.openai.achat_completion(
+            stream=True, **self._completion_args(messages, with_tools=with_tools)
+        )
+
+        content = []
+        tool_calls = {}
+        collected["usage"] = None
+        async for chunk in stream:
+            if getattr(chunk, 'usage', None):
+                collected["usage"] = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+
+            if delta.content:
+                content.append(delta.content)
+                yield {"event": "token", "data": {"content": delta.content}}
+
+            # Tool calls arrive as fragments keyed by index: id and name first, then arguments
+            for tool_call_delta in delta.tool_calls or []:
+                tool_call = tool_calls.setdefault(tool_call_delta.index, {"id": "", "name": "", "arguments": ""})
+                if tool_call_delta.id:
+                    tool_call["id"] = tool_call_delta.id
+                if tool_call_delta.function:
+                    tool_call["name"] += tool_call_delta.function.name or ""
+                    tool_call["arguments"] += tool_call_delta.function.arguments or ""
+
+        collected["content"] = "".join(content)
+        collected["tool_calls"] = [
+            ChatCompletionMessageToolCall(
+                id=tool_calls[index]["id"],
+                type="function",
+                function=Function(name=tool_calls[index]["name"], arguments=tool_calls[index]["arguments"])
+            )
+            for index in sorted(tool_calls)
+        ]
+
+    def _similar_books_answer(self, user_query: str) -> Optional[Dict]:
+        """Answer for "books like <title>" from the neighbour table, or None to take the usual path"""
+        if not self.similar_fast_path or self.vector_store.neighbor_table is None:
+            return None
+        match = SIMILAR_QUERY.search(user_query)
+        if match is None:
+            return None
+
+        with stage('similar_fast_path'):
+            title = match.group('title').strip(' "\'“”‘’')
+            similar = self.vector_store.similar_books(
+                title, self.similar_results, min_similarity=self.similar_title_threshold
+            )
+            if similar is None and re.search(r"\s+by\s+", title, re.IGNORECASE):
+                # "books like Dune by Frank Herbert"
+                title = re.split(r"\s+by\s+", title, flags=re.IGNORECASE)[0]
+                similar = self.vector_store.similar_books(
+                    title, self.similar_results, min_similarity=self.similar_title_threshold
+                )
+            if similar is None or not similar['similar']:
+                return None
+            return self._similar_response(similar['title'], similar['similar'])
+
+    @staticmethod
+    def _similar_response(title: str, books: List[Dict]) -> Dict:
+        METRICS.inc('librarian_recommendations_total', outcome='similar')
+        lines = [f"If you enjoyed **{title}**, you might also like:", ""]
+        for number, book in enumerate(books, 1):
+            summary = (book['summary'] or '').split('\n')[0]
+            sentence_end = summary.find('. ')
+            if sentence_end != -1:
+                summary = summary[:sentence_end + 1]
+            if len(summary) > SIMILAR_SUMMARY_CHARS:
+                summary = summary[:SIMILAR_SUMMARY_CHARS].rsplit(' ', 1)[0] + '...'
+            lines.append(f"{number}. **{book['title']}**" + (f": {summary}" if summary else ""))
+        return {
+            "response": "\n".join(lines),
+            "inappropriate_content": False,
+            "recommended_books": [book['title'] for book in books],
+            "usage": SmartLibrarian._new_usage()
+        }
+
+    @staticmethod
+    def _fixed_response_events(result: Dict) -> List[Dict]:
+        """Stream events for a canned response that needs no completion"""
+        return [
+            {"event": "token", "data": {"content": result["response"]}},
+            {"event": "done", "data": result}
+        ]
+
+    async def asearch_books(self, query: str, n_results: int = 3) -> List[Dict]:
+        """Run a vector search on the bounded search thread pool"""
+        with stage('retrieval'):
+            return await self._run_blocking(self.vector_store.search_books, query, n_results)
+
+    async def _run_blocking(self, function, *args):
+        """Run a blocking call (vector search, embeddings) on the search thread pool"""
+        loop = asyncio.get_running_loop()
+        # Carry the request context over, so stages timed on the pool count for the request
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.search_executor, functools.partial(context.run, function, *args))
+
+    def _build_messages(self, user_query: str, relevant_books: List[Dict], mode: str = TOOL_MODE,
+                        session: Optional[Session] = None) -> List[Dict]:
+        history = session.history_messages() if session is not None else []
+        return [
+            {"role": "system", "content": self.build_system_prompt(relevant_books, mode)},
+            *history,
+            {"role": "user", "content": user_query}
+        ]
+
+    def _load_session(self, session_id: Optional[str]) -> Optional[Session]:
+        """The stored session, a new one for an unknown id, or None without an id"""
+        if not session_id:
+            return None
+        with stage('session_load'):
+            return self.sessions.get(session_id) or Session(session_id)
+
+    def _save_exchange(self, session: Optional[Session], user_query: str, result: Dict) -> Dict:
+        """Add a recommendation to its session and tag the result with the session id"""
+        if session is None:
+            return result
+        if "recommended_books" in result:
+            with stage('session_save'):
+                session.add_exchange(
+                    user_query, result["response"], result["recommended_books"],
+                    self.session_history_tokens, self.session_notes_tokens
+                )
+                self.sessions.put(session)
+        return {**result, "session_id": session.session_id}
+
+    @staticmethod
+    def _completion_args(messages: List[Dict], with_tools: bool = False) -> Dict:
+        args = {"model": CHAT_MODEL, "messages": messages, "temperature": 0.7}
+        if with_tools:
+            args["tools"] = TOOLS
+            args["tool_choice"] = "auto"
+        return args
+
+    @staticmethod
+    def _check_mode(mode: str) -> str:
+        if mode not in RECOMMENDATION_MODES:
+            raise ValueError(f"Unknown recommendation mode '{mode}', expected one of {', '.join(RECOMMENDATION_MODES)}")
+        return mode
+
+    @staticmethod
+    def _cacheable(result: Dict) -> bool:
+        """Only completed recommendations are cached, never errors or canned replies"""
+        return "recommended_books" in result
+
+    @staticmethod
+    def _new_usage() -> Dict:
+        return {"llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+
+    @staticmethod
+    def _record_usage(usage: Dict, reported):
+        """Add a completion's reported token usage (None if it reported none) to the per-request totals"""
+        usage["llm_calls"] += 1
+        if reported:
+            usage["prompt_tokens"] += reported.prompt_tokens
+            usage["completion_tokens"] += reported.completion_tokens
+            usage["total_tokens"] += reported.total_tokens
+
+    def _append_tool_results(self, messages: List[Dict], assistant_message):
+        """Run the requested tool calls locally and add their results to the conversation"""
+        messages.append({
+            "role": "assistant",
+            "content": assistant_message.content,
+            "tool_calls": assistant_message.tool_calls
+        })
+
+        for tool_call in assistant_message.tool_calls:
+            if tool_call.function.name == "get_summary_by_title":
+                function_args = json.loads(tool_call.function.arguments)
+                title = function_args["title"]
+
+                # Get detailed summary, resolving misspelled titles against the catalog
+                detailed_summary = self.vector_store.get_summary_by_title(title)
+
+                # Add tool response to messages
+                messages.append({
+                    "tool_call_id": tool_call.id,
+                    "role": "tool",
+                    "name": "get_summary_by_title",
+                    "content": detailed_summary
+                })
+
+    @staticmethod
+    def _cached_response(result: Dict) -> Dict:
+        METRICS.inc('librarian_recommendations_total', outcome='cached')
+        return result
+
+    @staticmethod
+    def _inappropriate_response() -> Dict:
+        METRICS.inc('librarian_recommendations_total', outcome='inappropriate')
+        return {
+            "response": "I appreciate your interest in book recommendations, but I'd prefer to keep our conversation respectful. Could you please rephrase your request without offensive language? I'm here to help you find amazing books to read!",
+            "inappropriate_content": True
+        }
+
+    @staticmethod
+    def _no_results_response() -> Dict:
+        METRICS.inc('librarian_recommendations_total', outcome='no_results')
+        return {
+            "response": "I couldn't find any books matching your criteria in my current database. Could you try a different theme or provide more details about what you're looking for?",
+            "inappropriate_content": False
+        }
+
+    @staticmethod
+    def _recommendation_response(full_response: str, relevant_books: List[Dict], usage: Dict) -> Dict:
+        METRICS.inc('librarian_recommendations_total', outcome='recommended')
+        return {
+            "response": full_response,
+            "inappropriate_content": False,
+            "recommended_books": [book['title'] for book in relevant_books[:2]],
+            "usage": usage
+        }
+
+    @staticmethod
+    def _error_response(error: Exception) -> Dict:
+        # Counted by exception type on /metrics; the message goes back in the response
+        METRICS.inc('librarian_recommendations_total', outcome='error')
+        METRICS.inc('librarian_errors_total', type=type(error).__name__)
+        if isinstance(error, openai.RateLimitError):
             return {
-                "response": f"I apologize, but I encountered an error while processing your request. Please try again later. Error: {str(e)}",
+                "response": "I'm getting a lot of requests right now. Please try again in a moment.",
                 "inappropriate_content": False
             }
+        return {
+            "response": f"I apologize, but I encountered an error while processing your request. Please try again later. Error: {str(error)}",
+            "inappropriate_content": False
+        }
+
+    def get_prompt_titles(self, relevant_books: List[Dict]) -> List[str]:
+        """Titles the system prompt lists as available, bounded unless the mode is 'all'"""
+        if self.prompt_titles == 'all':
+            return self.vector_store.get_all_titles()
+
+        titles = [book['title'] for book in relevant_books]
+        if self.prompt_titles == 'top_n':
+            titles += [
+                title for title in self.vector_store.title_index.head(self.prompt_title_limit)
+                if title not in titles
+            ]
+        return titles
+
+    def build_system_prompt(self, relevant_books: List[Dict], mode: str = TOOL_MODE) -> str:
+        """System prompt with the retrieved books as context"""
+        if mode == SINGLE_PASS_MODE:
+            context = self._full_summary_context(relevant_books)
+            tool_guideline = (
+                "3. Full summaries of the books above are already included, so use them directly; "
+                "only use the get_summary_by_title tool for a book that is not listed above"
+            )
+        else:
+            context = "Based on your interests, here are some relevant books from my database:\n\n"
+            for book in relevant_books:
+                context += f"**{book['title']}**: {self._excerpt(book)}\n\n"
+            tool_guideline = "3. After making your recommendation, use the get_summary_by_title tool to provide a detailed summary"
+
+        return f"""You are a knowledgeable and friendly librarian AI assistant. Your job is to recommend books based on user interests and provide engaging, conversational responses.
+
+Context from book database:
+{context}
+
+Guidelines:
+1. Recommend 1-2 books that best match the user's request
+2. Be conversational and enthusiastic about books
+{tool_guideline}
+4. Explain why you think the book(s) would be a good fit for the user
+5. Keep your initial response concise but engaging
+
+Available books in the database: {', '.join(self.get_prompt_titles(relevant_books))}"""
+
+    def _excerpt(self, book: Dict) -> str:
+        """Best-matching passages of a candidate, or the start of its summary, within PROMPT_EXCERPT_TOKENS"""
+        if book.get('passages'):
+            return passage_excerpt(book['passages'], self.prompt_excerpt_tokens) + '...'
+        return truncate_to_tokens(book['summary'] or '', self.prompt_excerpt_tokens) + '...'
 
-    def chat(self, message: str) -> str:
+    def _full_summary_context(self, relevant_books: List[Dict]) -> str:
+        """Context with the full summary of each candidate, best match first, within the token budget"""
+        context = "Based on your interests, here are some relevant books from my database with their full summaries:\n\n"
+        remaining = self.single_pass_token_budget
+
+        for book in relevant_books:
+            header = f"**{book['title']}**: "
+            summary_budget = remaining - count_tokens(header) - 2
+            if summary_budget <= 0:
+                break
+
+            summary = lookup_summary(book['title']) or book['summary']
+            if book.get('passages') and count_tokens(summary) > summary_budget:
+                # Too long to quote whole: the passages that matched the query come first
+                entry = f"{header}{passage_excerpt(book['passages'], summary_budget)}\n\n"
+            else:
+                entry = f"{header}{truncate_to_tokens(summary, summary_budget)}\n\n"
+            context += entry
+            remaining -= count_tokens(entry)
+
+        return context
+
+    def chat(self, message: str, mode: Optional[str] = None) -> str:
         """Main chat interface"""
-        result = self.get_book_recommendation(message)
+        result = self.get_book_recommendation(message, mode)
+        return result["response"]
+
+    async def achat(self, message: str, mode: Optional[str] = None) -> str:
+        """Async chat interface"""
+        result = await self.aget_book_recommendation(message, mode)
         return result["response"]
\ No newline at end of file
@@ -0,0 +1,125 @@
+import os
+import re
+import unicodedata
+from typing import Iterable, List
+
+# Used when no word list file is available. A leading or trailing '*' lets
+# other letters come before or after the word, so it also matches as the end
+# ("goddamn", "motherfucking") or start ("shithead") of a compound
+DEFAULT_WORDS = [
+    '*fuck*', '*shit', 'shit*', '*damn', '*bitch*', 'bastard', '*asshole',
+    'motherfucker', 'cocksucker', 'cunt', 'piss'
+]
+
+COMPOUND_MARKER = '*'
+
+# Word characters running up to the end of the searched span
+WORD_START = re.compile(r"\w*$")
+
+# Common character substitutions used to dodge filters ("sh1t", "a$$hole")
+LEET_MAP = str.maketrans({'0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '@': 'a', '$': 's'})
+
+# Inflections matched after a listed word, so "damned" or "pissing" still match
+SUFFIXES = r"(?:s|es|ed|er|ers|in|ing|y)?"
+
+# Inflections that double a final consonant ("shitty", "crapped", "bullshitting")
+DOUBLED_SUFFIXES = r"(?:y|ier|iest|ed|er|ers|in|ing)"
+
+
+def normalize_text(text: str) -> str:
+    """Casefold, strip accents and undo common character substitutions"""
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(char for char in text if not unicodedata.combining(char))
+    return text.casefold().translate(LEET_MAP)
+
+
+def load_word_list(path: str) -> List[str]:
+    """Words from a file with one word per line; blank lines and # comments are ignored"""
+    with open(path, 'r', encoding='utf-8') as file:
+        return [line.strip() for line in file if line.strip() and not line.lstrip().startswith('#')]
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Regex alternation factored by common prefixes, so matching never backtracks across words.
+
+    Where a word ends, its inflections follow: SUFFIXES, or DOUBLED_SUFFIXES
+    after its final consonant repeated. A word with a trailing '*' is followed
+    by any letters instead.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word.rstrip(COMPOUND_MARKER):
+            node = node.setdefault(char, {})
+        # A word listed both with and without the marker keeps the marked form, which matches more
+        if not node.get('', '').endswith(COMPOUND_MARKER):
+            node[''] = word
+
+    def build(node) -> str:
+        branches = [re.escape(char) + build(node[char]) for char in sorted(key for key in node if key)]
+        word = node.get('')
+        if word is not None and word.endswith(COMPOUND_MARKER):
+            branches.append(r"\w*")
+        elif word is not None:
+            if _doubles(word):
+                branches.append(re.escape(word[-1]) + DOUBLED_SUFFIXES)
+            branches.append(SUFFIXES)
+        if len(branches) == 1:
+            return branches[0]
+        return '(?:' + '|'.join(branches) + ')'
+
+    return build(trie)
+
+
+def _doubles(word: str) -> bool:
+    """Whether a word's final consonant is doubled before some suffixes ("shit" -> "shitty")"""
+    return len(word) > 1 and word[-1].isalpha() and word[-1] not in 'aeiouwxy' and word[-1] != word[-2]
+
+
+class ProfanityFilter:
+    """Whole-word matcher for a list of banned words, compiled once.
+
+    The list is compiled into a single prefix-factored regex with word
+    boundaries, so a message is checked in one pass regardless of how many
+    words are listed, and banned words inside longer words ("Scunthorpe") do
+    not match. Words marked with a leading or trailing '*' also match as the
+    end or start of a compound word.
+    """
+
+    def __init__(self, words: Iterable[str]):
+        self.words = sorted({normalize_text(word.strip()) for word in words if word.strip(COMPOUND_MARKER).strip()})
+        alternatives = []
+        whole_words = [word for word in self.words if not word.startswith(COMPOUND_MARKER)]
+        if whole_words:
+            alternatives.append(r"(?<!\w)" + _trie_pattern(whole_words))
+        compound_ends = [word[1:] for word in self.words if word.startswith(COMPOUND_MARKER)]
+        if compound_ends:
+            # Not anchored to the start of a word, so letters may come first
+            alternatives.append(_trie_pattern(compound_ends))
+        if alternatives:
+            self._pattern = re.compile(r"(?:" + '|'.join(alternatives) + r")(?!\w)")
+        else:
+            self._pattern = None
+
+    @classmethod
+    def from_file(cls, path: str) -> 'ProfanityFilter':
+        """Filter for the word list at path, or the default list if the file does not exist"""
+        if not os.path.exists(path):
+            return cls(DEFAULT_WORDS)
+        return cls(load_word_list(path))
+
+    def contains(self, text: str) -> bool:
+        """Whether text contains any banned word"""
+        return self._pattern is not None and self._pattern.search(normalize_text(text)) is not None
+
+    def find(self, text: str) -> List[str]:
+        """Banned words found in text, as they appear after normalization"""
+        if self._pattern is None:
+            return []
+        text = normalize_text(text)
+        # A compound's match starts at its banned ending; report the whole word
+        return [
+            text[WORD_START.search(text, 0, match.start()).start():match.end()]
+            for match in self._pattern.finditer(text)
+        ]
@@ -0,0 +1,222 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .metrics import stage
+
+
+def text_hash(text: str) -> str:
+    """Cache key component for a piece of text"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class FakeEmbeddingFunction:
+    """Deterministic, offline embedder for tests and benchmarks.
+
+    Uses feature hashing over lowercase word tokens, so texts that share words
+    get similar vectors and retrieval behaves plausibly without any API calls.
+    """
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+        self.model_name = f"fake-hashing-{dimensions}"
+        self.calls = 0
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        self.calls += 1
+        return [self._embed(text).tolist() for text in input]
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(token.encode('utf-8')).digest()
+            index = int.from_bytes(digest[:4], 'little') % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[0] = 1.0
+            return vector
+        return vector / norm
+
+
+class OpenAIEmbeddingFunction:
+    """OpenAI embeddings requested through the shared, rate-limited gateway"""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        from .openai_client import get_gateway
+
+        return get_gateway().embed(list(input), self.model_name)
+
+
+class CachedEmbeddingFunction:
+    """Embedding function wrapper with an in-process LRU and an on-disk SQLite cache.
+
+    Entries are keyed by (model_name, sha256(text)), so identical queries and
+    unchanged summaries are only embedded once across requests and restarts.
+    Only texts missing from both tiers are sent to the wrapped embedder, in a
+    single call.
+    """
+
+    def __init__(self, embedding_function, model_name: str, cache_path: Optional[str] = None,
+                 max_memory_items: int = 10000, max_disk_items: Optional[int] = None):
+        self.embedding_function = embedding_function
+        self.model_name = model_name
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db = None
+        if cache_path:
+            directory = os.path.dirname(cache_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(cache_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "last_used REAL NOT NULL, PRIMARY KEY (model, text_hash))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            self._db.commit()
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        keys = [text_hash(text) for text in input]
+        vectors = {}
+
+        with self._lock:
+            for key in keys:
+                if key in vectors:
+                    continue
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    vectors[key] = vector
+                    self.memory_hits += 1
+
+            missing = [key for key in dict.fromkeys(keys) if key not in vectors]
+            if missing and self._db is not None:
+                found = self._load_from_disk(missing)
+                self.disk_hits += len(found)
+                for key, vector in found.items():
+                    vectors[key] = vector
+                    self._remember(key, vector)
+                missing = [key for key in missing if key not in found]
+
+        if missing:
+            texts = {key: text for key, text in zip(keys, input)}
+            with stage('embedding'):
+                embedded = self.embedding_function([texts[key] for key in missing])
+            new_vectors = {
+                key: np.asarray(vector, dtype=np.float32) for key, vector in zip(missing, embedded)
+            }
+            with self._lock:
+                self.misses += len(missing)
+                for key, vector in new_vectors.items():
+                    self._remember(key, vector)
+                if self._db is not None:
+                    self._save_to_disk(new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[key].tolist() for key in keys]
+
+    def stats(self) -> Dict:
+        """Hit/miss counters for both cache tiers"""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'model': self.model_name,
+            'memory_items': len(self._memory),
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+        }
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _load_from_disk(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self._db.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                [self.model_name, *chunk]
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+
+        if found:
+            self._db.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                [(time.time(), self.model_name, key) for key in found]
+            )
+            self._db.commit()
+        return found
+
+    def _save_to_disk(self, vectors: Dict[str, np.ndarray]):
+        now = time.time()
+        self._db.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+            [(self.model_name, key, vector.tobytes(), now) for key, vector in vectors.items()]
+        )
+        if self.max_disk_items:
+            excess = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self.max_disk_items
+            if excess > 0:
+                self._db.execute(
+                    "DELETE FROM embeddings WHERE rowid IN "
+                    "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self.evictions += excess
+        self._db.commit()
+
+
+def create_embedding_function():
+    """Build the embedding function configured by the environment.
+
+    EMBEDDING_PROVIDER selects "openai" (default) or the offline "fake" embedder.
+    Vectors are cached by CachedEmbeddingFunction in memory and, unless
+    EMBEDDING_CACHE_PATH is set to an empty string, in SQLite next to the
+    Chroma data.
+    """
+    provider = os.getenv('EMBEDDING_PROVIDER', 'openai')
+    if provider == 'fake':
+        embedding_function = FakeEmbeddingFunction(int(os.getenv('FAKE_EMBEDDING_DIMENSIONS', 256)))
+        model_name = embedding_function.model_name
+    else:
+        model_name = os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small')
+        embedding_function = OpenAIEmbeddingFunction(model_name)
+
+    default_cache_path = os.path.join(os.getenv('CHROMA_DB_PATH', './chroma_db'), 'embedding_cache.sqlite3')
+    max_disk_items = int(os.getenv('EMBEDDING_CACHE_MAX_ROWS', 0)) or None
+    return CachedEmbeddingFunction(
+        embedding_function,
+        model_name=model_name,
+        cache_path=os.getenv('EMBEDDING_CACHE_PATH', default_cache_path),
+        max_memory_items=int(os.getenv('EMBEDDING_CACHE_SIZE', 10000)),
+        max_disk_items=max_disk_items
+    )
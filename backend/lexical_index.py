@@ -0,0 +1,135 @@
+import heapq
+import json
+import math
+import os
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .title_index import STOPWORDS, normalize_title
+
+# Title words count this many times, so a title match outranks a passing mention
+TITLE_WEIGHT = 3
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, accent- and punctuation-free word tokens without stopwords"""
+    return [token for token in normalize_title(text).split() if token not in STOPWORDS]
+
+
+def book_terms(book: Dict) -> Counter:
+    """Term frequencies of a book: weighted title words, author, genre and summary"""
+    terms = Counter()
+    for token in tokenize(book['title']):
+        terms[token] += TITLE_WEIGHT
+    for field in ('author', 'genre', 'summary'):
+        if book.get(field):
+            terms.update(tokenize(book[field]))
+    return terms
+
+
+class BM25Index:
+    """In-process inverted index over book text, scored with Okapi BM25.
+
+    Each document's term frequencies are kept next to the postings so books
+    can be replaced or removed as ingestion syncs the catalog. Only the term
+    frequencies are saved; postings are rebuilt on load.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._terms: Dict[str, Dict[str, int]] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._terms
+
+    def add(self, doc_id: str, terms: Dict[str, int]):
+        """Index a document's term frequencies, replacing any previous version"""
+        with self._lock:
+            self._remove(doc_id)
+            terms = dict(terms)
+            self._terms[doc_id] = terms
+            for term, frequency in terms.items():
+                self._postings.setdefault(term, {})[doc_id] = frequency
+            length = sum(terms.values())
+            self._lengths[doc_id] = length
+            self._total_length += length
+            self.dirty = True
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            if self._remove(doc_id):
+                self.dirty = True
+
+    def search(self, query: str, n_results: int) -> List[Tuple[str, float]]:
+        """(doc_id, score) of the n_results best BM25 matches for query, best first"""
+        tokens = set(tokenize(query))
+        scores = Counter()
+        with self._lock:
+            count = len(self._lengths)
+            if not count or not tokens:
+                return []
+            average_length = self._total_length / count
+            for token in tokens:
+                postings = self._postings.get(token)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average_length)
+                    scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+
+    def save(self, path: str):
+        """Write the index atomically as JSON"""
+        with self._lock:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump({'k1': self.k1, 'b': self.b, 'terms': self._terms}, file)
+            os.replace(tmp_path, path)
+            self.dirty = False
+
+    @classmethod
+    def load(cls, path: str) -> 'BM25Index':
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        index = cls(k1=data['k1'], b=data['b'])
+        for doc_id, terms in data['terms'].items():
+            index.add(doc_id, terms)
+        index.dirty = False
+        return index
+
+    def _remove(self, doc_id: str) -> bool:
+        terms = self._terms.pop(doc_id, None)
+        if terms is None:
+            return False
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id)
+        return True
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60,
+                           n_results: Optional[int] = None) -> List[str]:
+    """Ids ordered by summed 1 / (k + rank) over several ranked lists"""
+    scores = Counter()
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    fused = sorted(scores, key=lambda doc_id: -scores[doc_id])
+    return fused if n_results is None else fused[:n_results]
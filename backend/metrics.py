@@ -0,0 +1,241 @@
+import bisect
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HELP = {
+    'librarian_stage_seconds': 'Time spent in each stage of recommendation and search',
+    'librarian_recommendations_total': 'Recommendation requests by outcome',
+    'librarian_errors_total': 'Recommendation requests that failed, by exception type',
+    'openai_request_seconds': 'OpenAI API call latency, including retries',
+    'openai_requests_total': 'OpenAI API calls by endpoint and outcome',
+    'openai_retries_total': 'OpenAI API attempts that were retried, by error type',
+    'openai_tokens_total': 'Tokens reported in OpenAI usage, by endpoint and kind',
+    'http_request_duration_seconds': 'HTTP request latency until the response headers',
+    'http_requests_total': 'HTTP requests by route, method and status',
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# Stage timings of the request being served, for the Server-Timing header
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar('request_timings', default=None)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus layout"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Process-wide counters and histograms, rendered in the Prometheus text format.
+
+    Each update is a dict lookup and an increment under one lock, cheap
+    enough to leave on for every request.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+
+    def inc(self, name: str, amount: float = 1.0, **labels: str):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+
+    def observe(self, name: str, value: float, **labels: str):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self, samples: Iterable[Tuple[str, str, str, Dict[str, str], float]] = ()) -> str:
+        """Prometheus text exposition of every metric, plus (name, type, help, labels, value) samples"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = [
+                (key, list(histogram.counts), histogram.sum, histogram.count, histogram.buckets)
+                for key, histogram in sorted(self._histograms.items())
+            ]
+
+        lines = []
+        described = set()
+
+        def describe(name: str, kind: str, help_text: str):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name, 'counter', HELP.get(name, name))
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for (name, labels), counts, total, count, buckets in histograms:
+            describe(name, 'histogram', HELP.get(name, name))
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                bucket_labels = labels + (('le', '+Inf' if bound == float('inf') else repr(bound)),)
+                lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        for name, kind, help_text, labels, value in samples:
+            describe(name, kind, help_text)
+            lines.append(f"{name}{_format_labels(tuple(sorted(labels.items())))} {_format_value(value)}")
+
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+METRICS = MetricsRegistry(enabled=os.getenv('METRICS_ENABLED', 'true').lower() not in ('0', 'false', 'no'))
+
+
+def record_stage(name: str, seconds: float):
+    """Add a stage's duration to its histogram and to the current request's timings"""
+    METRICS.observe('librarian_stage_seconds', seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+class stage:
+    """Context manager timing the enclosed block as stage name (see record_stage)"""
+
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        record_stage(self.name, time.perf_counter() - self.start)
+
+
+def server_timing_header(timings: Dict[str, float], total: Optional[float] = None) -> str:
+    """Server-Timing header value, durations in milliseconds"""
+    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items()]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.2f}")
+    return ', '.join(entries)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency and counts per route.
+
+    Stages timed while a request is served are collected for it and, with
+    server_timing, returned in a Server-Timing header. Streaming responses
+    report the stages done before the first byte.
+    """
+
+    def __init__(self, app, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                METRICS.observe('http_request_duration_seconds', time.perf_counter() - start,
+                                route=_route(scope), method=scope['method'])
+                if self.server_timing:
+                    header = server_timing_header(timings, time.perf_counter() - start)
+                    message = {**message, 'headers': list(message.get('headers', [])) + [
+                        (b'server-timing', header.encode('latin-1'))
+                    ]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            METRICS.inc('http_requests_total', route=_route(scope), method=scope['method'], status=str(status))
+
+
+def _route(scope) -> str:
+    """Route template (e.g. /books/{title}) rather than the raw path, to bound label values"""
+    route = scope.get('route')
+    return getattr(route, 'path', None) or 'unmatched'
+
+
+def cache_samples(response_cache_stats: Dict, embedding_cache_stats: Dict, openai_stats: Dict,
+                  books: int, sessions: int) -> List[Tuple[str, str, str, Dict[str, str], float]]:
+    """Cache and client figures kept by their own objects, for MetricsRegistry.render"""
+    return [
+        ('librarian_books', 'gauge', 'Books in the search index', {}, books),
+        ('librarian_sessions', 'gauge', 'Conversation sessions held', {}, sessions),
+        ('librarian_response_cache_entries', 'gauge', 'Cached chat results', {}, response_cache_stats['entries']),
+        ('librarian_response_cache_hits_total', 'counter', 'Response cache hits', {'kind': 'exact'},
+         response_cache_stats['exact_hits']),
+        ('librarian_response_cache_hits_total', 'counter', 'Response cache hits', {'kind': 'semantic'},
+         response_cache_stats['semantic_hits']),
+        ('librarian_response_cache_misses_total', 'counter', 'Response cache misses', {},
+         response_cache_stats['misses']),
+        ('librarian_response_cache_hit_ratio', 'gauge', 'Response cache hit rate', {},
+         response_cache_stats['hit_rate']),
+        ('librarian_embedding_cache_hits_total', 'counter', 'Embedding cache hits', {'tier': 'memory'},
+         embedding_cache_stats['memory_hits']),
+        ('librarian_embedding_cache_hits_total', 'counter', 'Embedding cache hits', {'tier': 'disk'},
+         embedding_cache_stats['disk_hits']),
+        ('librarian_embedding_cache_misses_total', 'counter', 'Embedding cache misses', {},
+         embedding_cache_stats['misses']),
+        ('librarian_embedding_cache_hit_ratio', 'gauge', 'Embedding cache hit rate', {},
+         embedding_cache_stats['hit_rate']),
+        ('openai_throttled_seconds_total', 'counter', 'Seconds calls waited for the client-side rate limit', {},
+         openai_stats['throttled_seconds']),
+    ]
@@ -0,0 +1,170 @@
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .numpy_backend import normalize_rows
+
+IDS_FILE = 'ids.npy'
+NEIGHBORS_FILE = 'neighbors.npy'
+SCORES_FILE = 'scores.npy'
+META_FILE = 'meta.json'
+
+# Books scored together (rows of one product) and books scored against per step;
+# the score block, about 4 * QUERY_BLOCK * CORPUS_BLOCK bytes, bounds peak memory
+QUERY_BLOCK = 512
+CORPUS_BLOCK = 8192
+
+# Embeddings copied out of backends that do not keep a matrix, per request
+SPOOL_BATCH = 1000
+
+
+class NeighborTable:
+    """Top-k most similar books for every book, precomputed from the catalog embeddings.
+
+    Rows are sorted by book id, so a lookup is a binary search over a
+    memory-mapped id array followed by one row read; neighbour entries are
+    int32 row numbers with float16 cosine similarities.
+    """
+
+    def __init__(self, ids: np.ndarray, neighbors: np.ndarray, scores: np.ndarray, meta: Optional[Dict] = None):
+        self.ids = ids
+        self.neighbors = neighbors
+        self.scores = scores
+        self.meta = meta or {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def k(self) -> int:
+        return self.neighbors.shape[1] if self.neighbors.ndim == 2 else 0
+
+    def lookup(self, book_id: str) -> List[Tuple[str, float]]:
+        """(book_id, similarity) of the book's neighbours, most similar first; [] if unknown"""
+        key = book_id.encode('utf-8')
+        position = int(np.searchsorted(self.ids, key))
+        if position >= len(self.ids) or self.ids[position] != key:
+            return []
+        return [
+            (self.ids[row].decode('utf-8'), float(score))
+            for row, score in zip(self.neighbors[position], self.scores[position])
+        ]
+
+    def save(self, path: str):
+        """Write the table files atomically into the directory path"""
+        os.makedirs(path, exist_ok=True)
+        for name, array in ((IDS_FILE, self.ids), (NEIGHBORS_FILE, self.neighbors), (SCORES_FILE, self.scores)):
+            tmp_path = os.path.join(path, name + '.tmp')
+            with open(tmp_path, 'wb') as file:
+                np.save(file, np.ascontiguousarray(array))
+            os.replace(tmp_path, os.path.join(path, name))
+        tmp_path = os.path.join(path, META_FILE + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.meta, file)
+        os.replace(tmp_path, os.path.join(path, META_FILE))
+
+    @classmethod
+    def load(cls, path: str) -> Optional['NeighborTable']:
+        """Memory-mapped table from path, or None if it was never built"""
+        if not os.path.exists(os.path.join(path, META_FILE)):
+            return None
+        arrays = [np.load(os.path.join(path, name), mmap_mode='r') for name in (IDS_FILE, NEIGHBORS_FILE, SCORES_FILE)]
+        with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as file:
+            meta = json.load(file)
+        return cls(*arrays, meta=meta)
+
+
+def build_neighbor_table(backend, k: int = 10, query_block: int = QUERY_BLOCK,
+                         corpus_block: int = CORPUS_BLOCK) -> NeighborTable:
+    """Exact top-k cosine neighbours of every stored book, computed blockwise.
+
+    Each block of query_block books is scored against corpus_block books at
+    a time with one matrix product, and a running top-k per book is merged
+    after every product, so memory stays bounded by the blocks (plus the
+    n x k result) whatever the catalog size. Backends without an in-memory
+    matrix are first copied to a temporary memory-mapped file.
+    """
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as spool_dir:
+        ids, matrix = _embedding_matrix(backend, spool_dir)
+        n = len(ids)
+        k = max(0, min(k, n - 1))
+        neighbors = np.zeros((n, k), dtype=np.int64)
+        scores = np.zeros((n, k), dtype=np.float32)
+
+        if k:
+            for q_start in range(0, n, query_block):
+                q_stop = min(n, q_start + query_block)
+                neighbors[q_start:q_stop], scores[q_start:q_stop] = _block_top_k(
+                    matrix, q_start, q_stop, k, corpus_block
+                )
+
+    # Sort rows by id for binary-search lookups and renumber the neighbour rows
+    sorted_ids = np.array(ids, dtype='S')
+    order = np.argsort(sorted_ids, kind='stable')
+    new_row = np.empty(n, dtype=np.int64)
+    new_row[order] = np.arange(n)
+
+    return NeighborTable(
+        sorted_ids[order],
+        new_row[neighbors[order]].astype(np.int32),
+        scores[order].astype(np.float16),
+        meta={'books': n, 'k': k, 'built_at': time.time(), 'build_seconds': round(time.perf_counter() - start, 3)}
+    )
+
+
+def _block_top_k(matrix: np.ndarray, q_start: int, q_stop: int, k: int,
+                 corpus_block: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-k rows (excluding each book itself) for matrix[q_start:q_stop], best first"""
+    queries = np.asarray(matrix[q_start:q_stop], dtype=np.float32)
+    best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+    best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+
+    for c_start in range(0, len(matrix), corpus_block):
+        c_stop = min(len(matrix), c_start + corpus_block)
+        block_scores = queries @ np.asarray(matrix[c_start:c_stop], dtype=np.float32).T
+
+        # A book is not its own neighbour
+        own = np.arange(max(q_start, c_start), min(q_stop, c_stop))
+        block_scores[own - q_start, own - c_start] = -np.inf
+
+        top = min(k, c_stop - c_start)
+        block_top = np.argpartition(-block_scores, top - 1, axis=1)[:, :top]
+        candidate_rows = np.concatenate([best_rows, block_top + c_start], axis=1)
+        candidate_scores = np.concatenate([best_scores, np.take_along_axis(block_scores, block_top, axis=1)], axis=1)
+
+        keep = min(k, candidate_rows.shape[1])
+        kept = np.argpartition(-candidate_scores, keep - 1, axis=1)[:, :keep]
+        best_rows = np.take_along_axis(candidate_rows, kept, axis=1)
+        best_scores = np.take_along_axis(candidate_scores, kept, axis=1)
+
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+def _embedding_matrix(backend, spool_dir: str) -> Tuple[List[str], np.ndarray]:
+    """Ids and normalized embeddings of every stored book"""
+    matrix = backend.embedding_matrix()
+    if matrix is not None:
+        return matrix
+
+    # Copy batches into a memory-mapped file so the whole matrix never sits in memory
+    total = backend.count()
+    ids = []
+    spool = None
+    for batch_ids, vectors in backend.iter_embeddings(SPOOL_BATCH):
+        vectors = normalize_rows(vectors)
+        if spool is None:
+            spool = np.lib.format.open_memmap(
+                os.path.join(spool_dir, 'embeddings.npy'), mode='w+', dtype=np.float32,
+                shape=(total, vectors.shape[1])
+            )
+        spool[len(ids):len(ids) + len(batch_ids)] = vectors
+        ids.extend(batch_ids)
+    if spool is None:
+        return [], np.zeros((0, 0), dtype=np.float32)
+    return ids, spool[:len(ids)]
@@ -0,0 +1,385 @@
+import json
+import mmap
+import os
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .quantization import QUANTIZATION_MODES, QUANTIZED_FILES, QUANTIZERS, QuantizedVectors, quantize
+from .vector_backends import VectorBackend
+
+EMBEDDINGS_FILE = 'embeddings.npy'
+RECORDS_FILE = 'records.json'
+IVF_CENTROIDS_FILE = 'ivf_centroids.npy'
+IVF_ORDER_FILE = 'ivf_order.npy'
+IVF_OFFSETS_FILE = 'ivf_offsets.npy'
+
+# Query vectors scored together against the matrix in one product
+QUERY_BLOCK_SIZE = 64
+# Rows assigned to IVF lists per block while building the index
+ASSIGN_BLOCK_SIZE = 65536
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize each row of a float32 matrix"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class NumpyBackend(VectorBackend):
+    """In-process backend scoring queries against a contiguous normalized float32 matrix.
+
+    Titles, summaries and metadata live in lists parallel to the matrix rows.
+    Top-k is a matrix product plus argpartition; with ivf_lists > 0 an IVF index
+    (k-means coarse quantizer) restricts scoring to the nprobe closest lists.
+    The index is saved as .npy files and loaded memory-mapped, so workers start
+    without copying the matrix and share its pages.
+
+    With quantization ("float16", "int8" or "pq") searches score a compressed
+    copy of the matrix instead, then re-rank the best rerank * k candidates
+    exactly against the float32 rows, so only those rows of the matrix are read.
+    """
+
+    def __init__(self, embedding_function, path: str, ivf_lists: int = 0, nprobe: int = 8,
+                 mmap: bool = True, quantization: str = 'none', rerank: int = 4, pq_subvectors: int = 0):
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization '{quantization}', expected one of {', '.join(QUANTIZATION_MODES)}")
+        self.embedding_function = embedding_function
+        self.path = path
+        self.ivf_lists = ivf_lists
+        self.nprobe = nprobe
+        self.quantization = quantization
+        self.rerank = rerank
+        self.pq_subvectors = pq_subvectors
+
+        self._lock = threading.Lock()
+        # Rows past _size are spare capacity for appends
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._size = 0
+        self.ids = []
+        self.documents = []
+        self.metadatas = []
+        self._positions = {}
+        self._ivf = None
+        self._codes: Optional[QuantizedVectors] = None
+        self._dirty = False
+        # Rows matching each recently used where filter, dropped on every write
+        self._filter_rows = {}
+
+        if os.path.exists(os.path.join(path, EMBEDDINGS_FILE)):
+            self._load(mmap)
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """Normalized embedding matrix, one row per stored document"""
+        return self._matrix[:self._size]
+
+    def get_hashes(self, ids: List[str]) -> Dict[str, Optional[str]]:
+        return {
+            book_id: self.metadatas[self._positions[book_id]].get('content_hash')
+            for book_id in ids if book_id in self._positions
+        }
+
+    def all_ids(self) -> List[str]:
+        return list(self.ids)
+
+    def get_documents(self, ids: List[str]) -> Dict[str, Tuple[str, Dict]]:
+        return {
+            book_id: (self.documents[self._positions[book_id]], self.metadatas[self._positions[book_id]])
+            for book_id in ids if book_id in self._positions
+        }
+
+    def iter_metadatas(self, batch_size: int = 1000) -> Iterator[Tuple[str, Dict]]:
+        return zip(list(self.ids), list(self.metadatas))
+
+    def iter_embeddings(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], np.ndarray]]:
+        ids, matrix = self.embedding_matrix()
+        for start in range(0, len(ids), batch_size):
+            yield ids[start:start + batch_size], matrix[start:start + batch_size]
+
+    def embedding_matrix(self) -> Optional[Tuple[List[str], np.ndarray]]:
+        return list(self.ids), self.embeddings
+
+    def count(self) -> int:
+        return self._size
+
+    def upsert(self, ids: List[str], documents: List[str], metadatas: List[Dict]):
+        vectors = normalize_rows(self.embedding_function(documents))
+
+        with self._lock:
+            new_rows = len([book_id for book_id in set(ids) if book_id not in self._positions])
+            self._reserve(new_rows, vectors.shape[1])
+
+            rows = []
+            for book_id, document, metadata in zip(ids, documents, metadatas):
+                position = self._positions.get(book_id)
+                if position is None:
+                    position = self._size
+                    self._size += 1
+                    self._positions[book_id] = position
+                    self.ids.append(book_id)
+                    self.documents.append(document)
+                    self.metadatas.append(metadata)
+                else:
+                    self.documents[position] = document
+                    self.metadatas[position] = metadata
+                rows.append(position)
+
+            self._matrix[rows] = vectors
+            self._ivf = None
+            self._codes = None
+            self._filter_rows = {}
+            self._dirty = True
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            self._reserve(0, self._matrix.shape[1])
+            for book_id in ids:
+                position = self._positions.pop(book_id, None)
+                if position is None:
+                    continue
+
+                # Keep rows contiguous by moving the last row into the freed slot
+                last = self._size - 1
+                if position != last:
+                    self._matrix[position] = self._matrix[last]
+                    self.ids[position] = self.ids[last]
+                    self.documents[position] = self.documents[last]
+                    self.metadatas[position] = self.metadatas[last]
+                    self._positions[self.ids[position]] = position
+                self.ids.pop()
+                self.documents.pop()
+                self.metadatas.pop()
+                self._size -= 1
+
+            self._ivf = None
+            self._codes = None
+            self._filter_rows = {}
+            self._dirty = True
+
+    def query(self, query_texts: List[str], n_results: int, where: Optional[Dict] = None,
+              query_embeddings: Optional[List] = None) -> Dict:
+        results = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        if not query_texts:
+            return results
+
+        queries = normalize_rows(self.embedding_function(query_texts) if query_embeddings is None else query_embeddings)
+        matrix, ids, documents, metadatas, ivf, codes = (
+            self.embeddings, self.ids, self.documents, self.metadatas, self._ivf, self._codes
+        )
+        candidates = self._matching_rows(where, metadatas) if where else None
+        k = min(n_results, len(ids) if candidates is None else len(candidates))
+
+        if k == 0:
+            rows = [np.empty(0, dtype=np.int64)] * len(query_texts)
+            scores = [np.empty(0, dtype=np.float32)] * len(query_texts)
+        elif candidates is not None:
+            # Filters are applied before scoring, so only matching rows are ranked
+            rows, scores = self._top_k(matrix, codes, queries, k, candidates)
+        elif ivf is not None:
+            rows, scores = zip(*(self._ivf_top_k(matrix, codes, ivf, query, k) for query in queries))
+        else:
+            rows, scores = self._top_k(matrix, codes, queries, k)
+
+        for query_rows, query_scores in zip(rows, scores):
+            results['ids'].append([ids[row] for row in query_rows])
+            results['documents'].append([documents[row] for row in query_rows])
+            results['metadatas'].append([metadatas[row] for row in query_rows])
+            # Squared L2 distance between unit vectors, matching Chroma's default space
+            results['distances'].append((2.0 - 2.0 * query_scores).tolist())
+        return results
+
+    def _matching_rows(self, where: Dict, metadatas: List[Dict]) -> np.ndarray:
+        """Positions of documents whose metadata has every field value in where"""
+        key = tuple(sorted(where.items()))
+        rows = self._filter_rows.get(key)
+        if rows is None:
+            rows = np.array([
+                position for position, metadata in enumerate(metadatas)
+                if all(metadata.get(field) == value for field, value in where.items())
+            ], dtype=np.int64)
+            if len(self._filter_rows) >= 64:
+                self._filter_rows.pop(next(iter(self._filter_rows)))
+            self._filter_rows[key] = rows
+        return rows
+
+    def persist(self):
+        """Rebuild the IVF index if configured, save the index and reopen it memory-mapped"""
+        if not self._dirty:
+            return
+
+        with self._lock:
+            if self.ivf_lists and self._size >= self.ivf_lists:
+                self._ivf = self._build_ivf(self.embeddings)
+            self._codes = quantize(self.embeddings, self.quantization, self.pq_subvectors)
+
+            os.makedirs(self.path, exist_ok=True)
+            self._save_array(EMBEDDINGS_FILE, self.embeddings)
+            if self._ivf is not None:
+                for name, array in zip((IVF_CENTROIDS_FILE, IVF_ORDER_FILE, IVF_OFFSETS_FILE), self._ivf):
+                    self._save_array(name, array)
+            else:
+                for name in (IVF_CENTROIDS_FILE, IVF_ORDER_FILE, IVF_OFFSETS_FILE):
+                    if os.path.exists(os.path.join(self.path, name)):
+                        os.remove(os.path.join(self.path, name))
+            kept = ()
+            if self._codes is not None:
+                kept = self._codes.files
+                for name, array in zip(kept, self._codes.arrays()):
+                    self._save_array(name, array)
+            for name in QUANTIZED_FILES:
+                if name not in kept and os.path.exists(os.path.join(self.path, name)):
+                    os.remove(os.path.join(self.path, name))
+
+            tmp_path = os.path.join(self.path, RECORDS_FILE + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump({'ids': self.ids, 'documents': self.documents, 'metadatas': self.metadatas}, file)
+            os.replace(tmp_path, os.path.join(self.path, RECORDS_FILE))
+
+            # Drop the private copies in favour of shared, memory-mapped pages
+            self._matrix = np.load(os.path.join(self.path, EMBEDDINGS_FILE), mmap_mode='r')
+            if self._codes is not None:
+                self._codes = type(self._codes).load(self.path)
+                self._advise_random()
+            self._dirty = False
+
+    def _load(self, mmap: bool):
+        mmap_mode = 'r' if mmap else None
+        self._matrix = np.load(os.path.join(self.path, EMBEDDINGS_FILE), mmap_mode=mmap_mode)
+        self._size = len(self._matrix)
+
+        with open(os.path.join(self.path, RECORDS_FILE), 'r', encoding='utf-8') as file:
+            records = json.load(file)
+        self.ids = records['ids']
+        self.documents = records['documents']
+        self.metadatas = records['metadatas']
+        self._positions = {book_id: position for position, book_id in enumerate(self.ids)}
+
+        if os.path.exists(os.path.join(self.path, IVF_CENTROIDS_FILE)):
+            self._ivf = tuple(
+                np.load(os.path.join(self.path, name), mmap_mode=mmap_mode)
+                for name in (IVF_CENTROIDS_FILE, IVF_ORDER_FILE, IVF_OFFSETS_FILE)
+            )
+
+        if self.quantization != 'none' and self._size:
+            quantizer = QUANTIZERS[self.quantization]
+            if all(os.path.exists(os.path.join(self.path, name)) for name in quantizer.files):
+                self._codes = quantizer.load(self.path, mmap_mode)
+            else:
+                print(f"Warning: no {self.quantization} vectors saved in {self.path}; quantizing in memory. "
+                      f"Run backend.build_index to store them with the index.")
+                self._codes = quantize(self.embeddings, self.quantization, self.pq_subvectors)
+            self._advise_random()
+
+    def _advise_random(self):
+        """Turn off read-ahead on the memory-mapped matrix, of which re-ranking reads only scattered rows"""
+        handle = getattr(self._matrix, '_mmap', None)
+        if handle is not None and hasattr(mmap, 'MADV_RANDOM'):
+            handle.madvise(mmap.MADV_RANDOM)
+
+    def _save_array(self, name: str, array: np.ndarray):
+        tmp_path = os.path.join(self.path, name + '.tmp')
+        with open(tmp_path, 'wb') as file:
+            np.save(file, np.ascontiguousarray(array))
+        os.replace(tmp_path, os.path.join(self.path, name))
+
+    def _reserve(self, extra_rows: int, dimensions: int):
+        """Make the matrix writable with room for extra_rows more rows"""
+        if self._size == 0 and self._matrix.shape[1] != dimensions:
+            self._matrix = np.zeros((0, dimensions), dtype=np.float32)
+
+        needed = self._size + extra_rows
+        if self._matrix.flags.writeable and len(self._matrix) >= needed:
+            return
+
+        capacity = max(needed, 2 * self._size, 1024) if extra_rows else self._size
+        matrix = np.empty((capacity, dimensions), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        self._matrix = matrix
+
+    def _top_k(self, matrix: np.ndarray, codes: Optional[QuantizedVectors], queries: np.ndarray, k: int,
+               candidates: Optional[np.ndarray] = None):
+        """Best k rows for each query, among candidates if given, using the quantized vectors if there are some"""
+        if codes is not None:
+            return self._quantized_top_k(matrix, codes, queries, k, candidates)
+        if candidates is None:
+            return self._exact_top_k(matrix, queries, k)
+        rows, scores = self._exact_top_k(matrix[candidates], queries, k)
+        return [candidates[query_rows] for query_rows in rows], scores
+
+    def _quantized_top_k(self, matrix: np.ndarray, codes: QuantizedVectors, queries: np.ndarray, k: int,
+                         candidates: Optional[np.ndarray] = None):
+        """Approximate scores shortlist rerank * k rows per query, which are re-scored exactly from the float32 matrix"""
+        count = len(codes) if candidates is None else len(candidates)
+        shortlist = min(count, k * self.rerank) if self.rerank > 0 else k
+        rows, scores = [], []
+        for start in range(0, len(queries), QUERY_BLOCK_SIZE):
+            block = queries[start:start + QUERY_BLOCK_SIZE]
+            approximate = codes.scores(block, candidates)
+            top = np.argpartition(-approximate, shortlist - 1, axis=1)[:, :shortlist]
+            for query, query_top, query_scores in zip(block, top, approximate):
+                query_rows = query_top if candidates is None else candidates[query_top]
+                if self.rerank > 0:
+                    # Read the shortlisted float32 rows in file order
+                    query_rows = np.sort(query_rows)
+                    top_scores = matrix[query_rows] @ query
+                else:
+                    top_scores = query_scores[query_top]
+                order = np.argsort(-top_scores)[:k]
+                rows.append(query_rows[order])
+                scores.append(top_scores[order])
+        return rows, scores
+
+    @staticmethod
+    def _exact_top_k(matrix: np.ndarray, queries: np.ndarray, k: int):
+        rows, scores = [], []
+        for start in range(0, len(queries), QUERY_BLOCK_SIZE):
+            block_scores = queries[start:start + QUERY_BLOCK_SIZE] @ matrix.T
+            top = np.argpartition(-block_scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(block_scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            rows.extend(np.take_along_axis(top, order, axis=1))
+            scores.extend(np.take_along_axis(top_scores, order, axis=1))
+        return rows, scores
+
+    def _ivf_top_k(self, matrix: np.ndarray, codes: Optional[QuantizedVectors], ivf, query: np.ndarray, k: int):
+        centroids, order, offsets = ivf
+        nprobe = min(self.nprobe, len(centroids))
+        probed = np.argpartition(-(centroids @ query), nprobe - 1)[:nprobe]
+        candidates = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probed])
+        if len(candidates) < k:
+            rows, scores = self._top_k(matrix, codes, query[None, :], k)
+            return rows[0], scores[0]
+        if codes is not None:
+            rows, scores = self._quantized_top_k(matrix, codes, query[None, :], k, candidates)
+            return rows[0], scores[0]
+
+        candidate_scores = matrix[candidates] @ query
+        top = np.argpartition(-candidate_scores, k - 1)[:k]
+        top = top[np.argsort(-candidate_scores[top])]
+        return candidates[top], candidate_scores[top]
+
+    def _build_ivf(self, matrix: np.ndarray, iterations: int = 10):
+        """Spherical k-means coarse quantizer; returns (centroids, row order, list offsets)"""
+        rng = np.random.default_rng(0)
+        n_lists = min(self.ivf_lists, len(matrix))
+        sample = matrix[np.sort(rng.choice(len(matrix), min(len(matrix), n_lists * 256), replace=False))]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            filled = np.bincount(assignment, minlength=n_lists) > 0
+            centroids[filled] = normalize_rows(sums[filled])
+
+        assignment = np.concatenate([
+            np.argmax(matrix[start:start + ASSIGN_BLOCK_SIZE] @ centroids.T, axis=1)
+            for start in range(0, len(matrix), ASSIGN_BLOCK_SIZE)
+        ])
+        order = np.argsort(assignment, kind='stable').astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))]).astype(np.int64)
+        return centroids, order, offsets
@@ -0,0 +1,278 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import openai
+from openai.types import CompletionUsage
+
+from .metrics import METRICS
+from .tokens import count_tokens
+
+# Errors worth retrying: rate limits, timeouts, dropped connections and 5xx
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError
+)
+
+# Inputs per embeddings request
+EMBEDDING_BATCH_SIZE = 1000
+
+
+class TokenBucket:
+    """Token bucket refilled at rate_per_minute, holding at most burst_seconds worth.
+
+    reserve() takes what a call needs right away, letting the level go
+    negative, and returns how long the caller has to wait before making the
+    call, so waiters are served in order without polling. A call needing more
+    than the capacity takes the capacity; adjust() charges the rest once the
+    actual use is known.
+    """
+
+    def __init__(self, rate_per_minute: float, burst_seconds: float = 1.0):
+        self.rate = rate_per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> Tuple[float, float]:
+        """Take amount (at most the capacity) from the bucket; seconds to wait before using it, and the amount taken"""
+        taken = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+            self._updated = now
+            self._level -= taken
+            return max(0.0, -self._level / self.rate), taken
+
+    def adjust(self, amount: float):
+        """Charge (or refund, if negative) the difference between what was reserved and actual use"""
+        with self._lock:
+            self._level = min(self.capacity, self._level - amount)
+
+
+class OpenAIGateway:
+    """Shared OpenAI clients with pooled connections, timeouts, retries and rate limits.
+
+    Every chat and embeddings call goes through one sync and one async client,
+    each backed by a single bounded httpx connection pool. Calls wait for the
+    requests-per-minute and tokens-per-minute buckets, then are retried on
+    429, 5xx, timeouts and connection errors with exponential backoff and full
+    jitter (or the server's Retry-After).
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 timeout: float = 30.0, connect_timeout: float = 5.0, max_connections: int = 100,
+                 max_retries: int = 4, backoff_base: float = 0.5, backoff_max: float = 20.0,
+                 requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 burst_seconds: float = 1.0, completion_tokens_estimate: int = 300):
+        timeouts = httpx.Timeout(timeout, connect=connect_timeout)
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+
+        # The SDK's own retries are off; _call retries with jitter and the rate limits
+        self.client = openai.OpenAI(
+            api_key=api_key, base_url=base_url, max_retries=0, timeout=timeouts,
+            http_client=httpx.Client(limits=limits, timeout=timeouts)
+        )
+        self.async_client = openai.AsyncOpenAI(
+            api_key=api_key, base_url=base_url, max_retries=0, timeout=timeouts,
+            http_client=httpx.AsyncClient(limits=limits, timeout=timeouts)
+        )
+
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.completion_tokens_estimate = completion_tokens_estimate
+        self.request_bucket = TokenBucket(requests_per_minute, burst_seconds) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute, burst_seconds) if tokens_per_minute else None
+
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.throttled_seconds = 0.0
+
+    def chat_completion(self, **kwargs):
+        """client.chat.completions.create with rate limiting and retries"""
+        estimate = self._estimate_chat_tokens(kwargs)
+        response, reserved = self._call(lambda: self.client.chat.completions.create(**kwargs), estimate, 'chat')
+        self._settle_usage(response, reserved, 'chat')
+        return response
+
+    async def achat_completion(self, **kwargs):
+        """Async chat_completion; with stream=True only opening the stream is retried.
+
+        Streams ask for a final usage chunk (stream_options.include_usage) and
+        settle the token bucket from it once read to the end; a stream that is
+        abandoned early, or whose server sends no usage, keeps the estimate.
+        """
+        estimate = self._estimate_chat_tokens(kwargs)
+        if kwargs.get('stream'):
+            # This SDK version has no stream_options argument, so it goes in the request body
+            kwargs['extra_body'] = {**(kwargs.get('extra_body') or {}), 'stream_options': {'include_usage': True}}
+        response, reserved = await self._acall(
+            lambda: self.async_client.chat.completions.create(**kwargs), estimate, 'chat'
+        )
+        if kwargs.get('stream'):
+            return self._settled_stream(response, reserved)
+        self._settle_usage(response, reserved, 'chat')
+        return response
+
+    async def _settled_stream(self, stream, reserved: float) -> AsyncIterator:
+        """Chunks of a chat stream, settling usage from the chunk that reports it"""
+        async for chunk in stream:
+            usage = getattr(chunk, 'usage', None)
+            if isinstance(usage, dict):
+                # Chunks have no usage field here, so it arrives as an untyped extra
+                chunk.usage = usage = CompletionUsage(**usage)
+            if usage is not None:
+                self._settle_usage(chunk, reserved, 'chat')
+            yield chunk
+
+    def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        """Embeddings for texts, in input order, requested in batches"""
+        vectors = []
+        for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            batch = texts[start:start + EMBEDDING_BATCH_SIZE]
+            tokens = sum(count_tokens(text) for text in batch)
+            response, reserved = self._call(
+                lambda: self.client.embeddings.create(input=batch, model=model), tokens, 'embeddings'
+            )
+            self._settle_usage(response, reserved, 'embeddings')
+            vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        return vectors
+
+    def stats(self) -> Dict:
+        return {
+            'requests': self.requests,
+            'retries': self.retries,
+            'failures': self.failures,
+            'throttled_seconds': round(self.throttled_seconds, 3)
+        }
+
+    def _call(self, request: Callable, tokens: int, endpoint: str) -> Tuple[object, float]:
+        """The response, and the tokens reserved for the attempt that returned it"""
+        start = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                wait, reserved = self._throttle(tokens)
+                time.sleep(wait)
+                try:
+                    response = request()
+                    self._record_call(endpoint, start, 'ok')
+                    return response, reserved
+                except RETRYABLE_ERRORS as e:
+                    delay = self._retry_delay(attempt, e)
+                    attempt += 1
+                time.sleep(delay)
+        except Exception as e:
+            self._record_call(endpoint, start, type(e).__name__)
+            raise
+
+    async def _acall(self, request: Callable[[], Awaitable], tokens: int, endpoint: str) -> Tuple[object, float]:
+        start = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                wait, reserved = self._throttle(tokens)
+                if wait:
+                    await asyncio.sleep(wait)
+                try:
+                    response = await request()
+                    self._record_call(endpoint, start, 'ok')
+                    return response, reserved
+                except RETRYABLE_ERRORS as e:
+                    delay = self._retry_delay(attempt, e)
+                    attempt += 1
+                await asyncio.sleep(delay)
+        except Exception as e:
+            self._record_call(endpoint, start, type(e).__name__)
+            raise
+
+    @staticmethod
+    def _record_call(endpoint: str, start: float, outcome: str):
+        METRICS.observe('openai_request_seconds', time.perf_counter() - start, endpoint=endpoint)
+        METRICS.inc('openai_requests_total', endpoint=endpoint, outcome=outcome)
+
+    def _throttle(self, tokens: int) -> Tuple[float, float]:
+        """Reserve one request and the estimated tokens; seconds to wait first, and the tokens reserved"""
+        wait, reserved = 0.0, 0.0
+        if self.request_bucket is not None:
+            wait, _ = self.request_bucket.reserve(1)
+        if self.token_bucket is not None:
+            token_wait, reserved = self.token_bucket.reserve(tokens)
+            wait = max(wait, token_wait)
+        with self._stats_lock:
+            self.requests += 1
+            self.throttled_seconds += wait
+        return wait, reserved
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        """Backoff before the next attempt, re-raising once the retry budget is spent"""
+        if attempt >= self.max_retries:
+            with self._stats_lock:
+                self.failures += 1
+            raise error
+
+        with self._stats_lock:
+            self.retries += 1
+        METRICS.inc('openai_retries_total', error=type(error).__name__)
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, min(self.backoff_max, float(retry_after)))
+            except ValueError:
+                pass
+        return delay
+
+    def _estimate_chat_tokens(self, kwargs: Dict) -> int:
+        if self.token_bucket is None:
+            return 0
+        prompt = sum(count_tokens(str(message.get('content') or '')) for message in kwargs.get('messages', []))
+        return prompt + kwargs.get('max_tokens', self.completion_tokens_estimate)
+
+    def _settle_usage(self, response, reserved: float, endpoint: str):
+        """Record reported token usage and charge the token bucket the difference from what was reserved"""
+        usage = getattr(response, 'usage', None)
+        if usage is None:
+            return
+        METRICS.inc('openai_tokens_total', usage.prompt_tokens, endpoint=endpoint, kind='prompt')
+        completion_tokens = getattr(usage, 'completion_tokens', None)
+        if completion_tokens:
+            METRICS.inc('openai_tokens_total', completion_tokens, endpoint=endpoint, kind='completion')
+        if self.token_bucket is not None:
+            self.token_bucket.adjust(usage.total_tokens - reserved)
+
+
+_gateway: Optional[OpenAIGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> OpenAIGateway:
+    """The process-wide gateway, configured from the environment on first use"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = OpenAIGateway(
+                    api_key=os.getenv('OPENAI_API_KEY'),
+                    timeout=float(os.getenv('OPENAI_TIMEOUT', 30)),
+                    connect_timeout=float(os.getenv('OPENAI_CONNECT_TIMEOUT', 5)),
+                    max_connections=int(os.getenv('OPENAI_MAX_CONNECTIONS', 100)),
+                    max_retries=int(os.getenv('OPENAI_MAX_RETRIES', 4)),
+                    backoff_base=float(os.getenv('OPENAI_BACKOFF_BASE', 0.5)),
+                    backoff_max=float(os.getenv('OPENAI_BACKOFF_MAX', 20)),
+                    requests_per_minute=float(os.getenv('OPENAI_RPM', 0)),
+                    tokens_per_minute=float(os.getenv('OPENAI_TPM', 0)),
+                    burst_seconds=float(os.getenv('OPENAI_RATE_BURST_SECONDS', 1))
+                )
+    return _gateway
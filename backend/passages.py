@@ -0,0 +1,137 @@
+import hashlib
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .numpy_backend import normalize_rows
+from .tokens import count_tokens, truncate_to_tokens
+
+# Passage documents are stored as "<book id>#<n>", n counting from 0 in reading order
+PASSAGE_SEPARATOR = '#'
+
+AGGREGATIONS = ('max', 'sum')
+
+# Passages are cut after a sentence or a blank line, or between words inside
+# a sentence that is longer than a passage on its own
+SENTENCE_END = re.compile(r'[.!?]["\')\]]*\s+|\n\s*\n\s*')
+WORD = re.compile(r'\S+\s*')
+
+# Joins non-adjacent passages quoted in a prompt
+EXCERPT_SEPARATOR = ' ... '
+
+
+def passage_id(book_id: str, index: int) -> str:
+    return f"{book_id}{PASSAGE_SEPARATOR}{index}"
+
+
+def book_id_of(document_id: str) -> str:
+    """Book id of a passage document id (a whole-summary document id is its own book id)"""
+    return document_id.split(PASSAGE_SEPARATOR, 1)[0]
+
+
+def passage_content_hash(book_hash: str, max_tokens: int) -> str:
+    """Content hash of a book split at max_tokens, so a new passage size re-splits every book"""
+    return hashlib.sha256(f"{book_hash}:{max_tokens}".encode('utf-8')).hexdigest()
+
+
+def _slices(text: str, separator: re.Pattern) -> List[str]:
+    """Consecutive slices of text, each ending after a separator match (the last one at the end of text)"""
+    pieces = []
+    start = 0
+    for match in separator.finditer(text):
+        if match.end() > start:
+            pieces.append(text[start:match.end()])
+            start = match.end()
+    if start < len(text):
+        pieces.append(text[start:])
+    return pieces
+
+
+def split_passages(text: str, max_tokens: int) -> List[str]:
+    """Split text into consecutive passages of at most max_tokens tokens, cut after sentences where possible.
+
+    Passages are exact slices of text, so joining them gives text back. A
+    single word longer than max_tokens becomes a passage of its own.
+    """
+    units: List[Tuple[str, int]] = []
+    for sentence in _slices(text, SENTENCE_END):
+        tokens = count_tokens(sentence)
+        if tokens <= max_tokens:
+            units.append((sentence, tokens))
+        else:
+            units.extend((word, count_tokens(word)) for word in _slices(sentence, WORD))
+
+    passages = []
+    current, current_tokens = '', 0
+    for unit, tokens in units:
+        if current and current_tokens + tokens > max_tokens:
+            passages.append(current)
+            current, current_tokens = '', 0
+        current += unit
+        current_tokens += tokens
+    if current.strip():
+        passages.append(current)
+    return passages
+
+
+def aggregate_passages(ids: List[str], distances: Optional[List[float]],
+                       aggregation: str = 'max') -> List[Tuple[str, float, List[int]]]:
+    """Books ranked from ranked passage hits: (book id, score, positions of its hits in ids, best first).
+
+    A passage's similarity is taken from its squared L2 distance between unit
+    vectors (1 - d / 2), or from its rank without distances. A book scores its
+    best passage ("max") or the total over its retrieved passages ("sum",
+    favouring books that match in several places).
+    """
+    books: Dict[str, Tuple[float, List[int]]] = {}
+    for position, document_id in enumerate(ids):
+        similarity = 1.0 - distances[position] / 2.0 if distances else 1.0 / (position + 1)
+        book_id = book_id_of(document_id)
+        score, positions = books.get(book_id, (None, []))
+        if score is None:
+            score = similarity
+        elif aggregation == 'sum':
+            score += similarity
+        books[book_id] = (score, positions + [position])
+
+    # Ties keep the order of each book's best passage
+    ranked = sorted(books.items(), key=lambda item: (-item[1][0], item[1][1][0]))
+    return [(book_id, score, positions) for book_id, (score, positions) in ranked]
+
+
+def passage_excerpt(passages: List[str], max_tokens: int) -> str:
+    """Passages in the given (best first) order within max_tokens, the last one cut at a word"""
+    parts = []
+    remaining = max_tokens
+    for passage in passages:
+        separator_tokens = count_tokens(EXCERPT_SEPARATOR) if parts else 0
+        if remaining - separator_tokens <= 0:
+            break
+        part = truncate_to_tokens(passage.strip(), remaining - separator_tokens)
+        if not part:
+            break
+        parts.append(part)
+        remaining -= count_tokens(part) + separator_tokens
+    return EXCERPT_SEPARATOR.join(parts)
+
+
+class BookEmbeddings:
+    """Book-level view of a passage index for the neighbour table: the normalized mean of each book's passages"""
+
+    def __init__(self, backend, batch_size: int = 1000):
+        self.backend = backend
+        self.batch_size = batch_size
+
+    def embedding_matrix(self) -> Tuple[List[str], np.ndarray]:
+        rows: Dict[str, int] = {}
+        sums = None
+        for ids, vectors in self.backend.iter_embeddings(self.batch_size):
+            vectors = normalize_rows(vectors)
+            if sums is None:
+                sums = np.zeros((self.backend.count(), vectors.shape[1]), dtype=np.float32)
+            book_rows = [rows.setdefault(book_id_of(document_id), len(rows)) for document_id in ids]
+            np.add.at(sums, book_rows, vectors)
+        if sums is None:
+            return [], np.zeros((0, 0), dtype=np.float32)
+        return list(rows), normalize_rows(sums[:len(rows)])
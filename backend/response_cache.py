@@ -0,0 +1,172 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    """Case-, punctuation- and whitespace-insensitive form of a chat query"""
+    return ' '.join(re.sub(r"[^\w\s]", ' ', query.casefold()).split())
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class ResponseCache:
+    """Cache of recommendation results for repeated and near-duplicate queries.
+
+    Lookups first try the exact normalized query, then the most similar cached
+    query embedding above similarity_threshold (cosine). Entries expire after
+    ttl_seconds, the least recently used entry is evicted past max_entries, and
+    everything is dropped when the catalog version changes.
+
+    The raw query is embedded, as retrieval embeds it, so a miss hands its
+    vector on to retrieval and store instead of costing more embedding calls.
+    """
+
+    def __init__(self, embedding_function, max_entries: int = 1000, ttl_seconds: float = 3600,
+                 similarity_threshold: float = 0.95):
+        self.embedding_function = embedding_function
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # One row per slot holds the normalized query embedding of a cached entry
+        self._vectors: Optional[np.ndarray] = None
+        self._slot_keys = [None] * max_entries
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self.catalog_version = None
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.saved_tokens = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def lookup(self, query: str, mode: str, catalog_version: int) -> Tuple[Optional[Dict], Optional[np.ndarray]]:
+        """Cached result for the query (or None), and the query's embedding if the lookup needed one"""
+        if not self.enabled:
+            return None, None
+
+        key = (mode, normalize_query(query))
+        with self._lock:
+            self._check_catalog(catalog_version)
+            entry = self._live_entry(key)
+            if entry is not None:
+                self.exact_hits += 1
+                return self._hit(key, entry, 'exact'), None
+
+        vector = self.embed(query)
+        with self._lock:
+            if self._vectors is None or len(self._entries) == 0:
+                self.misses += 1
+                return None, vector
+
+            scores = self._vectors @ _unit(vector)
+            for slot in np.argsort(-scores)[:8]:
+                if scores[slot] < self.similarity_threshold:
+                    break
+                similar_key = self._slot_keys[slot]
+                if similar_key is None or similar_key[0] != mode:
+                    continue
+                entry = self._live_entry(similar_key)
+                if entry is not None:
+                    self.semantic_hits += 1
+                    return self._hit(similar_key, entry, 'semantic'), vector
+
+            self.misses += 1
+            return None, vector
+
+    def store(self, query: str, mode: str, result: Dict, seconds: float, catalog_version: int,
+              vector: Optional[np.ndarray] = None):
+        """Remember a freshly computed result and what it cost; vector is the query's embedding if known"""
+        if not self.enabled:
+            return
+
+        key = (mode, normalize_query(query))
+        if vector is None:
+            vector = self.embed(query)
+        with self._lock:
+            self._check_catalog(catalog_version)
+            if key in self._entries:
+                self._remove(key)
+            while len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            slot = self._free_slots.pop()
+            self._vectors[slot] = _unit(vector)
+            self._slot_keys[slot] = key
+            self._entries[key] = {
+                'result': result,
+                'slot': slot,
+                'expires_at': time.monotonic() + self.ttl_seconds,
+                'seconds': seconds,
+                'tokens': result.get('usage', {}).get('total_tokens', 0)
+            }
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def stats(self) -> Dict:
+        """Hit rate and the latency and tokens saved by hits"""
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'exact_hits': self.exact_hits,
+            'semantic_hits': self.semantic_hits,
+            'misses': self.misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'saved_seconds': round(self.saved_seconds, 3),
+            'saved_tokens': self.saved_tokens
+        }
+
+    def embed(self, text: str) -> np.ndarray:
+        """Embedding of text as the embedding function returns it"""
+        return np.asarray(self.embedding_function([text])[0], dtype=np.float32)
+
+    def _check_catalog(self, catalog_version: int):
+        if catalog_version != self.catalog_version:
+            for key in list(self._entries):
+                self._remove(key)
+            self.catalog_version = catalog_version
+
+    def _live_entry(self, key) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry['expires_at'] < time.monotonic():
+            self._remove(key)
+            return None
+        return entry
+
+    def _hit(self, key, entry: Dict, kind: str) -> Dict:
+        self._entries.move_to_end(key)
+        self.saved_seconds += entry['seconds']
+        self.saved_tokens += entry['tokens']
+
+        # Usage describes the completions a request made; a hit makes none
+        result = {name: value for name, value in entry['result'].items() if name != 'usage'}
+        result['cached'] = kind
+        return result
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._vectors[entry['slot']] = 0.0
+        self._slot_keys[entry['slot']] = None
+        self._free_slots.append(entry['slot'])
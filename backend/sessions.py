@@ -0,0 +1,221 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from .tokens import count_tokens, truncate_to_tokens
+
+# Tokens of a user message kept in the note that replaces a compacted turn
+NOTE_QUERY_TOKENS = 40
+
+# Books from earlier turns offered again as context for follow-up questions
+SESSION_BOOKS = 3
+
+
+class Session:
+    """One conversation: recent turns verbatim, older ones compacted into short notes.
+
+    Each turn's token count is computed once when it is added, so keeping
+    the history within budget costs nothing per request beyond the turns
+    that are compacted. A compacted exchange becomes a one-line note (what
+    was asked, what was recommended) and the oldest notes are dropped once
+    they exceed their own budget, so the history sent with each request
+    stays bounded however long the conversation runs.
+    """
+
+    def __init__(self, session_id: str, turns: Optional[List[Dict]] = None, notes: Optional[List[Dict]] = None,
+                 titles: Optional[List[str]] = None, updated_at: Optional[float] = None):
+        self.session_id = session_id
+        self.turns = turns or []
+        self.notes = notes or []
+        # Books recommended most recently, newest first
+        self.titles = titles or []
+        self.updated_at = updated_at or time.time()
+
+    @property
+    def history_tokens(self) -> int:
+        return sum(turn['tokens'] for turn in self.turns) + sum(note['tokens'] for note in self.notes)
+
+    def history_messages(self) -> List[Dict]:
+        """Chat messages carrying the conversation so far, oldest first"""
+        messages = []
+        if self.notes:
+            messages.append({
+                "role": "system",
+                "content": "Earlier in this conversation:\n" + "\n".join(note['text'] for note in self.notes)
+            })
+        messages.extend({"role": turn['role'], "content": turn['content']} for turn in self.turns)
+        return messages
+
+    def add_exchange(self, user_query: str, response: str, titles: List[str],
+                     history_budget: int, notes_budget: int):
+        """Record a question, its answer and the recommended titles, then compact the history"""
+        self.turns.append({"role": "user", "content": user_query, "tokens": count_tokens(user_query)})
+        self.turns.append({
+            "role": "assistant", "content": response, "tokens": count_tokens(response), "titles": titles
+        })
+        self.titles = (titles + [title for title in self.titles if title not in titles])[:SESSION_BOOKS]
+        self.compact(history_budget, notes_budget)
+        self.updated_at = time.time()
+
+    def compact(self, history_budget: int, notes_budget: int):
+        """Turn the oldest exchanges into notes while the turns exceed history_budget"""
+        turn_tokens = sum(turn['tokens'] for turn in self.turns)
+        # The latest exchange always stays verbatim
+        while turn_tokens > history_budget and len(self.turns) > 2:
+            user, assistant = self.turns[0], self.turns[1]
+            del self.turns[:2]
+            turn_tokens -= user['tokens'] + assistant['tokens']
+
+            text = f"- The user asked: {truncate_to_tokens(user['content'], NOTE_QUERY_TOKENS)}"
+            if assistant.get('titles'):
+                text += f" You recommended: {', '.join(assistant['titles'])}."
+            self.notes.append({"text": text, "tokens": count_tokens(text)})
+
+        note_tokens = sum(note['tokens'] for note in self.notes)
+        while note_tokens > notes_budget and self.notes:
+            note_tokens -= self.notes.pop(0)['tokens']
+
+    def to_dict(self) -> Dict:
+        return {
+            'session_id': self.session_id, 'turns': self.turns, 'notes': self.notes,
+            'titles': self.titles, 'updated_at': self.updated_at
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Session':
+        return cls(data['session_id'], data['turns'], data['notes'], data['titles'], data['updated_at'])
+
+
+class SessionStore:
+    """Storage interface for conversation sessions"""
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """The live session with this id, or None if unknown or expired"""
+        raise NotImplementedError
+
+    def put(self, session: Session):
+        """Save a session, evicting expired and least recently used ones past the limit"""
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> bool:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class MemorySessionStore(SessionStore):
+    """In-process LRU of sessions with a TTL; sessions are lost on restart"""
+
+    def __init__(self, max_sessions: int = 10000, ttl_seconds: float = 3600):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if time.time() - session.updated_at > self.ttl_seconds:
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def put(self, session: Session):
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self._sessions.move_to_end(session.session_id)
+
+            # Oldest first: drop expired sessions, then any beyond the limit
+            cutoff = time.time() - self.ttl_seconds
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if oldest.updated_at >= cutoff and len(self._sessions) <= self.max_sessions:
+                    break
+                self._sessions.popitem(last=False)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class SqliteSessionStore(SessionStore):
+    """Sessions in SQLite, shared by the worker processes of one host and kept across restarts"""
+
+    def __init__(self, path: str, max_sessions: int = 10000, ttl_seconds: float = 3600):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        self._db.commit()
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM sessions WHERE session_id = ? AND updated_at >= ?",
+                (session_id, time.time() - self.ttl_seconds)
+            ).fetchone()
+        return Session.from_dict(json.loads(row[0])) if row else None
+
+    def put(self, session: Session):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?)",
+                (session.session_id, json.dumps(session.to_dict()), session.updated_at)
+            )
+            self._db.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl_seconds,))
+            excess = self._count() - self.max_sessions
+            if excess > 0:
+                self._db.execute(
+                    "DELETE FROM sessions WHERE session_id IN "
+                    "(SELECT session_id FROM sessions ORDER BY updated_at LIMIT ?)",
+                    (excess,)
+                )
+            self._db.commit()
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            deleted = self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)).rowcount
+            self._db.commit()
+        return deleted > 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count()
+
+    def _count(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+def create_session_store() -> SessionStore:
+    """Build the session store selected by SESSION_BACKEND ("memory" or "sqlite")"""
+    backend = os.getenv('SESSION_BACKEND', 'memory')
+    max_sessions = int(os.getenv('SESSION_MAX', 10000))
+    ttl_seconds = float(os.getenv('SESSION_TTL', 3600))
+
+    if backend == 'sqlite':
+        default_path = os.path.join(os.getenv('CHROMA_DB_PATH', './chroma_db'), 'sessions.sqlite3')
+        return SqliteSessionStore(os.getenv('SESSION_DB_PATH', default_path), max_sessions, ttl_seconds)
+    if backend != 'memory':
+        raise ValueError(f"Unknown SESSION_BACKEND '{backend}', expected 'memory' or 'sqlite'")
+    return MemorySessionStore(max_sessions, ttl_seconds)
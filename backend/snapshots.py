@@ -0,0 +1,339 @@
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional
+
+from .embeddings import create_embedding_function
+from .vector_store import VectorStore
+
+# File in the snapshot root naming the published snapshot
+CURRENT_FILE = 'CURRENT'
+MANIFEST_FILE = 'manifest.json'
+STAGING_PREFIX = '.staging-'
+
+# Index files a new snapshot starts from, hard-linked from the published one.
+# They are only ever replaced (write to a temporary file, then rename), never
+# modified in place, so the published snapshot is unaffected by the build.
+BASE_FILES = ('numpy_index', 'lexical_index.json')
+
+# Snapshot the current request is served from (see SnapshotManager.pin)
+_pinned: ContextVar[Optional['IndexSnapshot']] = ContextVar('pinned_snapshot', default=None)
+
+
+def snapshot_name(version: int) -> str:
+    return f"v{version:06d}"
+
+
+class IndexSnapshot:
+    """One published, read-only index directory and the store serving it.
+
+    Requests hold a reference (acquire/release) while they use it. Once a
+    newer snapshot replaces it, it is retired, and it is closed when the last
+    request using it finishes; its memory maps go with its last references.
+    """
+
+    def __init__(self, name: str, path: str, vector_store: VectorStore, manifest: Dict):
+        self.name = name
+        self.path = path
+        self.vector_store = vector_store
+        self.manifest = manifest
+        self.refs = 0
+        self.retired = False
+        self.closed = False
+        self._on_close: Optional[Callable[['IndexSnapshot'], None]] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path: str, embedding_function) -> 'IndexSnapshot':
+        with open(os.path.join(path, MANIFEST_FILE), 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+        vector_store = VectorStore(path=path, embedding_function=embedding_function)
+        # Response caches key on the catalog version, so they reset on every switch
+        vector_store.catalog_version = manifest['version']
+        return cls(manifest['name'], path, vector_store, manifest)
+
+    @property
+    def version(self) -> int:
+        return self.manifest['version']
+
+    def warm_up(self):
+        """Build the title index and book list and open the neighbour table before serving"""
+        self.vector_store.titles_digest()
+        self.vector_store.neighbor_table
+
+    def acquire(self):
+        with self._lock:
+            self.refs += 1
+
+    def release(self):
+        with self._lock:
+            self.refs -= 1
+            close = self.retired and self.refs == 0
+        if close:
+            self._close()
+
+    def retire(self, on_close: Optional[Callable[['IndexSnapshot'], None]] = None):
+        """Close once no request holds the snapshot any more"""
+        with self._lock:
+            self.retired = True
+            self._on_close = on_close
+            close = self.refs == 0
+        if close:
+            self._close()
+
+    def _close(self):
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+        if self._on_close is not None:
+            self._on_close(self)
+
+
+class SnapshotManager:
+    """Builds, publishes and switches between immutable index snapshots under root.
+
+    A build ingests the catalog into a staging directory, starting from hard
+    links to the published snapshot's files so only new or changed books are
+    embedded, then renames it to the next version and points CURRENT at it.
+    Serving processes open the snapshot CURRENT names memory-mapped (workers
+    share its embedding matrix and neighbour table pages) and switch when it
+    changes. The store being replaced stays in place for requests already
+    running, so searches never see a partly built catalog.
+    """
+
+    def __init__(self, root: str, embedding_function=None, keep: int = 3):
+        self.root = root
+        self.keep = keep
+        self.embedding_function = embedding_function or create_embedding_function()
+        self.current: Optional[IndexSnapshot] = None
+        self._retired: List[IndexSnapshot] = []
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        os.makedirs(root, exist_ok=True)
+
+    def published(self) -> Optional[str]:
+        """Name of the snapshot CURRENT points at, or None before the first build"""
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE), 'r', encoding='utf-8') as file:
+                return file.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def snapshots(self) -> List[str]:
+        """Names of complete snapshots on disk, oldest first"""
+        return sorted(
+            name for name in os.listdir(self.root)
+            if name.startswith('v') and os.path.exists(os.path.join(self.root, name, MANIFEST_FILE))
+        )
+
+    def store(self) -> VectorStore:
+        """Store of the snapshot pinned by the current request, or of the current snapshot"""
+        snapshot = _pinned.get() or self.current
+        if snapshot is None:
+            raise RuntimeError(f"No index snapshot has been opened from {self.root}")
+        return snapshot.vector_store
+
+    @contextmanager
+    def pin(self) -> Iterator[IndexSnapshot]:
+        """Serve everything inside the block from the current snapshot, even if a newer one is switched in"""
+        pinned = _pinned.get()
+        if pinned is not None:
+            yield pinned
+            return
+
+        with self._lock:
+            snapshot = self.current
+            if snapshot is None:
+                raise RuntimeError(f"No index snapshot has been opened from {self.root}")
+            snapshot.acquire()
+        token = _pinned.set(snapshot)
+        try:
+            yield snapshot
+        finally:
+            try:
+                _pinned.reset(token)
+            except ValueError:
+                # A streaming generator finalized outside the context that pinned it
+                pass
+            snapshot.release()
+
+    def load_current(self) -> bool:
+        """Switch to the published snapshot if it is not the one being served; False if none is published"""
+        name = self.published()
+        if name is None:
+            return False
+        if self.current is None or self.current.name != name:
+            self.switch(name)
+        return True
+
+    def switch(self, name: str) -> IndexSnapshot:
+        """Open and warm up a snapshot, then serve new requests from it"""
+        start = time.perf_counter()
+        snapshot = IndexSnapshot.open(os.path.join(self.root, name), self.embedding_function)
+        snapshot.warm_up()
+
+        with self._lock:
+            previous, self.current = self.current, snapshot
+            if previous is not None:
+                self._retired.append(previous)
+        if previous is not None:
+            previous.retire(self._forget)
+
+        print(f"Serving index snapshot {name} ({snapshot.manifest.get('books', 0)} books), "
+              f"opened in {time.perf_counter() - start:.2f}s")
+        return snapshot
+
+    def _forget(self, snapshot: IndexSnapshot):
+        with self._lock:
+            if snapshot in self._retired:
+                self._retired.remove(snapshot)
+
+    def build(self, catalog_path: str, incremental: bool = True, neighbors: int = 10,
+              batch_size: Optional[int] = None) -> Dict:
+        """Ingest the catalog into a new snapshot and publish it; returns its manifest.
+
+        With incremental=False the snapshot is built from an empty index, so
+        every book is embedded again (the embedding cache still applies).
+        The snapshot being served is not touched either way.
+        """
+        with self._build_lock:
+            start = time.perf_counter()
+            staging = os.path.join(self.root, f"{STAGING_PREFIX}{os.getpid()}-{int(time.time() * 1000)}")
+            base = self.published() if incremental else None
+            os.makedirs(staging)
+            try:
+                if base is not None:
+                    _link_files(os.path.join(self.root, base), staging, BASE_FILES)
+
+                vector_store = VectorStore(path=staging, embedding_function=self.embedding_function)
+                report = vector_store.load_books_from_file(catalog_path, incremental=True, batch_size=batch_size)
+                if neighbors:
+                    report['neighbors'] = vector_store.build_neighbors(neighbors)
+                del vector_store
+
+                manifest = self._publish(staging, {
+                    'base': base,
+                    'catalog': os.path.abspath(catalog_path),
+                    'books': report['books'],
+                    'created_at': time.time(),
+                    'build_seconds': round(time.perf_counter() - start, 3),
+                    'report': report
+                })
+            except BaseException:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+
+            self.prune()
+            return manifest
+
+    def _publish(self, staging: str, manifest: Dict) -> Dict:
+        """Move a finished staging directory to the next free version and point CURRENT at it"""
+        existing = self.snapshots()
+        version = int(existing[-1][1:]) + 1 if existing else 1
+        while True:
+            name = snapshot_name(version)
+            manifest = {**manifest, 'name': name, 'version': version}
+            _write_atomic(os.path.join(staging, MANIFEST_FILE), json.dumps(manifest, indent=2))
+            target = os.path.join(self.root, name)
+            try:
+                os.rename(staging, target)
+                break
+            except OSError:
+                # Another build took this version first
+                if not os.path.exists(target):
+                    raise
+                version += 1
+
+        _write_atomic(os.path.join(self.root, CURRENT_FILE), name + '\n')
+        print(f"Published index snapshot {name} ({manifest['books']} books)")
+        return manifest
+
+    def prune(self):
+        """Delete snapshots older than the newest `keep`, except the published one and any still open here.
+
+        Workers that have not switched yet keep reading a deleted snapshot's
+        memory-mapped files until they do (POSIX semantics).
+        """
+        with self._lock:
+            in_use = {snapshot.name for snapshot in self._retired}
+            if self.current is not None:
+                in_use.add(self.current.name)
+        names = self.snapshots()
+        keep = set(names[-self.keep:]) | in_use | {self.published()}
+        for name in names:
+            if name not in keep:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def start_watching(self, interval: float):
+        """Check CURRENT every interval seconds and switch to newly published snapshots"""
+        if interval <= 0 or self._watcher is not None:
+            return
+
+        def watch():
+            while not self._stop.wait(interval):
+                try:
+                    self.load_current()
+                except Exception as e:
+                    print(f"Warning: could not switch index snapshot: {type(e).__name__}: {e}")
+
+        self._watcher = threading.Thread(target=watch, name='snapshot-watcher', daemon=True)
+        self._watcher.start()
+
+    def close(self):
+        self._stop.set()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            current = self.current
+            retired = [{'name': snapshot.name, 'requests': snapshot.refs} for snapshot in self._retired]
+        return {
+            'root': self.root,
+            'current': current.manifest if current is not None else None,
+            'in_flight': current.refs if current is not None else 0,
+            'published': self.published(),
+            'available': self.snapshots(),
+            'retired': retired
+        }
+
+
+def _link_files(source: str, target: str, names) -> None:
+    """Hard-link files (and the files of directories) from source into target, copying if links fail"""
+    for name in names:
+        source_path = os.path.join(source, name)
+        target_path = os.path.join(target, name)
+        if os.path.isdir(source_path):
+            os.makedirs(target_path, exist_ok=True)
+            _link_files(source_path, target_path, os.listdir(source_path))
+        elif os.path.exists(source_path):
+            try:
+                os.link(source_path, target_path)
+            except OSError:
+                shutil.copy2(source_path, target_path)
+
+
+def _write_atomic(path: str, content: str):
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        file.write(content)
+    os.replace(tmp_path, path)
+
+
+def create_snapshot_manager(embedding_function=None) -> Optional[SnapshotManager]:
+    """SnapshotManager for SNAPSHOT_ROOT if INDEX_SNAPSHOTS is on, else None"""
+    if os.getenv('INDEX_SNAPSHOTS', 'false').lower() not in ('1', 'true', 'yes'):
+        return None
+    if os.getenv('VECTOR_BACKEND', 'chroma') != 'numpy':
+        raise ValueError("INDEX_SNAPSHOTS needs VECTOR_BACKEND=numpy, whose index files can be memory-mapped")
+    default_root = os.path.join(os.getenv('CHROMA_DB_PATH', './chroma_db'), 'snapshots')
+    return SnapshotManager(
+        os.getenv('SNAPSHOT_ROOT', default_root),
+        embedding_function,
+        keep=int(os.getenv('SNAPSHOT_KEEP', 3))
+    )
@@ -0,0 +1,245 @@
+import hashlib
+import heapq
+import itertools
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+# Fuzzy lookup counts candidates over the rarest postings first, stopping
+# once this many have been counted, then scores the best candidates exactly
+POSTINGS_BUDGET = 5000
+FUZZY_CANDIDATES = 32
+# Misspelled words are replaced by up to this many similar catalog words
+SIMILAR_WORDS = 3
+SIMILAR_WORD_THRESHOLD = 0.4
+# Partial titles ("Narnia") are scored against runs of up to this many more
+# title words than the query has, scaled so they never rank as exact matches
+PARTIAL_EXTRA_WORDS = 3
+PARTIAL_MATCH_WEIGHT = 0.9
+
+# Words too common in chat queries, titles and summaries to help ranking
+STOPWORDS = frozenset(
+    "a an and are as at be book books by for from i in is it me of on or "
+    "that the this to what with".split()
+)
+
+
+def normalize_title(title: str) -> str:
+    """Case-, accent- and punctuation-insensitive key for a title"""
+    title = unicodedata.normalize('NFKD', title)
+    title = ''.join(char for char in title if not unicodedata.combining(char))
+    title = re.sub(r"[^\w\s]", ' ', title.casefold())
+    return ' '.join(title.split())
+
+
+def trigrams(text: str) -> FrozenSet[str]:
+    """Character trigrams of a normalized title or word, padded so short ones have some"""
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def dice(first: FrozenSet[str], second: FrozenSet[str]) -> float:
+    return 2 * len(first & second) / (len(first) + len(second))
+
+
+class TitleIndex:
+    """In-memory index of catalog titles by document id and normalized title.
+
+    It is filled while books are ingested, so listing titles never has to scan
+    the vector store. Misspelled or partial titles are resolved through an
+    index of title words, with a trigram index over the word vocabulary for
+    misspelled words, so a lookup never compares against every title.
+    """
+
+    def __init__(self):
+        self._titles: Dict[str, str] = {}
+        # Titles differing only in case or punctuation share a key; the last one added is looked up
+        self._ids_by_key: Dict[str, List[str]] = {}
+        self._sorted: Optional[List[str]] = None
+        self._digest: Optional[str] = None
+        self._keys_by_word: Dict[str, Set[str]] = {}
+        self._words_by_gram: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._titles)
+
+    def __contains__(self, book_id: str) -> bool:
+        return book_id in self._titles
+
+    def add(self, book_id: str, title: str):
+        with self._lock:
+            previous = self._titles.get(book_id)
+            if previous == title:
+                return
+            if previous is not None:
+                self._remove_key(normalize_title(previous), book_id)
+            self._titles[book_id] = title
+            key = normalize_title(title)
+            ids = self._ids_by_key.get(key)
+            if ids is None:
+                ids = self._ids_by_key[key] = []
+                self._index_key(key)
+            ids.append(book_id)
+            self._sorted = None
+            self._digest = None
+
+    def remove(self, book_id: str):
+        with self._lock:
+            title = self._titles.pop(book_id, None)
+            if title is None:
+                return
+            self._remove_key(normalize_title(title), book_id)
+            self._sorted = None
+            self._digest = None
+
+    def titles(self) -> List[str]:
+        """All titles in catalog order"""
+        return list(self._titles.values())
+
+    def head(self, n: int) -> List[str]:
+        """The first n titles in catalog order"""
+        return list(itertools.islice(self._titles.values(), n))
+
+    def sorted_titles(self) -> List[str]:
+        """All titles sorted alphabetically, cached until the next change"""
+        sorted_titles = self._sorted
+        if sorted_titles is None:
+            sorted_titles = sorted(self._titles.values(), key=str.casefold)
+            self._sorted = sorted_titles
+        return sorted_titles
+
+    def digest(self) -> str:
+        """Hash of the sorted titles, cached until the next change; equal for equal catalogs in any process"""
+        digest = self._digest
+        if digest is None:
+            hasher = hashlib.sha1()
+            for title in self.sorted_titles():
+                hasher.update(title.encode('utf-8'))
+                hasher.update(b'\n')
+            digest = hasher.hexdigest()
+            self._digest = digest
+        return digest
+
+    def title_for(self, book_id: str) -> Optional[str]:
+        return self._titles.get(book_id)
+
+    def lookup(self, title: str) -> Optional[str]:
+        """Document id of the book whose normalized title matches exactly"""
+        ids = self._ids_by_key.get(normalize_title(title))
+        return ids[-1] if ids else None
+
+    def fuzzy_lookup(self, title: str, min_similarity: float = 0.5) -> Optional[Tuple[str, float]]:
+        """(document id, similarity) of the closest title, if any is similar enough.
+
+        An exact normalized match has similarity 1.0. Otherwise titles sharing
+        the query's rarest words (or words similar to its misspelled ones) are
+        scored by trigram Dice similarity, so the cost depends on those
+        postings rather than on catalog size. A title also scores its best run
+        of words against the query, so part of a title ("Harry Potter",
+        "Narnia") resolves too; ties go to the title closest as a whole.
+        """
+        key = normalize_title(title)
+        ids = self._ids_by_key.get(key)
+        if ids:
+            return ids[-1], 1.0
+
+        with self._lock:
+            postings = []
+            for word in set(key.split()):
+                keys = self._keys_by_word.get(word)
+                if keys is not None:
+                    postings.append(keys)
+                else:
+                    postings.extend(self._keys_by_word[similar] for similar in self._similar_words(word))
+
+            query_words = key.split()
+            query_grams = trigrams(key)
+            partial = any(word not in STOPWORDS for word in query_words)
+            best_key, best_score = None, (0.0, 0.0)
+            for candidate in self._top_candidates(postings, FUZZY_CANDIDATES):
+                whole = dice(query_grams, trigrams(candidate))
+                similarity = whole
+                if partial:
+                    floor = max(similarity, best_score[0]) / PARTIAL_MATCH_WEIGHT
+                    run = self._best_run(query_grams, len(query_words), candidate.split(), floor)
+                    similarity = max(similarity, PARTIAL_MATCH_WEIGHT * run)
+                if (similarity, whole) > best_score:
+                    best_key, best_score = candidate, (similarity, whole)
+
+            if best_key is None or best_score[0] < min_similarity:
+                return None
+            return self._ids_by_key[best_key][-1], best_score[0]
+
+    @staticmethod
+    def _best_run(query_grams: FrozenSet[str], query_length: int, words: List[str], floor: float = 0.0) -> float:
+        """Best Dice similarity above floor between the query and a run of title words shorter than the title.
+
+        A run has at most one trigram per character (plus one), which bounds
+        its similarity, so runs too short to beat floor are skipped.
+        """
+        best = floor
+        grams = len(query_grams)
+        for length in range(max(1, query_length - 1), min(len(words) - 1, query_length + PARTIAL_EXTRA_WORDS) + 1):
+            for start in range(len(words) - length + 1):
+                run = ' '.join(words[start:start + length])
+                run_grams = len(run) + 1
+                if run_grams < grams and 2 * run_grams / (grams + run_grams) <= best:
+                    continue
+                if all(word in STOPWORDS for word in words[start:start + length]):
+                    continue
+                best = max(best, dice(query_grams, trigrams(run)))
+        return best if best > floor else 0.0
+
+    def _similar_words(self, word: str) -> List[str]:
+        """Catalog words closest to a word that is not in the catalog"""
+        grams = trigrams(word)
+        postings = [self._words_by_gram[gram] for gram in grams if gram in self._words_by_gram]
+        scored = [(dice(grams, trigrams(candidate)), candidate)
+                  for candidate in self._top_candidates(postings, FUZZY_CANDIDATES)]
+        return [candidate for similarity, candidate in heapq.nlargest(SIMILAR_WORDS, scored)
+                if similarity >= SIMILAR_WORD_THRESHOLD]
+
+    @staticmethod
+    def _top_candidates(postings: List[Set[str]], n: int) -> List[str]:
+        """The n items in the most postings, counting the smallest postings first within the budget"""
+        counts = Counter()
+        budget = POSTINGS_BUDGET
+        for items in sorted(postings, key=len):
+            if counts and len(items) > budget:
+                break
+            counts.update(items)
+            budget -= len(items)
+        return [item for item, _ in heapq.nlargest(n, counts.items(), key=lambda item: item[1])]
+
+    def _index_key(self, key: str):
+        for word in set(key.split()):
+            keys = self._keys_by_word.get(word)
+            if keys is None:
+                keys = self._keys_by_word[word] = set()
+                for gram in trigrams(word):
+                    self._words_by_gram.setdefault(gram, set()).add(word)
+            keys.add(key)
+
+    def _remove_key(self, key: str, book_id: str):
+        """Drop book_id from key, and the key itself once no other title has it"""
+        ids = self._ids_by_key.get(key)
+        if ids is None or book_id not in ids:
+            return
+        ids.remove(book_id)
+        if ids:
+            return
+        del self._ids_by_key[key]
+        for word in set(key.split()):
+            keys = self._keys_by_word[word]
+            keys.discard(key)
+            if keys:
+                continue
+            del self._keys_by_word[word]
+            for gram in trigrams(word):
+                words = self._words_by_gram[gram]
+                words.discard(word)
+                if not words:
+                    del self._words_by_gram[gram]
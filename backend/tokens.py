@@ -0,0 +1,47 @@
+from functools import lru_cache
+
+import tiktoken
+
+# Rough characters-per-token ratio used when no tokenizer can be loaded
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str = "gpt-4o-mini"):
+    """tiktoken encoding for a chat model, or None if it cannot be loaded (e.g. offline)"""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass
+    except Exception:
+        return None
+    try:
+        # Older tiktoken releases do not know the gpt-4o family
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """Number of tokens text takes for the given model"""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "gpt-4o-mini") -> str:
+    """Longest prefix of text that fits in max_tokens, cut at a word boundary"""
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding(model)
+    if encoding is None:
+        if len(text) <= max_tokens * CHARS_PER_TOKEN:
+            return text
+        prefix = text[:max_tokens * CHARS_PER_TOKEN]
+    else:
+        tokens = encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        prefix = encoding.decode(tokens[:max_tokens])
+    return prefix.rsplit(' ', 1)[0] if ' ' in prefix else prefix
@@ -0,0 +1,154 @@
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+class VectorBackend:
+    """Storage and nearest-neighbour search interface used by VectorStore.
+
+    Query results use Chroma's columnar layout: a dict of 'ids', 'documents',
+    'metadatas' and 'distances', each holding one list per query text.
+    Distances are squared L2 distances between normalized embeddings, so lower
+    is closer. A query's where dict keeps only documents whose metadata fields
+    equal all of the given values.
+    """
+
+    def get_hashes(self, ids: List[str]) -> Dict[str, Optional[str]]:
+        """Stored content hash for each of the given ids that exists"""
+        raise NotImplementedError
+
+    def all_ids(self) -> List[str]:
+        """Ids of every stored document"""
+        raise NotImplementedError
+
+    def get_documents(self, ids: List[str]) -> Dict[str, Tuple[str, Dict]]:
+        """(document, metadata) for each of the given ids that exists"""
+        raise NotImplementedError
+
+    def upsert(self, ids: List[str], documents: List[str], metadatas: List[Dict]):
+        """Embed and insert or replace documents"""
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]):
+        """Remove documents by id"""
+        raise NotImplementedError
+
+    def query(self, query_texts: List[str], n_results: int, where: Optional[Dict] = None,
+              query_embeddings: Optional[List] = None) -> Dict:
+        """Top n_results documents for each query text, among those matching where.
+
+        query_embeddings, one per query text, are used instead of embedding the texts again.
+        """
+        raise NotImplementedError
+
+    def iter_metadatas(self, batch_size: int = 1000) -> Iterator[Tuple[str, Dict]]:
+        """(id, metadata) pairs for every stored document"""
+        raise NotImplementedError
+
+    def iter_embeddings(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], np.ndarray]]:
+        """(ids, embeddings) batches covering every stored document"""
+        raise NotImplementedError
+
+    def embedding_matrix(self) -> Optional[Tuple[List[str], np.ndarray]]:
+        """Ids and normalized embedding matrix if the backend holds one in memory, else None"""
+        return None
+
+    def count(self) -> int:
+        """Number of stored documents"""
+        return len(self.all_ids())
+
+    def persist(self):
+        """Flush pending changes to disk after ingestion"""
+
+
+class ChromaBackend(VectorBackend):
+    """Backend storing documents in a persistent Chroma collection"""
+
+    def __init__(self, embedding_function, path: str, collection_name: str = "book_summaries"):
+        import chromadb
+
+        self.client = chromadb.PersistentClient(path=path)
+        self.collection = self.client.get_or_create_collection(
+            name=collection_name,
+            embedding_function=embedding_function
+        )
+
+    def get_hashes(self, ids: List[str]) -> Dict[str, Optional[str]]:
+        existing = self.collection.get(ids=ids, include=['metadatas'])
+        return {
+            book_id: (metadata or {}).get('content_hash')
+            for book_id, metadata in zip(existing['ids'], existing['metadatas'])
+        }
+
+    def all_ids(self) -> List[str]:
+        return self.collection.get(include=[])['ids']
+
+    def get_documents(self, ids: List[str]) -> Dict[str, Tuple[str, Dict]]:
+        found = self.collection.get(ids=ids, include=['documents', 'metadatas'])
+        return {
+            book_id: (document, metadata)
+            for book_id, document, metadata in zip(found['ids'], found['documents'], found['metadatas'])
+        }
+
+    def upsert(self, ids: List[str], documents: List[str], metadatas: List[Dict]):
+        self.collection.upsert(ids=ids, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids: List[str]):
+        self.collection.delete(ids=ids)
+
+    def query(self, query_texts: List[str], n_results: int, where: Optional[Dict] = None,
+              query_embeddings: Optional[List] = None) -> Dict:
+        if where and len(where) > 1:
+            # Chroma takes one field per where clause
+            where = {'$and': [{field: value} for field, value in where.items()]}
+        if query_embeddings is not None:
+            return self.collection.query(
+                query_embeddings=[np.asarray(vector, dtype=np.float32).tolist() for vector in query_embeddings],
+                n_results=n_results, where=where or None
+            )
+        return self.collection.query(query_texts=query_texts, n_results=n_results, where=where or None)
+
+    def iter_metadatas(self, batch_size: int = 1000) -> Iterator[Tuple[str, Dict]]:
+        offset = 0
+        while True:
+            page = self.collection.get(include=['metadatas'], limit=batch_size, offset=offset)
+            if not page['ids']:
+                return
+            yield from zip(page['ids'], page['metadatas'])
+            offset += len(page['ids'])
+
+    def iter_embeddings(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], np.ndarray]]:
+        offset = 0
+        while True:
+            page = self.collection.get(include=['embeddings'], limit=batch_size, offset=offset)
+            if not page['ids']:
+                return
+            yield page['ids'], np.asarray(page['embeddings'], dtype=np.float32)
+            offset += len(page['ids'])
+
+    def count(self) -> int:
+        return self.collection.count()
+
+
+def create_backend(embedding_function, path: Optional[str] = None) -> VectorBackend:
+    """Build the backend selected by VECTOR_BACKEND ("chroma" or "numpy"), under path if given"""
+    backend = os.getenv('VECTOR_BACKEND', 'chroma')
+    db_path = path or os.getenv('CHROMA_DB_PATH', './chroma_db')
+
+    if backend == 'numpy':
+        from .numpy_backend import NumpyBackend
+
+        default_index_path = os.path.join(db_path, 'numpy_index')
+        return NumpyBackend(
+            embedding_function,
+            path=default_index_path if path else os.getenv('NUMPY_INDEX_PATH', default_index_path),
+            ivf_lists=int(os.getenv('NUMPY_IVF_LISTS', 0)),
+            nprobe=int(os.getenv('NUMPY_IVF_NPROBE', 8)),
+            quantization=os.getenv('NUMPY_QUANTIZATION', 'none'),
+            rerank=int(os.getenv('NUMPY_RERANK', 4)),
+            pq_subvectors=int(os.getenv('NUMPY_PQ_SUBVECTORS', 0))
+        )
+    if backend != 'chroma':
+        raise ValueError(f"Unknown VECTOR_BACKEND '{backend}', expected 'chroma' or 'numpy'")
+    return ChromaBackend(embedding_function, path=db_path)
@@ -1,107 +1,619 @@
-import chromadb
-from chromadb.utils import embedding_functions
+import hashlib
+import itertools
 import os
-from typing import List, Dict
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 import re
+import numpy as np
 from dotenv import load_dotenv
+from .embeddings import create_embedding_function
+from .lexical_index import BM25Index, book_terms, reciprocal_rank_fusion
+from .metrics import stage
+from .neighbors import NeighborTable, build_neighbor_table
+from .passages import (AGGREGATIONS, BookEmbeddings, aggregate_passages, book_id_of, passage_content_hash,
+                       passage_id, split_passages)
+from .title_index import TitleIndex
+from .vector_backends import VectorBackend, create_backend
 
 load_dotenv()
 
 
+def book_id_for_title(title: str) -> str:
+    """Stable document id derived from the book title"""
+    return "book_" + hashlib.sha1(title.strip().encode('utf-8')).hexdigest()[:16]
+
+
+# Optional "Author: ..." / "Genre: ..." lines between a title and its summary
+BOOK_FIELDS = ('author', 'genre')
+FIELD_LINE = re.compile(r"^(Author|Genre):\s*(.+?)\s*$")
+
+
+def content_hash(book: Dict) -> str:
+    """Hash of the indexed content of a book, used to detect changed summaries"""
+    content = f"{book['title']}\n{book['summary']}"
+    for field in BOOK_FIELDS:
+        if book.get(field):
+            content += f"\n{field}: {book[field]}"
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def book_metadata(book: Dict) -> Dict:
+    """Backend metadata for a book: title, content hash and whichever fields it has"""
+    metadata = {'title': book['title'], 'content_hash': content_hash(book)}
+    for field in BOOK_FIELDS:
+        if book.get(field):
+            metadata[field] = book[field]
+    return metadata
+
+
+TITLE_MARKER = '## Title: '
+
+# Catalog file ingested by build_index and, when the store is empty, at startup
+CATALOG_PATH = os.getenv('CATALOG_PATH', './data/book_summaries.txt')
+
+SEARCH_MODES = ('hybrid', 'vector', 'lexical')
+
+# Passages fetched per candidate book in passage mode, since a book can fill several of the nearest
+PASSAGES_PER_CANDIDATE = 4
+
+
+def iter_book_summaries(file_path: str) -> Iterator[Dict]:
+    """Stream books from a book_summaries file one at a time, reading line by line"""
+    with open(file_path, 'r', encoding='utf-8') as file:
+        yield from _parse_book_lines(file)
+
+
+def _parse_book_lines(lines: Iterable[str]) -> Iterator[Dict]:
+    """Yield title/summary dicts (plus author/genre if given) from lines in the '## Title: ' text format"""
+    title = None
+    summary_lines = []
+
+    for line in lines:
+        if line.startswith(TITLE_MARKER):
+            if title is not None:
+                book = _make_book(title, summary_lines)
+                if book:
+                    yield book
+            title = line[len(TITLE_MARKER):].strip()
+            summary_lines = []
+        elif title is not None:
+            summary_lines.append(line.rstrip('\n'))
+
+    if title is not None:
+        book = _make_book(title, summary_lines)
+        if book:
+            yield book
+
+
+def _make_book(title: str, summary_lines: List[str]) -> Optional[Dict]:
+    fields = {}
+    start = 0
+    for line in summary_lines:
+        match = FIELD_LINE.match(line)
+        if not match:
+            break
+        fields[match.group(1).lower()] = match.group(2)
+        start += 1
+
+    summary = '\n'.join(summary_lines[start:]).strip()
+    if not title or not summary:
+        return None
+    return {'title': title, 'summary': summary, **fields}
+
+
 class VectorStore:
-    def __init__(self):
-        self.client = chromadb.PersistentClient(path=os.getenv('CHROMA_DB_PATH', './chroma_db'))
+    def __init__(self, backend: Optional[VectorBackend] = None, path: Optional[str] = None,
+                 embedding_function=None):
+        # OpenAI (or offline fake) embeddings behind a persistent cache
+        self.embedding_function = embedding_function or create_embedding_function()
 
-        # Use OpenAI embeddings
-        openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-            api_key=os.getenv('OPENAI_API_KEY'),
-            model_name="text-embedding-3-small"
-        )
+        # Chroma collection by default, or the in-process NumPy index (VECTOR_BACKEND)
+        self.backend = backend or create_backend(self.embedding_function, path)
 
-        # Set the environment variable that ChromaDB expects
-        os.environ['CHROMA_OPENAI_API_KEY'] = os.getenv('OPENAI_API_KEY')
+        # Every index file lives under path (e.g. a snapshot) if given, else as configured
+        data_path = path or os.getenv('CHROMA_DB_PATH', './chroma_db')
 
-        # Create or get collection
-        self.collection = self.client.get_or_create_collection(
-            name="book_summaries",
-            embedding_function=openai_ef
-        )
+        # Titles are served from memory; built by ingestion or on first use
+        self._title_index: Optional[TitleIndex] = None
+        self._title_index_lock = threading.Lock()
+
+        # Bumped whenever ingestion changes the catalog, so caches can tell
+        self.catalog_version = 0
+
+        # BM25 index over titles and summaries, kept next to the vector data
+        default_lexical_path = os.path.join(data_path, 'lexical_index.json')
+        self.lexical_index_path = default_lexical_path if path else os.getenv('LEXICAL_INDEX_PATH', default_lexical_path)
+        self.lexical_index = self._load_lexical_index()
+
+        # "hybrid" fuses vector and BM25 rankings; "vector" or "lexical" use one
+        self.search_mode = os.getenv('SEARCH_MODE', 'hybrid')
+        self.hybrid_candidates = int(os.getenv('HYBRID_CANDIDATES', 20))
+
+        # Summaries split into passages of at most this many tokens, each embedded and
+        # searched on its own and scored per book (0: one document per summary)
+        self.passage_tokens = int(os.getenv('PASSAGE_TOKENS', 0))
+        self.passage_aggregation = os.getenv('PASSAGE_AGGREGATION', 'max')
+        if self.passage_aggregation not in AGGREGATIONS:
+            raise ValueError(
+                f"Unknown passage aggregation '{self.passage_aggregation}', expected one of {', '.join(AGGREGATIONS)}"
+            )
+
+        # Trigram similarity a misspelled title needs to resolve to a catalog title
+        self.title_match_threshold = float(os.getenv('TITLE_MATCH_THRESHOLD', 0.5))
+
+        # Precomputed book-to-book neighbours, written by build_index and loaded on first use
+        default_neighbors_path = os.path.join(data_path, 'neighbors')
+        self.neighbor_table_path = default_neighbors_path if path else os.getenv('NEIGHBOR_TABLE_PATH', default_neighbors_path)
+        self._neighbor_table: Optional[NeighborTable] = None
+        self._neighbor_table_loaded = False
+
+    @property
+    def title_index(self) -> TitleIndex:
+        """In-memory title index, loaded from the backend once if ingestion did not build it"""
+        if self._title_index is None:
+            with self._title_index_lock:
+                if self._title_index is None:
+                    title_index = TitleIndex()
+                    for document_id, metadata in self.backend.iter_metadatas():
+                        title_index.add(metadata.get('book_id', document_id), metadata['title'])
+                    self._title_index = title_index
+        return self._title_index
+
+    @property
+    def neighbor_table(self) -> Optional[NeighborTable]:
+        """Book-to-book neighbour table, or None if it has not been built"""
+        if not self._neighbor_table_loaded:
+            try:
+                self._neighbor_table = NeighborTable.load(self.neighbor_table_path)
+            except (OSError, ValueError) as e:
+                print(f"Warning: could not load neighbour table, similar books are unavailable: {e}")
+            self._neighbor_table_loaded = True
+        return self._neighbor_table
+
+    def build_neighbors(self, k: int = 10) -> Dict:
+        """Precompute the k most similar books of every book and save the table"""
+        # Passages are pooled into one vector per book, so neighbours are books
+        table = build_neighbor_table(BookEmbeddings(self.backend) if self.passage_tokens else self.backend, k)
+        table.save(self.neighbor_table_path)
+        self._neighbor_table = NeighborTable.load(self.neighbor_table_path)
+        self._neighbor_table_loaded = True
+        print(f"Built neighbour table: {table.meta['books']} books, k={table.meta['k']} "
+              f"in {table.meta['build_seconds']:.2f}s")
+        return table.meta
 
-    def load_books_from_file(self, file_path: str):
-        """Load book summaries from text file and add to vector store"""
-        with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-
-        # Parse the book summaries
-        books = self.parse_book_summaries(content)
-
-        # Clear existing data
-        try:
-            # Get all existing IDs and delete them
-            existing_data = self.collection.get()
-            if existing_data['ids']:
-                self.collection.delete(ids=existing_data['ids'])
-        except Exception as e:
-            print(f"Note: Could not clear existing data: {e}")
-            # This is fine for a fresh database
-
-        # Add books to collection
-        documents = []
-        metadatas = []
-        ids = []
-
-        for i, book in enumerate(books):
-            documents.append(book['summary'])
-            metadatas.append({'title': book['title']})
-            ids.append(f"book_{i}")
-
-        self.collection.add(
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids
+    def load_books_from_file(self, file_path: str, incremental: bool = True,
+                             batch_size: Optional[int] = None) -> Dict:
+        """Stream book summaries from a text file and sync them into the vector store.
+
+        Books are parsed one at a time and written in batches of batch_size, so
+        peak memory is bounded by the batch rather than the file. In incremental
+        mode only new or changed summaries are embedded and books missing from
+        the file are deleted. With incremental=False the store is wiped and
+        fully reloaded.
+        """
+        batch_size = batch_size or int(os.getenv('INGEST_BATCH_SIZE', 256))
+        mode = 'incremental' if incremental else 'full'
+        timings = {'parse': 0.0, 'diff': 0.0, 'embed': 0.0, 'lexical': 0.0, 'delete': 0.0}
+        report = {'added': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0, 'batches': 0}
+        start = time.perf_counter()
+
+        if not incremental:
+            stage_start = time.perf_counter()
+            report['deleted'] = self._delete_ids(self._existing_ids(), batch_size)
+            timings['delete'] += time.perf_counter() - stage_start
+
+        # Ids and titles seen in this run; summaries are never kept past their batch
+        titles = TitleIndex()
+        books = iter_book_summaries(file_path)
+        while True:
+            stage_start = time.perf_counter()
+            batch = list(itertools.islice(books, batch_size))
+            timings['parse'] += time.perf_counter() - stage_start
+            if not batch:
+                break
+
+            self._ingest_batch(batch, titles, incremental, report, timings)
+            report['batches'] += 1
+
+        if incremental:
+            stage_start = time.perf_counter()
+            stale_ids = [document_id for document_id in self._existing_ids() if book_id_of(document_id) not in titles]
+            report['deleted'] = self._delete_ids(stale_ids, batch_size)
+            timings['delete'] += time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        self.backend.persist()
+        if self.lexical_index_path and self.lexical_index.dirty:
+            self.lexical_index.save(self.lexical_index_path)
+        timings['persist'] = time.perf_counter() - stage_start
+
+        # Swap in the title index of the catalog that was just synced
+        self._title_index = titles
+        if report['added'] or report['updated'] or report['deleted']:
+            self.catalog_version += 1
+
+        timings['total'] = time.perf_counter() - start
+        report['mode'] = mode
+        report['books'] = len(titles)
+        report['timings'] = {stage: round(seconds, 4) for stage, seconds in timings.items()}
+
+        print(
+            f"Synced {len(titles)} books into vector store ({mode}): "
+            f"{report['added']} added, {report['updated']} updated, "
+            f"{report['deleted']} deleted, {report['unchanged']} unchanged "
+            f"in {report['timings']['total']:.2f}s"
         )
+        return report
+
+    def _ingest_batch(self, batch: List[Dict], titles: TitleIndex, incremental: bool,
+                      report: Dict, timings: Dict):
+        """Diff one batch of parsed books against the store and write the changes"""
+        stage_start = time.perf_counter()
 
-        print(f"Loaded {len(books)} books into vector store")
+        # Key by stable id so a title repeated in the batch keeps its last summary
+        books = {book_id_for_title(book['title']): book for book in batch}
+
+        # A book is stored under its id, or as passages from "<id>#0"; both are
+        # looked up so a book indexed in the other mode is replaced
+        existing_hashes = {}
+        if incremental:
+            existing_hashes = self.backend.get_hashes(
+                [document_id for book_id in books for document_id in (book_id, passage_id(book_id, 0))]
+            )
+
+        changed = []
+        for book_id, book in books.items():
+            stored_id = passage_id(book_id, 0) if self.passage_tokens else book_id
+            unchanged = existing_hashes.get(stored_id) == self._content_hash(book)
+            if not unchanged:
+                changed.append(book_id)
+
+            # A title repeated from an earlier batch is written again but counted once
+            if book_id not in titles:
+                if unchanged:
+                    report['unchanged'] += 1
+                elif book_id in existing_hashes or passage_id(book_id, 0) in existing_hashes:
+                    report['updated'] += 1
+                else:
+                    report['added'] += 1
+            titles.add(book_id, book['title'])
+        timings['diff'] += time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        if changed:
+            records = self._records(books, changed)
+            obsolete_ids = self._obsolete_ids(changed, existing_hashes, records)
+            self.backend.upsert(**records)
+            if obsolete_ids:
+                self.backend.delete(obsolete_ids)
+        timings['embed'] += time.perf_counter() - stage_start
+
+        # Unchanged books missing from the lexical index (e.g. it was deleted) are indexed too
+        stage_start = time.perf_counter()
+        changed_ids = set(changed)
+        for book_id, book in books.items():
+            if book_id in changed_ids or book_id not in self.lexical_index:
+                self.lexical_index.add(book_id, book_terms(book))
+        timings['lexical'] += time.perf_counter() - stage_start
+
+    def _load_lexical_index(self) -> BM25Index:
+        if self.lexical_index_path and os.path.exists(self.lexical_index_path):
+            try:
+                return BM25Index.load(self.lexical_index_path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Warning: could not load lexical index, it will be rebuilt on ingestion: {e}")
+        return BM25Index()
+
+    def _existing_ids(self) -> List[str]:
+        """Ids of every document currently in the store"""
+        return self.backend.all_ids()
+
+    def _delete_ids(self, ids: List[str], batch_size: int) -> int:
+        """Delete documents from the store in batches; returns the number of books they belonged to"""
+        for i in range(0, len(ids), batch_size):
+            self.backend.delete(ids[i:i + batch_size])
+        book_ids = {book_id_of(document_id) for document_id in ids}
+        for book_id in book_ids:
+            self.lexical_index.remove(book_id)
+        return len(book_ids)
+
+    def _content_hash(self, book: Dict) -> str:
+        """Stored content hash of a book, which also covers the passage size it was split at"""
+        if self.passage_tokens:
+            return passage_content_hash(content_hash(book), self.passage_tokens)
+        return content_hash(book)
+
+    def _records(self, books: Dict[str, Dict], ids: List[str]) -> Dict:
+        """Build backend upsert arguments for the given book ids: one document per summary, or per passage"""
+        if not self.passage_tokens:
+            return {
+                'ids': ids,
+                'documents': [books[book_id]['summary'] for book_id in ids],
+                'metadatas': [book_metadata(books[book_id]) for book_id in ids]
+            }
+
+        records = {'ids': [], 'documents': [], 'metadatas': []}
+        for book_id in ids:
+            metadata = {**book_metadata(books[book_id]), 'content_hash': self._content_hash(books[book_id])}
+            passages = split_passages(books[book_id]['summary'], self.passage_tokens)
+            for index, passage in enumerate(passages):
+                records['ids'].append(passage_id(book_id, index))
+                records['documents'].append(passage)
+                records['metadatas'].append({**metadata, 'book_id': book_id, 'passage': index, 'passages': len(passages)})
+        return records
+
+    def _obsolete_ids(self, changed: List[str], existing_hashes: Dict[str, Optional[str]], records: Dict) -> List[str]:
+        """Stored documents of changed books that their new records do not overwrite"""
+        new_ids = set(records['ids'])
+        obsolete = [book_id for book_id in changed if book_id in existing_hashes and book_id not in new_ids]
+
+        # Only "#0" was looked up, so the old passage count comes from its metadata
+        first_ids = [passage_id(book_id, 0) for book_id in changed if passage_id(book_id, 0) in existing_hashes]
+        if first_ids:
+            for first_id, (_, metadata) in self.backend.get_documents(first_ids).items():
+                book_id = book_id_of(first_id)
+                obsolete += [
+                    passage_id(book_id, index) for index in range(metadata.get('passages', 1))
+                    if passage_id(book_id, index) not in new_ids
+                ]
+        return obsolete
 
     def parse_book_summaries(self, content: str) -> List[Dict]:
         """Parse book summaries from the text format"""
-        books = []
-        sections = content.split('## Title: ')[1:]  # Skip first empty element
-
-        for section in sections:
-            lines = section.strip().split('\n', 1)
-            if len(lines) >= 2:
-                title = lines[0].strip()
-                summary = lines[1].strip()
-                books.append({
-                    'title': title,
-                    'summary': summary
-                })
-
-        return books
-
-    def search_books(self, query: str, n_results: int = 3) -> List[Dict]:
-        """Search for books based on query"""
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=n_results
-        )
+        return list(_parse_book_lines(content.splitlines()))
+
+    def search_books(self, query: str, n_results: int = 3, filters: Optional[Dict[str, str]] = None,
+                     mode: Optional[str] = None, query_embedding: Optional[np.ndarray] = None) -> List[Dict]:
+        """Search for books based on query (embedded as query_embedding, when already known)"""
+        query_embeddings = None if query_embedding is None else [query_embedding]
+        return self.search_books_many([query], n_results, filters, mode, query_embeddings)[0]
+
+    def search_books_many(self, queries: List[str], n_results: int = 3, filters: Optional[Dict[str, str]] = None,
+                          mode: Optional[str] = None, query_embeddings: Optional[List] = None) -> List[List[Dict]]:
+        """Search for several queries with one embedding request and one backend query"""
+        results = []
+        for columns in self.search_columns(queries, n_results, filters, mode, query_embeddings):
+            books = [
+                {'title': title, 'summary': summary, 'distance': distance}
+                for title, summary, distance in zip(columns['titles'], columns['summaries'], columns['distances'])
+            ]
+            for book, passages in zip(books, columns.get('passages', ())):
+                book['passages'] = passages
+            results.append(books)
+        return results
+
+    def search_columns(self, queries: List[str], n_results: int = 3, filters: Optional[Dict[str, str]] = None,
+                       mode: Optional[str] = None, query_embeddings: Optional[List] = None) -> List[Dict[str, List]]:
+        """Ranked results per query as parallel 'titles', 'summaries' and 'distances' lists.
+
+        All queries are embedded and scored together. In hybrid mode the vector
+        and BM25 rankings are merged with reciprocal-rank fusion, and a query
+        that is exactly a catalog title returns that book first without being
+        embedded. filters restricts results to books whose metadata fields (e.g.
+        author, genre) equal the given values and is applied inside the backend,
+        before ranking. Distance is None for books the vector search did not
+        return. query_embeddings, one per query, skip embedding the queries.
+
+        With passages indexed, the nearest passages are grouped by book and each
+        book is ranked by its best passage or their total (PASSAGE_AGGREGATION);
+        distance is that of its best passage, and a 'passages' list holds the
+        matched passages of each book, best first.
+        """
+        mode = mode or self.search_mode
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{mode}', expected one of {', '.join(SEARCH_MODES)}")
+        if not queries:
+            return []
+
+        candidates = n_results if mode == 'vector' else max(n_results, self.hybrid_candidates)
+        candidates = min(candidates, len(self.title_index)) or n_results
+        with stage('search_title_match'):
+            exact_ids = [
+                self.title_index.lookup(query) if mode != 'vector' and not filters else None
+                for query in queries
+            ]
+        vector_rankings = [[] for _ in queries]
+        lexical_rankings = [[] for _ in queries]
+        distances = [{} for _ in queries]
+        matched = [{} for _ in queries]
+        found = {}
+
+        vector_queries = [i for i, book_id in enumerate(exact_ids) if book_id is None and mode != 'lexical']
+        if vector_queries:
+            with stage('search_vector'):
+                results = self.backend.query(
+                    [queries[i] for i in vector_queries],
+                    n_results=candidates * PASSAGES_PER_CANDIDATE if self.passage_tokens else candidates,
+                    where=filters or None,
+                    query_embeddings=None if query_embeddings is None else [query_embeddings[i] for i in vector_queries]
+                )
+            for row, i in enumerate(vector_queries):
+                ids = results['ids'][row]
+                row_distances = results['distances'][row] if results.get('distances') else None
+                if not self.passage_tokens:
+                    vector_rankings[i] = ids
+                    found.update(zip(ids, zip(results['documents'][row], results['metadatas'][row])))
+                    if row_distances:
+                        distances[i] = dict(zip(ids, row_distances))
+                    continue
 
-        books = []
-        if results['documents'][0]:  # Check if we have results
-            for i in range(len(results['documents'][0])):
-                books.append({
-                    'title': results['metadatas'][0][i]['title'],
-                    'summary': results['documents'][0][i],
-                    'distance': results['distances'][0][i] if results['distances'] else 0
-                })
+                for book_id, _, positions in aggregate_passages(ids, row_distances, self.passage_aggregation)[:candidates]:
+                    vector_rankings[i].append(book_id)
+                    found.setdefault(book_id, (None, results['metadatas'][row][positions[0]]))
+                    matched[i][book_id] = [results['documents'][row][position] for position in positions]
+                    if row_distances:
+                        distances[i][book_id] = row_distances[positions[0]]
 
-        return books
+        if mode != 'vector':
+            # Over-fetch when filtering, since lexical matches are filtered afterwards
+            lexical_candidates = candidates * 4 if filters else candidates
+            with stage('search_lexical'):
+                for i, query in enumerate(queries):
+                    lexical_rankings[i] = [
+                        book_id for book_id, _ in self.lexical_index.search(query, lexical_candidates)
+                    ]
+
+            missing = {book_id for ranking in lexical_rankings for book_id in ranking}
+            missing.update(book_id for book_id in exact_ids if book_id)
+            missing.difference_update(found)
+            if missing:
+                with stage('search_fetch'):
+                    found.update(self._get_documents(list(missing), summaries=False))
+
+        columns = []
+        for i in range(len(queries)):
+            lexical = [
+                book_id for book_id in lexical_rankings[i]
+                if book_id in found and self._matches(found[book_id][1], filters)
+            ]
+            if exact_ids[i] is not None and exact_ids[i] in found:
+                ranked = [exact_ids[i]] + [book_id for book_id in lexical if book_id != exact_ids[i]]
+            elif mode == 'vector':
+                ranked = vector_rankings[i]
+            elif mode == 'lexical':
+                ranked = lexical
+            else:
+                ranked = reciprocal_rank_fusion([vector_rankings[i], lexical])
+            columns.append({'ids': ranked[:n_results]})
+
+        # Passages only hold part of a summary; whole summaries are joined for the books returned
+        if self.passage_tokens:
+            with stage('search_fetch'):
+                found.update(self._get_documents(list({book_id for column in columns for book_id in column['ids']})))
+
+        for i, column in enumerate(columns):
+            ranked = column.pop('ids')
+            column.update({
+                'titles': [found[book_id][1]['title'] for book_id in ranked],
+                'summaries': [found[book_id][0] for book_id in ranked],
+                'distances': [distances[i].get(book_id) for book_id in ranked]
+            })
+            if self.passage_tokens:
+                column['passages'] = [matched[i].get(book_id, []) for book_id in ranked]
+        return columns
+
+    def _get_documents(self, book_ids: List[str], summaries: bool = True) -> Dict[str, Tuple[Optional[str], Dict]]:
+        """(summary, metadata) of each of the given books that exists.
+
+        With passages indexed the summary is joined back from the book's
+        passages, or left None with summaries=False, which reads only the first.
+        """
+        if not self.passage_tokens:
+            return self.backend.get_documents(book_ids)
+
+        first = {
+            book_id_of(document_id): document
+            for document_id, document in self.backend.get_documents([passage_id(book_id, 0) for book_id in book_ids]).items()
+        }
+        if not summaries:
+            return {book_id: (None, metadata) for book_id, (_, metadata) in first.items()}
+
+        rest_ids = [
+            passage_id(book_id, index) for book_id, (_, metadata) in first.items()
+            for index in range(1, metadata.get('passages', 1))
+        ]
+        rest = self.backend.get_documents(rest_ids) if rest_ids else {}
+        return {
+            book_id: (
+                passage + ''.join(
+                    rest[passage_id(book_id, index)][0] for index in range(1, metadata.get('passages', 1))
+                    if passage_id(book_id, index) in rest
+                ),
+                metadata
+            )
+            for book_id, (passage, metadata) in first.items()
+        }
+
+    @staticmethod
+    def _matches(metadata: Dict, filters: Optional[Dict[str, str]]) -> bool:
+        return not filters or all(metadata.get(field) == value for field, value in filters.items())
 
     def get_all_titles(self) -> List[str]:
         """Get all book titles in the database"""
-        results = self.collection.get()
-        return [metadata['title'] for metadata in results['metadatas']]
+        with stage('get_all_titles'):
+            return self.title_index.titles()
+
+    def get_titles_page(self, offset: int = 0, limit: Optional[int] = None) -> Tuple[List[str], int]:
+        """Titles in alphabetical order from offset (all of them without a limit), and the total count"""
+        with stage('get_titles_page'):
+            titles = self.title_index.sorted_titles()
+            end = None if limit is None else offset + limit
+            return titles[offset:end], len(titles)
+
+    def titles_digest(self) -> str:
+        """Hash identifying the current set of titles, for HTTP ETags"""
+        return self.title_index.digest()
+
+    def get_books(self, titles: List[str]) -> List[Dict]:
+        """Catalog books with exactly these titles, in order, as search results without a distance"""
+        ids = [book_id for book_id in (self.title_index.lookup(title) for title in titles) if book_id]
+        documents = self._get_documents(ids) if ids else {}
+        return [
+            {'title': documents[book_id][1]['title'], 'summary': documents[book_id][0], 'distance': None}
+            for book_id in ids if book_id in documents
+        ]
+
+    def similar_books(self, title: str, n_results: int = 5, min_similarity: Optional[float] = None,
+                      include_summaries: bool = True) -> Optional[Dict]:
+        """Catalog book best matching title and its precomputed nearest neighbours.
+
+        Returns {'title', 'similar': [{'title', 'summary', 'similarity'}]}, or
+        None if the title is not in the catalog or no neighbour table was built.
+        Answered from memory-mapped arrays without embedding anything;
+        neighbours removed from the catalog since the build are skipped.
+        """
+        table = self.neighbor_table
+        if table is None:
+            return None
+        with stage('similar_books'):
+            threshold = self.title_match_threshold if min_similarity is None else min_similarity
+            match = self.title_index.fuzzy_lookup(title, threshold)
+            if match is None:
+                return None
+
+            book_id = match[0]
+            neighbors = [
+                (neighbor_id, similarity) for neighbor_id, similarity in table.lookup(book_id)
+                if neighbor_id in self.title_index
+            ][:n_results]
+            neighbor_ids = [neighbor_id for neighbor_id, _ in neighbors]
+            documents = self._get_documents(neighbor_ids) if include_summaries and neighbor_ids else {}
+            return {
+                'title': self.title_index.title_for(book_id),
+                'similar': [
+                    {
+                        'title': self.title_index.title_for(neighbor_id),
+                        'summary': documents[neighbor_id][0] if neighbor_id in documents else None,
+                        'similarity': round(similarity, 4)
+                    }
+                    for neighbor_id, similarity in neighbors
+                ]
+            }
+
+    def resolve_title(self, title: str) -> Optional[str]:
+        """Catalog title matching title exactly, after case and punctuation folding, or approximately"""
+        match = self.title_index.fuzzy_lookup(title, self.title_match_threshold)
+        return self.title_index.title_for(match[0]) if match else None
+
+    def get_summary_by_title(self, title: str) -> str:
+        """Tool function to get a detailed summary of the catalog book best matching title"""
+        match = self.title_index.fuzzy_lookup(title, self.title_match_threshold)
+        if match is None:
+            return get_summary_by_title(title)
+
+        book_id, similarity = match
+        catalog_title = self.title_index.title_for(book_id)
+        summary = lookup_summary(catalog_title)
+        if summary is None:
+            document = self._get_documents([book_id]).get(book_id)
+            if document is None:
+                return get_summary_by_title(title)
+            summary = document[0]
+
+        if similarity < 1.0:
+            return f"Closest match in the catalog: {catalog_title}\n\n{summary}"
+        return summary
 
 
 # Book summaries dictionary for the tool
@@ -183,9 +695,15 @@ book_summaries_dict = {
 }
 
 
+def lookup_summary(title: str) -> Optional[str]:
+    """Detailed summary for an exact title, or None if there is none"""
+    return book_summaries_dict.get(title)
+
+
 def get_summary_by_title(title: str) -> str:
     """Tool function to get detailed summary by exact title"""
-    if title in book_summaries_dict:
-        return book_summaries_dict[title]
+    summary = lookup_summary(title)
+    if summary is not None:
+        return summary
     else:
         return f"Sorry, I don't have a detailed summary for '{title}'. Please check the title spelling or try a different book."
\ No newline at end of file
@@ -0,0 +1,4 @@
+"""
+Offline benchmarks for the Smart Librarian backend.
+Run a module with python -m benchmarks.<name>; results are printed as JSON.
+"""
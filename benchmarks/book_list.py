@@ -0,0 +1,69 @@
+"""
+GET /books cost as the catalog grows: the full list, one page (as the
+frontend sidebar requests it) and an If-None-Match revalidation answered with
+304, measured through the FastAPI app on synthetic titles.
+
+    python -m benchmarks.book_list [catalog sizes...] [--requests 50] [--page-size 50]
+"""
+import argparse
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+from .catalog import synthetic_titles
+from .common import latency_summary
+
+
+def store_with_titles(size: int):
+    """VectorStore serving only its title index (no backend is opened)"""
+    from backend.title_index import TitleIndex
+    from backend.vector_store import VectorStore
+
+    index = TitleIndex()
+    for i, title in enumerate(synthetic_titles(size)):
+        index.add(str(i), title)
+    vector_store = VectorStore.__new__(VectorStore)
+    vector_store._title_index = index
+    return vector_store
+
+
+async def measure(client, params: dict, headers: dict, requests: int) -> dict:
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = await client.get('/books', params=params, headers=headers)
+        latencies.append(time.perf_counter() - start)
+    return {'status': response.status_code, 'bytes': len(response.content), **latency_summary(latencies)}
+
+
+async def bench_size(size: int, requests: int, page_size: int) -> dict:
+    import httpx
+    from backend import api
+
+    api.librarian = SimpleNamespace(vector_store=store_with_titles(size))
+    start = time.perf_counter()
+    api.librarian.vector_store.titles_digest()
+    digest_seconds = time.perf_counter() - start
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url='http://bench') as client:
+        page = {'offset': 0, 'limit': page_size}
+        etag = (await client.get('/books', params=page)).headers['etag']
+        result = {
+            'books': size,
+            'sort_and_digest_s': round(digest_seconds, 3),
+            'full_list': await measure(client, {}, {}, max(1, requests // 10)),
+            'page': await measure(client, page, {}, requests),
+            'page_not_modified': await measure(client, page, {'If-None-Match': etag}, requests)
+        }
+    api.librarian = None
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sizes", type=int, nargs="*", default=[1000, 100000, 1000000])
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=50)
+    args = parser.parse_args()
+    print(json.dumps([asyncio.run(bench_size(size, args.requests, args.page_size)) for size in args.sizes], indent=2))
@@ -0,0 +1,36 @@
+import random
+from typing import Iterator
+
+WORDS = (
+    "adventure magic friendship dragon war love family mystery detective murder space planet "
+    "empire rebellion kingdom sea journey island city village school wizard witch robot future "
+    "past history revolution freedom power betrayal revenge courage loss grief hope dream night "
+    "forest mountain river desert winter summer king queen soldier spy ship crew secret truth"
+).split()
+
+GENRES = ["Fantasy", "Science Fiction", "Mystery", "Romance", "History", "War", "Dystopian", "Adventure"]
+
+
+def synthetic_titles(count: int, seed: int = 0) -> Iterator[str]:
+    """Deterministic, unique synthetic book titles"""
+    rng = random.Random(seed)
+    for i in range(count):
+        words = rng.sample(WORDS, rng.randint(2, 4))
+        yield f"The {' '.join(word.capitalize() for word in words)} {i}"
+
+
+def synthetic_summary(rng: random.Random, sentences: int = 4) -> str:
+    return ' '.join(
+        ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 16))).capitalize() + '.'
+        for _ in range(sentences)
+    )
+
+
+def write_catalog(path: str, count: int, seed: int = 0) -> str:
+    """Write a synthetic catalog in the book_summaries '## Title:' format"""
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as file:
+        for i, title in enumerate(synthetic_titles(count, seed)):
+            genre = GENRES[i % len(GENRES)]
+            file.write(f"## Title: {title}\nGenre: {genre}\n{synthetic_summary(rng)}\n")
+    return path
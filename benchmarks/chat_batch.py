@@ -0,0 +1,84 @@
+"""
+Throughput of a bulk job: one aget_book_recommendation call per query in a
+loop, versus aget_book_recommendations_batch (chunked retrieval, bounded
+concurrent completions). Also counts embedding requests made by each.
+Runs offline against the stub OpenAI server.
+
+    python -m benchmarks.chat_batch [--requests 200] [--concurrency 16] [--latency-ms 200]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+from .catalog import WORDS
+from .stub_openai import StubServer
+
+
+def queries(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [f"books about {' and '.join(rng.sample(WORDS, 2))}" for _ in range(count)]
+
+
+async def sequential(librarian, batch):
+    for query in batch:
+        await librarian.aget_book_recommendation(query)
+
+
+async def batched(librarian, batch, concurrency):
+    errors = 0
+    async for result in librarian.aget_book_recommendations_batch(batch, concurrency=concurrency):
+        errors += 'error' in result
+    return errors
+
+
+def measure(embedder, coroutine) -> dict:
+    embedder.calls = 0
+    start = time.perf_counter()
+    outcome = asyncio.run(coroutine)
+    elapsed = time.perf_counter() - start
+    result = {'seconds': round(elapsed, 3), 'embedding_calls': embedder.calls}
+    if outcome is not None:
+        result['errors'] = outcome
+    return result
+
+
+def run(requests: int, concurrency: int, latency_ms: float, port: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory, StubServer(port=port, latency_ms=latency_ms) as stub:
+        os.environ.update(
+            OPENAI_API_KEY='offline', OPENAI_BASE_URL=stub.base_url, EMBEDDING_PROVIDER='fake',
+            EMBEDDING_CACHE_PATH='', EMBEDDING_CACHE_SIZE='0', CHROMA_DB_PATH=directory,
+            RESPONSE_CACHE_SIZE='0'
+        )
+        from backend.chat_bot import SmartLibrarian
+
+        librarian = SmartLibrarian()
+        # The fake embedder behind the (disabled) cache counts its requests
+        embedder = librarian.vector_store.embedding_function.embedding_function
+
+        batch = queries(requests)
+        loop = measure(embedder, sequential(librarian, batch))
+        bulk = measure(embedder, batched(librarian, batch, concurrency))
+        for result in (loop, bulk):
+            result['requests_per_second'] = round(requests / result['seconds'], 2)
+
+        return {
+            'requests': requests,
+            'concurrency': concurrency,
+            'stub_latency_ms': latency_ms,
+            'loop': loop,
+            'batch': bulk
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+    print(json.dumps(run(args.requests, args.concurrency, args.latency_ms, args.port), indent=2))
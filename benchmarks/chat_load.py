@@ -0,0 +1,67 @@
+"""
+Concurrent chat throughput of one event loop (one uvicorn worker), using
+the blocking get_book_recommendation the way /chat used to, versus
+aget_book_recommendation. Runs offline against the stub OpenAI server.
+
+    python -m benchmarks.chat_load [--requests 40] [--concurrency 8] [--latency-ms 200]
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from .common import latency_summary
+from .stub_openai import StubServer
+
+QUERY = "books about magic and friendship"
+
+
+async def measure(handler, requests: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await handler(QUERY)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    return {'requests_per_second': round(requests / elapsed, 2), **latency_summary(latencies)}
+
+
+def run(requests: int, concurrency: int, latency_ms: float, port: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory, StubServer(port=port, latency_ms=latency_ms) as stub:
+        os.environ.update(
+            OPENAI_API_KEY='offline', OPENAI_BASE_URL=stub.base_url, EMBEDDING_PROVIDER='fake',
+            EMBEDDING_CACHE_PATH='', CHROMA_DB_PATH=directory, RESPONSE_CACHE_SIZE='0'
+        )
+        from backend.chat_bot import SmartLibrarian
+
+        librarian = SmartLibrarian()
+
+        async def blocking(query):
+            # What the old async /chat handler did: a sync call on the event loop
+            return librarian.get_book_recommendation(query)
+
+        return {
+            'requests': requests,
+            'concurrency': concurrency,
+            'stub_latency_ms': latency_ms,
+            'sync': asyncio.run(measure(blocking, requests, concurrency)),
+            'async': asyncio.run(measure(librarian.aget_book_recommendation, requests, concurrency))
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+    print(json.dumps(run(args.requests, args.concurrency, args.latency_ms, args.port), indent=2))
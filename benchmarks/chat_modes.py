@@ -0,0 +1,62 @@
+"""
+Latency and tokens per request for the "tool" and "single_pass"
+recommendation modes, offline against the stub OpenAI server.
+
+    python -m benchmarks.chat_modes [--requests 30] [--latency-ms 200]
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from .common import latency_summary
+from .stub_openai import StubServer
+
+QUERIES = [
+    "books about magic and friendship",
+    "a dystopian novel about surveillance",
+    "a story set during a war",
+    "something about love and social class",
+    "an epic fantasy quest"
+]
+
+
+async def measure(librarian, mode: str, requests: int) -> dict:
+    latencies, tokens, calls = [], [], []
+    await librarian.aget_book_recommendation(QUERIES[0], mode)  # warm up connections
+    for i in range(requests):
+        start = time.perf_counter()
+        result = await librarian.aget_book_recommendation(QUERIES[i % len(QUERIES)], mode)
+        latencies.append(time.perf_counter() - start)
+        tokens.append(result["usage"]["total_tokens"])
+        calls.append(result["usage"]["llm_calls"])
+
+    return {
+        'mode': mode,
+        **latency_summary(latencies),
+        'tokens_per_request': round(sum(tokens) / len(tokens), 1),
+        'llm_calls_per_request': round(sum(calls) / len(calls), 2)
+    }
+
+
+def run(requests: int, latency_ms: float, port: int) -> list:
+    with tempfile.TemporaryDirectory() as directory, StubServer(port=port, latency_ms=latency_ms) as stub:
+        os.environ.update(
+            OPENAI_API_KEY='offline', OPENAI_BASE_URL=stub.base_url, EMBEDDING_PROVIDER='fake',
+            EMBEDDING_CACHE_PATH='', CHROMA_DB_PATH=directory, RESPONSE_CACHE_SIZE='0'
+        )
+        from backend.chat_bot import RECOMMENDATION_MODES, SmartLibrarian
+
+        librarian = SmartLibrarian()
+        return [asyncio.run(measure(librarian, mode, requests)) for mode in RECOMMENDATION_MODES]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+    print(json.dumps(run(args.requests, args.latency_ms, args.port), indent=2))
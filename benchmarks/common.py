@@ -0,0 +1,19 @@
+from typing import Dict, List
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0-100) of a list of values"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def latency_summary(seconds: List[float]) -> Dict:
+    """p50/p95/p99 of latencies in seconds, reported in milliseconds"""
+    return {
+        'p50_ms': round(1000 * percentile(seconds, 50), 3),
+        'p95_ms': round(1000 * percentile(seconds, 95), 3),
+        'p99_ms': round(1000 * percentile(seconds, 99), 3)
+    }
@@ -0,0 +1,73 @@
+"""
+Inappropriate-language check: the old per-word substring scan versus the
+compiled ProfanityFilter, across word list and message sizes.
+
+    python -m benchmarks.content_filter [--repeat 200]
+"""
+import argparse
+import json
+import random
+import string
+import time
+
+from backend.content_filter import DEFAULT_WORDS, ProfanityFilter
+
+from .catalog import synthetic_summary
+
+
+def substring_scan(words, message: str) -> bool:
+    """The previous implementation"""
+    message_lower = message.lower()
+    return any(word.strip('*') in message_lower for word in words)
+
+
+def word_list(size: int, rng: random.Random):
+    words = list(DEFAULT_WORDS)
+    while len(words) < size:
+        words.append(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 10))))
+    return words[:size]
+
+
+def time_per_call(check, messages, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            check(message)
+    return (time.perf_counter() - start) / (repeat * len(messages))
+
+
+def run(repeat: int):
+    rng = random.Random(0)
+    messages = {
+        'short': ["I want a book about freedom and social control", "Books about friendship and magic"],
+        'long': [' '.join(synthetic_summary(rng, sentences=60) for _ in range(10))]
+    }
+
+    results = []
+    for size in (10, 100, 1000, 5000):
+        words = word_list(size, rng)
+        start = time.perf_counter()
+        content_filter = ProfanityFilter(words)
+        build_ms = 1000 * (time.perf_counter() - start)
+
+        for kind, texts in messages.items():
+            runs = max(1, repeat // 20) if kind == 'long' else repeat
+            before = time_per_call(lambda message: substring_scan(words, message), texts, runs)
+            after = time_per_call(content_filter.contains, texts, runs)
+            results.append({
+                'words': size,
+                'message': kind,
+                'message_chars': sum(len(text) for text in texts) // len(texts),
+                'substring_scan_us': round(1e6 * before, 2),
+                'compiled_filter_us': round(1e6 * after, 2),
+                'speedup': round(before / after, 1),
+                'build_ms': round(build_ms, 2)
+            })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    print(json.dumps(run(args.repeat), indent=2))
@@ -0,0 +1,74 @@
+"""
+Prompt size and latency over a long conversation: every turn sends the
+session history, either compacted within SESSION_HISTORY_TOKENS or (as if
+the whole transcript were re-sent) with an unlimited budget. Runs offline
+against the stub OpenAI server.
+
+    python -m benchmarks.conversation [--turns 40] [--history-tokens 1000] [--reply-words 120]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+from .catalog import WORDS
+from .stub_openai import StubServer
+
+CHECKPOINTS = (1, 5, 10, 20, 40, 80)
+
+
+def follow_ups(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [
+        f"Something more about {' and '.join(rng.sample(WORDS, 2))}, shorter than the last one you suggested"
+        for _ in range(count)
+    ]
+
+
+async def converse(librarian, session_id: str, messages) -> list:
+    turns = []
+    for message in messages:
+        start = time.perf_counter()
+        result = await librarian.aget_book_recommendation(message, session_id=session_id)
+        turns.append({
+            'ms': round((time.perf_counter() - start) * 1000, 1),
+            'prompt_tokens': result.get('usage', {}).get('prompt_tokens'),
+            'history_tokens': librarian.sessions.get(session_id).history_tokens
+        })
+    return turns
+
+
+def run(turns: int, history_tokens: int, reply_words: int, latency_ms: float, port: int) -> dict:
+    stub_options = {'latency_ms': latency_ms, 'reply_words': reply_words}
+    with tempfile.TemporaryDirectory() as directory, StubServer(port=port, **stub_options) as stub:
+        os.environ.update(
+            OPENAI_API_KEY='offline', OPENAI_BASE_URL=stub.base_url, EMBEDDING_PROVIDER='fake',
+            EMBEDDING_CACHE_PATH='', CHROMA_DB_PATH=directory, RESPONSE_CACHE_SIZE='0'
+        )
+        from backend.chat_bot import SmartLibrarian
+
+        librarian = SmartLibrarian()
+        messages = follow_ups(turns)
+        results = {'turns': turns, 'reply_words': reply_words}
+        for name, budget in (('compacted', history_tokens), ('full_transcript', 10 ** 9)):
+            librarian.session_history_tokens = budget
+            history = asyncio.run(converse(librarian, name, messages))
+            results[name] = {
+                'history_tokens_budget': budget if budget < 10 ** 9 else None,
+                'by_turn': {turn: history[turn - 1] for turn in CHECKPOINTS if turn <= turns}
+            }
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--history-tokens", type=int, default=1000)
+    parser.add_argument("--reply-words", type=int, default=120)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+    print(json.dumps(run(args.turns, args.history_tokens, args.reply_words, args.latency_ms, args.port), indent=2))
@@ -0,0 +1,161 @@
+"""
+Catalog refresh while serving: what concurrent searches see during a full
+re-ingestion done in place versus built as a new index snapshot and switched
+in, plus how much of a snapshot's embedding matrix worker processes share.
+
+- in_place: load_books_from_file(incremental=False) on the serving store,
+  which deletes every book before adding them back
+- snapshot: SnapshotManager.build(incremental=False) into a staging
+  directory, then switch, with searches pinned to a snapshot
+- workers: processes opening the same snapshot, with the resident and
+  proportional (Pss: shared pages split between the processes mapping them)
+  memory of its memory-mapped embeddings.npy (Linux only)
+
+    python -m benchmarks.hot_swap [--books 5000] [--threads 4] [--workers 2]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from .catalog import write_catalog
+from .common import latency_summary
+
+
+def run_searches(search, stop: threading.Event, seen: dict):
+    """Search until stopped, recording latency and the smallest catalog and result sizes seen"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            total, results = search()
+        except Exception as e:
+            seen['errors'][type(e).__name__] = seen['errors'].get(type(e).__name__, 0) + 1
+            continue
+        seen['latencies'].append(time.perf_counter() - start)
+        seen['min_books'] = min(seen['min_books'], total)
+        seen['empty_results'] += not results
+
+
+def while_searching(search, work, threads: int) -> dict:
+    stop = threading.Event()
+    seen = {'latencies': [], 'min_books': float('inf'), 'empty_results': 0, 'errors': {}}
+    workers = [threading.Thread(target=run_searches, args=(search, stop, seen)) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    time.sleep(0.2)
+    start = time.perf_counter()
+    work()
+    seconds = time.perf_counter() - start
+    time.sleep(0.2)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return {
+        'refresh_s': round(seconds, 3),
+        'searches': len(seen['latencies']),
+        'min_books_seen': seen['min_books'],
+        'empty_results': seen['empty_results'],
+        'errors': seen['errors'],
+        **latency_summary(seen['latencies'])
+    }
+
+
+def bench_in_place(catalog: str, directory: str, threads: int) -> dict:
+    from backend.vector_store import VectorStore
+
+    vector_store = VectorStore(path=os.path.join(directory, 'in_place'))
+    vector_store.load_books_from_file(catalog)
+
+    def search():
+        return len(vector_store.title_index), vector_store.search_books('dragon magic kingdom', n_results=5)
+
+    return while_searching(search, lambda: vector_store.load_books_from_file(catalog, incremental=False), threads)
+
+
+def bench_snapshot(catalog: str, directory: str, threads: int) -> dict:
+    from backend.snapshots import SnapshotManager
+
+    manager = SnapshotManager(os.path.join(directory, 'snapshots'))
+    manager.build(catalog, neighbors=0)
+    manager.load_current()
+
+    def search():
+        with manager.pin():
+            vector_store = manager.store()
+            return len(vector_store.title_index), vector_store.search_books('dragon magic kingdom', n_results=5)
+
+    def refresh():
+        manager.build(catalog, incremental=False, neighbors=0)
+        manager.load_current()
+
+    result = while_searching(search, refresh, threads)
+    result['stats'] = manager.stats()
+    return result
+
+
+WORKER = """
+import sys
+from backend.snapshots import SnapshotManager
+manager = SnapshotManager(sys.argv[1])
+manager.load_current()
+store = manager.store()
+float(store.backend.embeddings.sum())
+print('ready', flush=True)
+sys.stdin.readline()
+"""
+
+
+def mapping_pages(pid: int, file_name: str) -> dict:
+    """Rss and Pss (kB) of a process's mappings of file_name, from /proc/<pid>/smaps"""
+    totals = {'Rss': 0, 'Pss': 0}
+    inside = False
+    with open(f'/proc/{pid}/smaps', 'r') as smaps:
+        for line in smaps:
+            fields = line.split()
+            if '-' in fields[0] and len(fields) >= 5:
+                inside = fields[-1].endswith(file_name)
+            elif inside and fields[0].rstrip(':') in totals:
+                totals[fields[0].rstrip(':')] += int(fields[1])
+    return totals
+
+
+def bench_workers(directory: str, workers: int) -> dict:
+    if not os.path.exists('/proc/self/smaps'):
+        return {'skipped': 'needs /proc/<pid>/smaps'}
+    root = os.path.join(directory, 'snapshots')
+    processes = [
+        subprocess.Popen([sys.executable, '-c', WORKER, root], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        for _ in range(workers)
+    ]
+    try:
+        for process in processes:
+            process.stdout.readline()
+        pages = [mapping_pages(process.pid, 'embeddings.npy') for process in processes]
+    finally:
+        for process in processes:
+            process.communicate('\n')
+    return {'workers': workers, 'embeddings_npy_kb': pages}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=4, help="concurrent search threads")
+    parser.add_argument("--workers", type=int, default=2, help="processes opening the same snapshot")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ.update(
+            EMBEDDING_PROVIDER='fake', EMBEDDING_CACHE_PATH='', VECTOR_BACKEND='numpy', CHROMA_DB_PATH=directory
+        )
+        catalog = write_catalog(os.path.join(directory, 'catalog.txt'), args.books)
+        print(json.dumps({
+            'books': args.books,
+            'in_place': bench_in_place(catalog, directory, args.threads),
+            'snapshot': bench_snapshot(catalog, directory, args.threads),
+            'workers': bench_workers(directory, args.workers)
+        }, indent=2))
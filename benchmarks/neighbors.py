@@ -0,0 +1,153 @@
+"""
+Precomputed book-to-book neighbour table:
+
+- build: blockwise top-k over random clustered embeddings of each catalog size,
+  with build time, peak traced memory and a check against a plain full
+  similarity product on sampled rows
+- lookup: NeighborTable.lookup latency on the saved, memory-mapped table
+- chat: "books like <title>" through SmartLibrarian with the fast path on
+  versus off (stub OpenAI server, fake embeddings)
+
+    python -m benchmarks.neighbors [catalog sizes...] [--dimensions 256] [--k 10] [--spool]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from .catalog import write_catalog
+from .common import latency_summary
+from .stub_openai import StubServer
+
+
+class MatrixBackend:
+    """Stand-in backend holding a normalized embedding matrix; spool=True hides it"""
+
+    def __init__(self, matrix: np.ndarray, spool: bool = False):
+        self.ids = [f"book_{i:016x}" for i in range(len(matrix))]
+        self.matrix = matrix
+        self.spool = spool
+
+    def embedding_matrix(self):
+        return None if self.spool else (self.ids, self.matrix)
+
+    def iter_embeddings(self, batch_size: int = 1000):
+        for start in range(0, len(self.ids), batch_size):
+            yield self.ids[start:start + batch_size], self.matrix[start:start + batch_size]
+
+    def count(self) -> int:
+        return len(self.ids)
+
+
+def clustered_embeddings(books: int, dimensions: int, clusters: int = 64, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    matrix = centers[rng.integers(0, clusters, books)] + 0.5 * rng.standard_normal((books, dimensions)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def bench_build(books: int, dimensions: int, k: int, spool: bool, lookups: int) -> dict:
+    from backend.neighbors import NeighborTable, build_neighbor_table
+
+    matrix = clustered_embeddings(books, dimensions)
+    backend = MatrixBackend(matrix, spool)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    table = build_neighbor_table(backend, k)
+    build_seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    # Sampled rows against the full product
+    rng = random.Random(0)
+    positions = {book_id: i for i, book_id in enumerate(backend.ids)}
+    agree = 0
+    sample = rng.sample(range(books), min(50, books))
+    for row in sample:
+        scores = matrix @ matrix[row]
+        scores[row] = -np.inf
+        expected = set(np.argsort(-scores)[:table.k].tolist())
+        found = {positions[book_id] for book_id, _ in table.lookup(backend.ids[row])}
+        agree += len(expected & found)
+
+    with tempfile.TemporaryDirectory() as directory:
+        table.save(directory)
+        loaded = NeighborTable.load(directory)
+        queries = [backend.ids[rng.randrange(books)] for _ in range(lookups)]
+        latencies = []
+        for book_id in queries:
+            start = time.perf_counter()
+            loaded.lookup(book_id)
+            latencies.append(time.perf_counter() - start)
+        table_mb = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)) / 2 ** 20
+        del loaded
+
+    return {
+        'books': books,
+        'build_s': round(build_seconds, 3),
+        'books_per_second': round(books / build_seconds),
+        'peak_traced_mb': round(peak / 2 ** 20, 1),
+        'embeddings_mb': round(matrix.nbytes / 2 ** 20, 1),
+        'table_mb': round(table_mb, 2),
+        'agreement_with_full_product': round(agree / (len(sample) * table.k), 4) if table.k else None,
+        'lookup': {**latency_summary(latencies), 'p50_us': round(1e6 * sorted(latencies)[len(latencies) // 2], 1)}
+    }
+
+
+def bench_chat(books: int, requests: int, latency_ms: float, port: int) -> dict:
+    """'books like <title>' answered from the table versus by the model"""
+    with StubServer(port=port, latency_ms=latency_ms) as stub, tempfile.TemporaryDirectory() as directory:
+        os.environ.update(
+            OPENAI_API_KEY='offline', OPENAI_BASE_URL=stub.base_url, EMBEDDING_PROVIDER='fake',
+            EMBEDDING_CACHE_PATH='', EMBEDDING_CACHE_SIZE='0', RESPONSE_CACHE_SIZE='0',
+            VECTOR_BACKEND='numpy', CHROMA_DB_PATH=directory
+        )
+        from backend.chat_bot import SmartLibrarian
+        from backend.vector_store import VectorStore
+
+        vector_store = VectorStore()
+        vector_store.load_books_from_file(write_catalog(os.path.join(directory, 'catalog.txt'), books))
+        vector_store.build_neighbors(10)
+        titles = random.Random(1).sample(vector_store.get_all_titles(), requests)
+
+        librarian = SmartLibrarian(vector_store)
+        results = {}
+        for name, enabled in (('fast_path', True), ('model', False)):
+            librarian.similar_fast_path = enabled
+            latencies, llm_calls = [], 0
+            for title in titles:
+                start = time.perf_counter()
+                result = librarian.get_book_recommendation(f"Can you suggest books like {title}?")
+                latencies.append(time.perf_counter() - start)
+                llm_calls += (result.get('usage') or {}).get('llm_calls', 0)
+            results[name] = {'llm_calls': llm_calls, **latency_summary(latencies)}
+        librarian.close()
+        return {'books': books, 'requests': requests, 'stub_latency_ms': latency_ms, **results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sizes", type=int, nargs="*", default=[1000, 10000, 100000])
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--spool", action="store_true", help="copy embeddings through a memory-mapped file")
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--chat-books", type=int, default=2000)
+    parser.add_argument("--chat-requests", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=50, help="stub completion latency")
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    print(json.dumps({
+        'dimensions': args.dimensions,
+        'k': args.k,
+        'spool': args.spool,
+        'build': [bench_build(size, args.dimensions, args.k, args.spool, args.lookups) for size in args.sizes],
+        'chat': bench_chat(args.chat_books, args.chat_requests, args.latency_ms, args.port)
+    }, indent=2))
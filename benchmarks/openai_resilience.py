@@ -0,0 +1,84 @@
+"""
+Resilience of the OpenAI gateway against the stub server:
+
+- faults: a share of requests fail with 429/5xx; success rate and latency
+  without retries versus with jittered retries
+- rate_limit: the stub enforces a requests-per-minute limit; 429s seen with no
+  client-side limiter versus OPENAI_RPM set to the same limit
+
+    python -m benchmarks.openai_resilience [--requests 300] [--concurrency 32] [--error-rate 0.2] [--rpm 1200]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import requests
+
+from backend.openai_client import OpenAIGateway
+from .common import latency_summary
+from .stub_openai import StubServer
+
+MESSAGES = [{"role": "user", "content": "Recommend a book about friendship"}]
+
+
+async def drive(gateway: OpenAIGateway, count: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await gateway.achat_completion(model="gpt-3.5-turbo", messages=MESSAGES, max_tokens=50)
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                pass
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(count)))
+    elapsed = time.perf_counter() - start
+    result = {'seconds': round(elapsed, 3), 'success_rate': round(len(latencies) / count, 3)}
+    result.update(latency_summary(latencies))
+    result['gateway'] = gateway.stats()
+    return result
+
+
+def scenario(stub_options: dict, gateway_options: dict, count: int, concurrency: int, port: int) -> dict:
+    with StubServer(port=port, **stub_options) as stub:
+        gateway = OpenAIGateway(api_key='offline', base_url=stub.base_url, backoff_base=0.05, **gateway_options)
+        result = asyncio.run(drive(gateway, count, concurrency))
+        result['stub'] = requests.get(stub.base_url.replace('/v1', '/stats')).json()
+        return result
+
+
+def run(count: int, concurrency: int, error_rate: float, rpm: float, latency_ms: float, port: int) -> dict:
+    faults = {'latency_ms': latency_ms, 'error_rate': error_rate, 'error_status': 503}
+    limited = {'latency_ms': latency_ms, 'rate_limit_rpm': rpm}
+    return {
+        'requests': count,
+        'concurrency': concurrency,
+        'faults': {
+            'error_rate': error_rate,
+            'no_retries': scenario(faults, {'max_retries': 0}, count, concurrency, port),
+            'retries': scenario(faults, {'max_retries': 4}, count, concurrency, port)
+        },
+        'rate_limit': {
+            'stub_rpm': rpm,
+            'no_client_limit': scenario(limited, {'max_retries': 4}, count, concurrency, port),
+            'client_limit': scenario(limited, {'max_retries': 4, 'requests_per_minute': rpm}, count, concurrency, port)
+        }
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--rpm", type=float, default=1200)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+    print(json.dumps(run(args.requests, args.concurrency, args.error_rate, args.rpm, args.latency_ms, args.port),
+                     indent=2))
@@ -0,0 +1,126 @@
+"""
+Whole-summary versus passage-level indexing on long summaries. Each
+synthetic book has a multi-paragraph summary with one distinctive fact
+sentence buried at a random position; each query asks about part of one
+book's fact. For whole summaries and for passages scored per book by their
+best passage (max) or their total (sum):
+
+- ingestion: documents stored and time to split, embed and write them
+- recall@k of the target book, per search mode
+- tool-mode prompt: tokens of the candidate context and how often the
+  target book's excerpt contains the fact words the query names (before:
+  the start of each summary; with passages: the passages that matched)
+
+    python -m benchmarks.passages [--books 2000] [--sentences 40] [--queries 300] [--k 3] [--passage-tokens 64]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from .catalog import WORDS, synthetic_summary, synthetic_titles
+from .common import latency_summary
+
+# Syllables of the made-up words facts are written in: 16 ** 4 words, so a
+# fact's words rarely occur in any other book
+SYLLABLES = ('zor', 'vel', 'quin', 'mab', 'thry', 'ossi', 'gral', 'pel', 'ath', 'ind', 'oru', 'exa', 'umb', 'irr',
+             'ost', 'yle')
+
+
+def fact_word(rng: random.Random) -> str:
+    return ''.join(rng.choice(SYLLABLES) for _ in range(4))
+
+
+def write_long_catalog(path: str, books: int, sentences: int, seed: int = 0) -> list:
+    """Catalog of long summaries, each hiding one fact sentence; returns (title, fact words, fact) per book"""
+    rng = random.Random(seed)
+    facts = []
+    with open(path, 'w', encoding='utf-8') as file:
+        for title in synthetic_titles(books, seed):
+            fact_words = [fact_word(rng) for _ in range(5)]
+            fact = f"The {' '.join(fact_words)} turns out to be the key."
+            paragraphs = [synthetic_summary(rng, 5) for _ in range(max(1, sentences // 5))]
+            paragraphs.insert(rng.randrange(len(paragraphs) + 1), fact)
+            file.write(f"## Title: {title}\n" + '\n\n'.join(paragraphs) + '\n')
+            facts.append((title, fact_words, fact))
+    return facts
+
+
+def make_queries(facts: list, count: int, seed: int = 0) -> list:
+    """(query, title, fact words named) for queries naming two of a book's fact words among common theme words"""
+    rng = random.Random(seed)
+    queries = []
+    for title, fact_words, _ in rng.sample(facts, min(count, len(facts))):
+        named = rng.sample(fact_words, 2)
+        queries.append((f"{' '.join(rng.sample(WORDS, 3))} story where the {' '.join(named)} matters", title, named))
+    return queries
+
+
+def run_setting(catalog: str, directory: str, workload: list, args, passage_tokens: int, aggregation: str) -> dict:
+    from backend.chat_bot import SmartLibrarian
+    from backend.tokens import count_tokens
+    from backend.vector_store import VectorStore
+
+    os.environ.update(PASSAGE_TOKENS=str(passage_tokens), PASSAGE_AGGREGATION=aggregation)
+    vector_store = VectorStore(path=directory)
+    start = time.perf_counter()
+    vector_store.load_books_from_file(catalog)
+    result = {'documents': vector_store.backend.count(), 'ingest_s': round(time.perf_counter() - start, 3)}
+    librarian = SmartLibrarian(vector_store=vector_store)
+
+    for mode in ('vector', 'hybrid'):
+        hits, fact_in_prompt, context_tokens, latencies = 0, 0, [], []
+        for query, title, named in workload:
+            start = time.perf_counter()
+            found = vector_store.search_books(query, n_results=args.k, mode=mode)
+            latencies.append(time.perf_counter() - start)
+            context = [f"**{book['title']}**: {librarian._excerpt(book)}" for book in found]
+            context_tokens.append(sum(count_tokens(entry) for entry in context))
+            target = [entry for book, entry in zip(found, context) if book['title'] == title]
+            hits += bool(target)
+            fact_in_prompt += bool(target) and all(word in target[0] for word in named)
+        result[mode] = {
+            f'recall@{args.k}': round(hits / len(workload), 3),
+            'fact_in_prompt': round(fact_in_prompt / len(workload), 3),
+            'context_tokens': round(sum(context_tokens) / len(context_tokens), 1),
+            **latency_summary(latencies)
+        }
+    return result
+
+
+def run(args) -> dict:
+    os.environ.setdefault('OPENAI_API_KEY', 'offline')
+    os.environ.update(EMBEDDING_PROVIDER='fake', EMBEDDING_CACHE_PATH='', EMBEDDING_CACHE_SIZE='0',
+                      VECTOR_BACKEND='numpy', RESPONSE_CACHE_SIZE='0', PROMPT_EXCERPT_TOKENS=str(args.excerpt_tokens))
+    from backend.tokens import count_tokens
+
+    results = {'books': args.books, 'queries': args.queries, 'k': args.k,
+               'passage_tokens': args.passage_tokens, 'excerpt_tokens': args.excerpt_tokens}
+    with tempfile.TemporaryDirectory() as directory:
+        catalog = os.path.join(directory, 'catalog.txt')
+        facts = write_long_catalog(catalog, args.books, args.sentences)
+        with open(catalog, 'r', encoding='utf-8') as file:
+            results['summary_tokens'] = round(count_tokens(file.read()) / args.books)
+        workload = make_queries(facts, args.queries)
+
+        settings = [('whole_summary', 0, 'max'), ('passages_max', args.passage_tokens, 'max'),
+                    ('passages_sum', args.passage_tokens, 'sum')]
+        for name, passage_tokens, aggregation in settings:
+            results[name] = run_setting(
+                catalog, os.path.join(directory, name), workload, args, passage_tokens, aggregation
+            )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=2000)
+    parser.add_argument("--sentences", type=int, default=40, help="generic sentences per summary")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--passage-tokens", type=int, default=64)
+    parser.add_argument("--excerpt-tokens", type=int, default=50, help="PROMPT_EXCERPT_TOKENS")
+    args = parser.parse_args()
+    print(json.dumps(run(args), indent=2))
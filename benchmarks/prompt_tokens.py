@@ -0,0 +1,53 @@
+"""
+System prompt size per PROMPT_TITLES mode as the catalog grows.
+
+    python -m benchmarks.prompt_tokens [catalog sizes...]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+from .catalog import write_catalog
+
+QUERIES = ["books about magic and friendship", "a war story", "space adventure"]
+
+
+def run(sizes):
+    os.environ.setdefault('OPENAI_API_KEY', 'offline')
+    os.environ.update(EMBEDDING_PROVIDER='fake', EMBEDDING_CACHE_PATH='', VECTOR_BACKEND='numpy')
+
+    from backend.chat_bot import SmartLibrarian
+    from backend.tokens import count_tokens
+    from backend.vector_store import VectorStore
+
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            os.environ['CHROMA_DB_PATH'] = directory
+            vector_store = VectorStore()
+            vector_store.load_books_from_file(write_catalog(os.path.join(directory, 'catalog.txt'), size))
+            librarian = SmartLibrarian(vector_store=vector_store)
+
+            for mode in ('all', 'top_n', 'candidates'):
+                librarian.prompt_titles = mode
+                tokens, seconds = [], []
+                for query in QUERIES:
+                    relevant_books = vector_store.search_books(query, n_results=3)
+                    start = time.perf_counter()
+                    prompt = librarian.build_system_prompt(relevant_books)
+                    seconds.append(time.perf_counter() - start)
+                    tokens.append(count_tokens(prompt))
+                results.append({
+                    'catalog_size': size,
+                    'mode': mode,
+                    'prompt_tokens': round(sum(tokens) / len(tokens)),
+                    'build_ms': round(1000 * sum(seconds) / len(seconds), 3)
+                })
+    return results
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000]
+    print(json.dumps(run(sizes), indent=2))
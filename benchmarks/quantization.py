@@ -0,0 +1,145 @@
+"""
+Quantized embedding storage in the numpy backend: for each mode (none,
+float16, int8, pq) and re-rank factor, single-query and batched search
+latency, recall@k against exact float32 search, bytes scanned per million
+books, build time and the resident size of the index files after the
+queries (how much of the float32 matrix re-ranking actually reads).
+
+Random clustered embeddings stand in for text-embedding-3-small vectors;
+real embeddings have more structure, so recall here is a lower bound.
+Resident sizes depend on the page cache: files just written sit in it as
+large folios that are mapped whole, so run as root with --drop-caches to
+see only the pages searches read.
+
+    python -m benchmarks.quantization [catalog sizes...] [--dimensions 1536] [--k 10] [--queries 100]
+                                      [--rerank 0 4 16] [--pq-subvectors 0] [--drop-caches]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from .common import latency_summary
+from .hot_swap import mapping_pages
+from .neighbors import clustered_embeddings
+
+MODES = ('none', 'float16', 'int8', 'pq')
+
+
+class RowEmbeddings:
+    """Embedding function returning matrix row i for "b<i>" and query row i for "q<i>\""""
+
+    def __init__(self, matrix: np.ndarray, queries: np.ndarray):
+        self.matrix = matrix
+        self.queries = queries
+
+    def __call__(self, input):
+        return np.stack([(self.matrix if text[0] == 'b' else self.queries)[int(text[1:])] for text in input])
+
+
+def write_index(directory: str, embedding_function, books: int, batch_size: int = 10000):
+    from backend.numpy_backend import NumpyBackend
+
+    backend = NumpyBackend(embedding_function, directory)
+    for start in range(0, books, batch_size):
+        rows = range(start, min(books, start + batch_size))
+        backend.upsert([f"book_{i:016x}" for i in rows], [f"b{i}" for i in rows], [{} for _ in rows])
+    backend.persist()
+
+
+def quantized_copy(source: str, target: str, matrix: np.ndarray, mode: str, pq_subvectors: int) -> float:
+    """Index directory sharing source's files (hard links) plus quantized vectors; returns seconds to quantize"""
+    from backend.quantization import quantize
+
+    os.makedirs(target)
+    for name in os.listdir(source):
+        os.link(os.path.join(source, name), os.path.join(target, name))
+    start = time.perf_counter()
+    codes = quantize(matrix, mode, pq_subvectors)
+    seconds = time.perf_counter() - start
+    for name, array in zip(codes.files, codes.arrays()):
+        np.save(os.path.join(target, name), array)
+    return seconds
+
+
+def drop_caches():
+    """Write back and drop the page cache (needs root)"""
+    os.sync()
+    with open('/proc/sys/vm/drop_caches', 'w') as file:
+        file.write('1\n')
+
+
+def recall(found, expected) -> float:
+    return float(np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(found, expected)]))
+
+
+def bench_mode(directory: str, embedding_function, mode: str, args, expected, query_texts) -> dict:
+    from backend.numpy_backend import NumpyBackend
+
+    if args.drop_caches:
+        drop_caches()
+    backend = NumpyBackend(embedding_function, directory, quantization=mode, pq_subvectors=args.pq_subvectors)
+    scanned = backend._codes.nbytes if backend._codes is not None else backend.embeddings.nbytes
+    result = {'scanned_mb_per_million': round(scanned / backend.count() * 1e6 / 2 ** 20, 1)}
+
+    factors = [4] + [factor for factor in args.rerank if factor != 4] if mode != 'none' else [None]
+    for factor in factors:
+        if factor is not None:
+            backend.rerank = factor
+        latencies, found = [], []
+        for text in query_texts:
+            start = time.perf_counter()
+            found.append(backend.query([text], args.k)['ids'][0])
+            latencies.append(time.perf_counter() - start)
+        entry = {'recall_at_k': round(recall(found, expected), 3), **latency_summary(latencies)}
+
+        if factor in (None, 4):
+            # Resident pages of the index files after single-query searches only
+            entry['resident_mb'] = {
+                name: round(mapping_pages(os.getpid(), os.path.join(directory, name))['Rss'] / 1024, 1)
+                for name in sorted(os.listdir(directory)) if name.endswith('.npy')
+            }
+            start = time.perf_counter()
+            backend.query(query_texts, args.k)
+            entry['batch_ms_per_query'] = round((time.perf_counter() - start) * 1000 / len(query_texts), 3)
+        result['exact' if factor is None else f'rerank_{factor}'] = entry
+    return result
+
+
+def bench_size(books: int, args) -> dict:
+    matrix = clustered_embeddings(books, args.dimensions)
+    queries = clustered_embeddings(args.queries, args.dimensions, seed=1)
+    embedding_function = RowEmbeddings(matrix, queries)
+    query_texts = [f"q{i}" for i in range(args.queries)]
+    ids = np.array([f"book_{i:016x}" for i in range(books)])
+    expected = [ids[np.argsort(-scores)[:args.k]].tolist() for scores in queries @ matrix.T]
+
+    result = {'books': books, 'dimensions': args.dimensions}
+    with tempfile.TemporaryDirectory() as directory:
+        base = os.path.join(directory, 'none')
+        write_index(base, embedding_function, books)
+        for mode in MODES:
+            path = base
+            entry = {}
+            if mode != 'none':
+                path = os.path.join(directory, mode)
+                entry['quantize_s'] = round(quantized_copy(base, path, matrix, mode, args.pq_subvectors), 3)
+            entry.update(bench_mode(path, embedding_function, mode, args, expected, query_texts))
+            result[mode] = entry
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sizes", type=int, nargs="*", default=[10000, 100000])
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--rerank", type=int, nargs="+", default=[0, 4, 16], help="re-rank factors to compare")
+    parser.add_argument("--pq-subvectors", type=int, default=0, help="0: dimensions // 8")
+    parser.add_argument("--drop-caches", action="store_true", help="drop the page cache before each mode (root)")
+    args = parser.parse_args()
+    print(json.dumps([bench_size(size, args) for size in args.sizes], indent=2))
@@ -0,0 +1,73 @@
+"""
+Recall@k and latency of vector-only, lexical-only and hybrid retrieval on a
+synthetic catalog. Each query targets one book and is either its title
+("What is <title> about?") or a handful of words from its summary.
+
+    python -m benchmarks.retrieval [--books 5000] [--queries 300] [--k 5]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from .catalog import write_catalog
+from .common import latency_summary
+
+
+def make_queries(file_path: str, count: int, seed: int = 0):
+    from backend.vector_store import iter_book_summaries
+
+    rng = random.Random(seed)
+    books = list(iter_book_summaries(file_path))
+    queries = []
+    for book in rng.sample(books, min(count, len(books))):
+        if rng.random() < 0.5:
+            queries.append(('title', f"What is {book['title']} about?", book['title']))
+        else:
+            words = book['summary'].rstrip('.').split()
+            start = rng.randrange(max(1, len(words) - 6))
+            queries.append(('summary', ' '.join(words[start:start + 6]), book['title']))
+    return queries
+
+
+def run(books: int, queries: int, k: int) -> dict:
+    os.environ.update(EMBEDDING_PROVIDER='fake', EMBEDDING_CACHE_PATH='', EMBEDDING_CACHE_SIZE='0',
+                      VECTOR_BACKEND='numpy')
+    from backend.vector_store import VectorStore
+
+    results = {'books': books, 'queries': queries, 'k': k}
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['CHROMA_DB_PATH'] = directory
+        catalog = write_catalog(os.path.join(directory, 'catalog.txt'), books)
+        vector_store = VectorStore()
+        vector_store.load_books_from_file(catalog)
+        workload = make_queries(catalog, queries)
+
+        for mode in ('vector', 'lexical', 'hybrid'):
+            hits = {'title': [0, 0], 'summary': [0, 0]}
+            latencies = []
+            for kind, query, title in workload:
+                start = time.perf_counter()
+                found = vector_store.search_books(query, n_results=k, mode=mode)
+                latencies.append(time.perf_counter() - start)
+                hits[kind][0] += any(book['title'] == title for book in found)
+                hits[kind][1] += 1
+
+            total = sum(found for found, _ in hits.values())
+            results[mode] = {
+                f'recall@{k}': round(total / len(workload), 3),
+                **{f'recall@{k}_{kind}': round(found / max(1, n), 3) for kind, (found, n) in hits.items()},
+                **latency_summary(latencies)
+            }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.books, args.queries, args.k), indent=2))
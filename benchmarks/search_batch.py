@@ -0,0 +1,54 @@
+"""
+Cost per query of N single /search-style calls versus one multi-query
+search_columns call, with and without a genre filter, on the NumPy backend.
+
+    python -m benchmarks.search_batch [--books 20000] [--queries 200]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from .catalog import GENRES, WORDS, write_catalog
+
+
+def run(books: int, queries: int) -> dict:
+    os.environ.update(EMBEDDING_PROVIDER='fake', EMBEDDING_CACHE_PATH='', EMBEDDING_CACHE_SIZE='0',
+                      VECTOR_BACKEND='numpy')
+    from backend.vector_store import VectorStore
+
+    rng = random.Random(0)
+    texts = [' '.join(rng.sample(WORDS, 3)) for _ in range(queries)]
+    results = {'books': books, 'queries': queries}
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['CHROMA_DB_PATH'] = directory
+        vector_store = VectorStore()
+        vector_store.load_books_from_file(write_catalog(os.path.join(directory, 'catalog.txt'), books))
+
+        for name, filters in (('unfiltered', None), ('genre_filter', {'genre': GENRES[0]})):
+            start = time.perf_counter()
+            for text in texts:
+                vector_store.search_books(text, n_results=5, filters=filters)
+            single = time.perf_counter() - start
+
+            start = time.perf_counter()
+            vector_store.search_columns(texts, n_results=5, filters=filters)
+            batched = time.perf_counter() - start
+
+            results[name] = {
+                'single_us_per_query': round(1e6 * single / queries, 1),
+                'batch_us_per_query': round(1e6 * batched / queries, 1),
+                'speedup': round(single / batched, 2)
+            }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    print(json.dumps(run(args.books, args.queries), indent=2))
@@ -0,0 +1,81 @@
+"""
+Cold worker startup on a prebuilt index: build the index once with
+`python -m backend.build_index`, then start uvicorn workers and time how long
+each takes to answer /health (port open) and /ready (index open, warmed up).
+
+    python -m benchmarks.startup [--books 10000] [--runs 3]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from .catalog import write_catalog
+
+
+def wait_for(url: str, timeout: float = 120) -> float:
+    """Seconds until url returns 200"""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return time.perf_counter() - start
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(url)
+
+
+def start_worker(env: dict, port: int) -> dict:
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'backend.api:app', '--port', str(port), '--log-level', 'warning'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        health = wait_for(f'http://127.0.0.1:{port}/health')
+        wait_for(f'http://127.0.0.1:{port}/ready')
+        ready = time.perf_counter() - start
+        timings = requests.get(f'http://127.0.0.1:{port}/ready', timeout=5).json()['timings']
+        return {'health_s': round(health, 3), 'ready_s': round(ready, 3), 'server_timings': timings}
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def run(books: int, runs: int, port: int) -> dict:
+    results = {'books': books}
+    with tempfile.TemporaryDirectory() as directory:
+        catalog = write_catalog(os.path.join(directory, 'catalog.txt'), books)
+        for backend in ('chroma', 'numpy'):
+            env = dict(
+                os.environ, OPENAI_API_KEY='offline', EMBEDDING_PROVIDER='fake', EMBEDDING_CACHE_PATH='',
+                VECTOR_BACKEND=backend, CHROMA_DB_PATH=os.path.join(directory, backend), CATALOG_PATH=catalog
+            )
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-m', 'backend.build_index'], env=env, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            build = time.perf_counter() - start
+
+            workers = [start_worker(env, port) for _ in range(runs)]
+            results[backend] = {
+                'build_index_s': round(build, 2),
+                'health_s': min(worker['health_s'] for worker in workers),
+                'ready_s': min(worker['ready_s'] for worker in workers),
+                'server_timings': workers[-1]['server_timings']
+            }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8101)
+    args = parser.parse_args()
+    print(json.dumps(run(args.books, args.runs, args.port), indent=2))
@@ -0,0 +1,235 @@
+"""
+Local OpenAI-compatible stub server (chat completions and embeddings) for
+offline load and failure tests.
+
+    python -m benchmarks.stub_openai --port 8100 --latency-ms 300 [--error-rate 0.1] [--rate-limit-rpm 600]
+
+Point the backend at it with OPENAI_BASE_URL=http://127.0.0.1:8100/v1.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from backend.embeddings import FakeEmbeddingFunction
+
+
+# Like the real model, the stub follows the system prompt: it asks for a summary
+# only when the prompt tells it to use the tool after recommending
+TOOL_INSTRUCTION = "use the get_summary_by_title tool to provide a detailed summary"
+
+
+def create_app(latency_ms: float = 300, token_interval_ms: float = 10, embedding_latency_ms: float = 20,
+               embedding_dimensions: int = 256, error_rate: float = 0.0, error_status: int = 429,
+               retry_after: Optional[float] = None, rate_limit_rpm: float = 0, reply_words: int = 0,
+               seed: int = 0) -> FastAPI:
+    """Stub /v1/chat/completions and /v1/embeddings.
+
+    When tools are offered and the system prompt asks for a summary lookup, the
+    first call requests get_summary_by_title for the first book in the context.
+    latency_ms is the time to the first byte; streamed responses then emit a
+    chunk every token_interval_ms. Replies are one short sentence, or about
+    reply_words words if set. Embeddings use the offline hashing embedder.
+
+    error_rate of requests fail with error_status (with a Retry-After header if
+    retry_after is set), and with rate_limit_rpm requests beyond that rate,
+    enforced per second, get a 429. GET /stats counts what was served.
+    """
+    app = FastAPI(title="OpenAI stub")
+    embedder = FakeEmbeddingFunction(embedding_dimensions)
+    reply = "Here is a book I think you will enjoy."
+    if reply_words:
+        reply = " ".join(itertools.islice(itertools.cycle(reply.split()), reply_words))
+    rng = random.Random(seed)
+    stats = {"requests": 0, "injected_errors": 0, "rate_limited": 0}
+    window = {"second": 0, "count": 0}
+
+    def error(status: int, message: str) -> JSONResponse:
+        headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+        return JSONResponse(
+            {"error": {"message": message, "type": "stub_error", "code": status}},
+            status_code=status, headers=headers
+        )
+
+    def injected_failure() -> Optional[JSONResponse]:
+        stats["requests"] += 1
+        if rate_limit_rpm:
+            second = int(time.monotonic())
+            if window["second"] != second:
+                window["second"], window["count"] = second, 0
+            window["count"] += 1
+            if window["count"] > max(1, rate_limit_rpm / 60):
+                stats["rate_limited"] += 1
+                return error(429, "Rate limit reached for requests")
+        if error_rate and rng.random() < error_rate:
+            stats["injected_errors"] += 1
+            return error(error_status, "Injected failure")
+        return None
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        failure = injected_failure()
+        if failure is not None:
+            return failure
+
+        body = await request.json()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(embedding_latency_ms / 1000)
+        tokens = sum(len(text) for text in texts) // 4
+        return {
+            "object": "list",
+            "model": body.get("model", "text-embedding-3-small"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": vector}
+                for i, vector in enumerate(embedder(texts))
+            ],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        }
+
+    def usage(body: dict, completion_tokens: int) -> dict:
+        prompt_tokens = sum(len(str(m.get("content") or "")) for m in body.get("messages", [])) // 4
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+    def chunk(body: dict, delta: dict, finish_reason=None, **fields) -> str:
+        return "data: " + json.dumps({
+            "id": "chatcmpl-stub",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+            **fields
+        }) + "\n\n"
+
+    async def stream(body: dict, message: dict, finish_reason: str):
+        await asyncio.sleep(latency_ms / 1000)
+        yield chunk(body, {"role": "assistant", "content": ""})
+        chunks = 0
+
+        if message.get("tool_calls"):
+            tool_call = message["tool_calls"][0]
+            yield chunk(body, {"tool_calls": [{
+                "index": 0, "id": tool_call["id"], "type": "function",
+                "function": {"name": tool_call["function"]["name"], "arguments": ""}
+            }]})
+            arguments = tool_call["function"]["arguments"]
+            for i in range(0, len(arguments), 8):
+                await asyncio.sleep(token_interval_ms / 1000)
+                yield chunk(body, {"tool_calls": [{"index": 0, "function": {"arguments": arguments[i:i + 8]}}]})
+                chunks += 1
+        else:
+            for word in message["content"].split(" "):
+                await asyncio.sleep(token_interval_ms / 1000)
+                yield chunk(body, {"content": word + " "})
+                chunks += 1
+
+        yield chunk(body, {}, finish_reason)
+        # stream_options.include_usage: a last chunk without choices reports usage
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield chunk(body, None, usage=usage(body, chunks))
+        yield "data: [DONE]\n\n"
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        failure = injected_failure()
+        if failure is not None:
+            return failure
+
+        body = await request.json()
+
+        messages = body.get("messages", [])
+        system_prompt = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+        message = {"role": "assistant", "content": reply}
+        finish_reason = "stop"
+        if (body.get("tools") and TOOL_INSTRUCTION in system_prompt
+                and not any(m.get("role") == "tool" for m in messages)):
+            titles = re.findall(r"\*\*(.+?)\*\*", system_prompt)
+            arguments = json.dumps({"title": titles[0] if titles else "The Hobbit"})
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                    "type": "function",
+                    "function": {"name": "get_summary_by_title", "arguments": arguments}
+                }]
+            }
+            finish_reason = "tool_calls"
+
+        if body.get("stream"):
+            return StreamingResponse(stream(body, message, finish_reason), media_type="text/event-stream")
+
+        await asyncio.sleep(latency_ms / 1000)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": usage(body, 20)
+        }
+
+    return app
+
+
+class StubServer:
+    """Run the stub app with uvicorn on a background thread"""
+
+    def __init__(self, port: int = 8100, **app_options):
+        import uvicorn
+
+        config = uvicorn.Config(create_app(**app_options), host="127.0.0.1", port=port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.base_url = f"http://127.0.0.1:{port}/v1"
+        self._thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self._thread.join()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--token-interval-ms", type=float, default=10)
+    parser.add_argument("--embedding-latency-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=429, help="status of injected failures")
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After seconds on failures")
+    parser.add_argument("--rate-limit-rpm", type=float, default=0, help="429 above this rate (0: unlimited)")
+    parser.add_argument("--reply-words", type=int, default=0, help="length of completions (0: one sentence)")
+    args = parser.parse_args()
+    uvicorn.run(
+        create_app(
+            latency_ms=args.latency_ms, token_interval_ms=args.token_interval_ms,
+            embedding_latency_ms=args.embedding_latency_ms, error_rate=args.error_rate,
+            error_status=args.error_status, retry_after=args.retry_after, rate_limit_rpm=args.rate_limit_rpm,
+            reply_words=args.reply_words
+        ),
+        host="127.0.0.1", port=args.port
+    )
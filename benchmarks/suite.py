@@ -0,0 +1,235 @@
+"""
+Benchmark suite over synthetic catalogs of several sizes, for comparing builds.
+
+For each size it measures catalog parsing throughput, ingestion time,
+search_books p50/p99 per search mode, get_all_titles cost and end-to-end
+/chat requests per second through the FastAPI app. Embeddings come from the
+deterministic fake embedder and completions from the stub OpenAI server, so
+it runs offline.
+
+    python -m benchmarks.suite 1000 100000 1000000 [--output results.json] [--baseline old.json]
+
+With --baseline, timings more than --tolerance worse than the baseline's are
+listed under "regressions" and the exit status is 1.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Iterator, List, Tuple
+
+from .catalog import WORDS, write_catalog
+from .common import latency_summary
+from .stub_openai import StubServer
+
+# Timings below this are too noisy to compare between runs
+NOISE_FLOOR_MS = 1.0
+
+
+def timed(function, *args, **kwargs) -> Tuple[float, object]:
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def search_queries(count: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    return [' '.join(rng.sample(WORDS, 3)) for _ in range(count)]
+
+
+def bench_parse(catalog: str) -> Dict:
+    from backend.vector_store import VectorStore, iter_book_summaries
+
+    size_mb = os.path.getsize(catalog) / 2 ** 20
+    streamed, count = timed(lambda: sum(1 for _ in iter_book_summaries(catalog)))
+    with open(catalog, 'r', encoding='utf-8') as file:
+        content = file.read()
+    # parse_book_summaries does not touch the store, so skip __init__
+    parsed, books = timed(VectorStore.parse_book_summaries, VectorStore.__new__(VectorStore), content)
+    assert len(books) == count
+    return {
+        'catalog_mb': round(size_mb, 1),
+        'parse_book_summaries_s': round(parsed, 3),
+        'parse_books_per_second': round(count / parsed),
+        'parse_mb_per_second': round(size_mb / parsed, 1),
+        'stream_s': round(streamed, 3),
+        'stream_books_per_second': round(count / streamed)
+    }
+
+
+def bench_search(vector_store, queries: List[str]) -> Dict:
+    results = {}
+    for mode in ('hybrid', 'vector', 'lexical'):
+        latencies = []
+        for query in queries:
+            seconds, _ = timed(vector_store.search_books, query, n_results=5, mode=mode)
+            latencies.append(seconds)
+        results[mode] = latency_summary(latencies)
+    return results
+
+
+def bench_titles(vector_store, repeats: int) -> Dict:
+    latencies = [timed(vector_store.get_all_titles)[0] for _ in range(repeats)]
+    return latency_summary(latencies)
+
+
+async def bench_chat(vector_store, requests: int, concurrency: int) -> Dict:
+    """POST /chat through the ASGI app, with the librarian around the already-open store"""
+    import httpx
+    from backend import api
+    from backend.chat_bot import SmartLibrarian
+
+    api.librarian = SmartLibrarian(vector_store)
+    queries = [f"books about {query}" for query in search_queries(requests, seed=2)]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url='http://suite') as client:
+        async def one(query):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post('/chat', json={'message': query}, timeout=60)
+                latencies.append(time.perf_counter() - start)
+                errors += response.status_code != 200 or 'encountered an error' in response.json()['response']
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(query) for query in queries))
+        elapsed = time.perf_counter() - start
+
+    api.librarian.close()
+    api.librarian = None
+    return {'requests_per_second': round(requests / elapsed, 2), 'errors': errors, **latency_summary(latencies)}
+
+
+def bench_size(books: int, args) -> Dict:
+    from backend.vector_store import VectorStore
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['CHROMA_DB_PATH'] = directory
+        catalog_seconds, catalog = timed(write_catalog, os.path.join(directory, 'catalog.txt'), books)
+        result = {'books': books, 'generate_s': round(catalog_seconds, 3), 'parse': bench_parse(catalog)}
+        gc.collect()
+
+        vector_store = VectorStore()
+        seconds, report = timed(vector_store.load_books_from_file, catalog, incremental=False)
+        result['ingest'] = {
+            'seconds': round(seconds, 3),
+            'books_per_second': round(books / seconds),
+            'timings': report['timings']
+        }
+
+        result['search'] = bench_search(vector_store, search_queries(args.queries))
+        result['get_all_titles'] = bench_titles(vector_store, args.title_repeats)
+        result['chat'] = asyncio.run(bench_chat(vector_store, args.chat_requests, args.concurrency))
+
+        del vector_store
+        gc.collect()
+        return result
+
+
+def flatten(results: Dict, prefix: str = '') -> Iterator[Tuple[str, float]]:
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from flatten(value, path + '.')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, value
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[Dict]:
+    """Metrics of results worse than baseline by more than tolerance (a fraction).
+
+    Throughputs ("per_second") should not drop; times ("_s", "_ms",
+    "seconds") should not grow, unless both are under NOISE_FLOOR_MS.
+    Other numbers are not compared.
+    """
+    old_runs = {run['books']: dict(flatten(run)) for run in baseline.get('runs', [])}
+    regressions = []
+    for run in results['runs']:
+        old = old_runs.get(run['books'])
+        if old is None:
+            continue
+        for metric, value in flatten(run):
+            before = old.get(metric)
+            if not before:
+                continue
+            leaf = metric.rsplit('.', 1)[-1]
+            if 'per_second' in leaf:
+                change = (before - value) / before
+            elif leaf.endswith(('_s', '_ms')) or leaf == 'seconds':
+                scale = 1 if leaf.endswith('_ms') else 1000
+                if max(before, value) * scale < NOISE_FLOOR_MS:
+                    continue
+                change = (value - before) / before
+            else:
+                continue
+            if change > tolerance:
+                regressions.append({
+                    'books': run['books'], 'metric': metric, 'baseline': before, 'value': value,
+                    'worse_by': round(change, 3)
+                })
+    return regressions
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(args) -> Dict:
+    with StubServer(port=args.port, latency_ms=args.latency_ms) as stub:
+        os.environ.update(
+            OPENAI_API_KEY='offline', OPENAI_BASE_URL=stub.base_url, EMBEDDING_PROVIDER='fake',
+            EMBEDDING_CACHE_PATH='', EMBEDDING_CACHE_SIZE='0', RESPONSE_CACHE_SIZE='0',
+            VECTOR_BACKEND=args.backend, FAKE_EMBEDDING_DIMENSIONS=str(args.dimensions)
+        )
+        return {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'backend': args.backend,
+            'dimensions': args.dimensions,
+            'stub_latency_ms': args.latency_ms,
+            'runs': [bench_size(books, args) for books in args.sizes]
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sizes", type=int, nargs="*", default=[1000, 100000, 1000000])
+    parser.add_argument("--backend", choices=["numpy", "chroma"], default="numpy")
+    parser.add_argument("--dimensions", type=int, default=256, help="fake embedding dimensions")
+    parser.add_argument("--queries", type=int, default=200, help="search_books calls per mode")
+    parser.add_argument("--title-repeats", type=int, default=20)
+    parser.add_argument("--chat-requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=50, help="stub completion latency")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--output", help="also write the results to this file")
+    parser.add_argument("--baseline", help="results file of an earlier build to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before flagging")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            results['regressions'] = compare(results, json.load(file), args.tolerance)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+    sys.exit(1 if results.get('regressions') else 0)
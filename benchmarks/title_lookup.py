@@ -0,0 +1,78 @@
+"""
+TitleIndex.fuzzy_lookup accuracy and latency on synthetic catalogs, for
+exact titles, case/punctuation variants, titles with a one-letter typo and
+their last two words only,
+against a linear difflib scan over every title (catalogs up to 100k only,
+since it takes seconds per query).
+
+    python -m benchmarks.title_lookup [catalog sizes...]
+"""
+import difflib
+import json
+import random
+import string
+import sys
+import time
+
+from .catalog import synthetic_titles
+from .common import latency_summary
+
+
+def misspell(rng: random.Random, title: str) -> str:
+    """Delete, replace or swap one letter of a word (numbers are left alone)"""
+    positions = [i for i, char in enumerate(title) if char.isalpha()]
+    i = rng.choice(positions[:-1])
+    edit = rng.choice(('delete', 'replace', 'swap'))
+    if edit == 'delete':
+        return title[:i] + title[i + 1:]
+    if edit == 'replace':
+        return title[:i] + rng.choice(string.ascii_lowercase) + title[i + 1:]
+    return title[:i] + title[i + 1] + title[i] + title[i + 2:]
+
+
+def run(sizes, queries: int = 500, linear_queries: int = 5):
+    from backend.title_index import TitleIndex, normalize_title
+
+    results = []
+    for size in sizes:
+        titles = list(synthetic_titles(size))
+        index = TitleIndex()
+        start = time.perf_counter()
+        for i, title in enumerate(titles):
+            index.add(str(i), title)
+        build_seconds = time.perf_counter() - start
+
+        rng = random.Random(0)
+        sample = rng.sample(titles, min(queries, size))
+        variants = {
+            'exact': [(title, title) for title in sample],
+            'case_punctuation': [(title, title.upper().replace(' ', ' - ', 1)) for title in sample],
+            'typo': [(title, misspell(rng, title)) for title in sample],
+            'partial': [(title, ' '.join(title.split()[-2:])) for title in sample if len(title.split()) > 3]
+        }
+
+        result = {'titles': size, 'build_s': round(build_seconds, 2)}
+        for name, pairs in variants.items():
+            latencies, correct = [], 0
+            for title, query in pairs:
+                start = time.perf_counter()
+                match = index.fuzzy_lookup(query)
+                latencies.append(time.perf_counter() - start)
+                correct += match is not None and index.title_for(match[0]) == title
+            result[name] = {'accuracy': round(correct / len(pairs), 3), **latency_summary(latencies)}
+
+        if size <= 100000:
+            keys = [normalize_title(title) for title in titles]
+            latencies = []
+            for _, query in variants['typo'][:linear_queries]:
+                start = time.perf_counter()
+                difflib.get_close_matches(normalize_title(query), keys, n=1, cutoff=0.5)
+                latencies.append(time.perf_counter() - start)
+            result['linear_difflib_typo'] = latency_summary(latencies)
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 100000]
+    print(json.dumps(run(sizes), indent=2))
@@ -1,7 +1,11 @@
 import streamlit as st
 import requests
 import json
-from typing import Dict
+import os
+import time
+import uuid
+from requests.adapters import HTTPAdapter
+from typing import Dict, Iterator, List, Optional, Tuple
 
 # Configure the page
 st.set_page_config(
@@ -12,15 +16,36 @@ st.set_page_config(
 )
 
 # API Configuration
-API_BASE_URL = "http://localhost:8000"
+API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
 
+# Titles shown per sidebar page, and how long the book list and API status are reused
+BOOKS_PAGE_SIZE = int(os.getenv("BOOKS_PAGE_SIZE", 50))
+BOOKS_TTL = float(os.getenv("BOOKS_TTL", 300))
+STATUS_TTL = float(os.getenv("STATUS_TTL", 15))
 
-def call_chat_api(message: str) -> Dict:
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """HTTP session shared by every rerun and user, keeping connections to the API open"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@st.cache_resource
+def get_book_pages() -> Dict[Tuple[int, int], Dict]:
+    """Fetched /books pages with their ETags, shared across reruns"""
+    return {}
+
+
+def call_chat_api(message: str, session_id: Optional[str] = None) -> Dict:
     """Call the chat API"""
     try:
-        response = requests.post(
+        response = get_http_session().post(
             f"{API_BASE_URL}/chat",
-            json={"message": message},
+            json={"message": message, "session_id": session_id},
             timeout=30
         )
         response.raise_for_status()
@@ -29,14 +54,73 @@ def call_chat_api(message: str) -> Dict:
         return {"error": f"API Error: {str(e)}"}
 
 
-def get_available_books():
-    """Get list of available books"""
+def stream_chat_api(message: str, session_id: Optional[str] = None) -> Iterator[Tuple[str, Dict]]:
+    """Call the streaming chat API and yield (event, data) pairs as they arrive"""
+    try:
+        with get_http_session().post(
+            f"{API_BASE_URL}/chat/stream",
+            json={"message": message, "session_id": session_id},
+            stream=True,
+            timeout=(5, 60)
+        ) as response:
+            response.raise_for_status()
+            event = "message"
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    yield event, json.loads(line[len("data: "):])
+                    event = "message"
+    except requests.exceptions.RequestException as e:
+        yield "error", {"error": f"API Error: {str(e)}"}
+
+
+def get_available_books(page: int = 0) -> Tuple[List[str], int]:
+    """One page of titles and the catalog size.
+
+    A page is reused for BOOKS_TTL seconds, then revalidated with its ETag,
+    so an unchanged catalog is not transferred again.
+    """
+    pages = get_book_pages()
+    key = (page, BOOKS_PAGE_SIZE)
+    cached = pages.get(key)
+    if cached is not None and time.monotonic() - cached["fetched_at"] < BOOKS_TTL:
+        return cached["books"], cached["total"]
+
     try:
-        response = requests.get(f"{API_BASE_URL}/books", timeout=10)
+        response = get_http_session().get(
+            f"{API_BASE_URL}/books",
+            params={"offset": page * BOOKS_PAGE_SIZE, "limit": BOOKS_PAGE_SIZE},
+            headers={"If-None-Match": cached["etag"]} if cached else {},
+            timeout=10
+        )
+        if response.status_code == 304 and cached is not None:
+            cached["fetched_at"] = time.monotonic()
+            return cached["books"], cached["total"]
         response.raise_for_status()
-        return response.json().get("books", [])
+        data = response.json()
     except requests.exceptions.RequestException:
-        return []
+        return ([], 0) if cached is None else (cached["books"], cached["total"])
+
+    pages[key] = {
+        "books": data.get("books", []),
+        "total": data.get("total", 0),
+        "etag": response.headers.get("ETag"),
+        "fetched_at": time.monotonic()
+    }
+    return pages[key]["books"], pages[key]["total"]
+
+
+@st.cache_data(ttl=STATUS_TTL, show_spinner=False)
+def get_api_status() -> str:
+    """API readiness ("ready", "starting", "failed" or "offline"), checked at most every STATUS_TTL seconds"""
+    try:
+        response = get_http_session().get(f"{API_BASE_URL}/ready", timeout=5)
+        if response.status_code == 200:
+            return "ready"
+        return response.json().get("status", "failed")
+    except (requests.exceptions.RequestException, ValueError):
+        return "offline"
 
 
 def main():
@@ -49,12 +133,19 @@ def main():
     with st.sidebar:
         st.header("📖 Available Books")
 
-        with st.spinner("Loading books..."):
-            books = get_available_books()
+        # Only the selected page of titles is fetched and rendered
+        books, total = get_available_books(st.session_state.get("books_page", 1) - 1)
+        pages = max(1, (total + BOOKS_PAGE_SIZE - 1) // BOOKS_PAGE_SIZE)
+        if st.session_state.get("books_page", 1) > pages:
+            # The catalog shrank under the selected page
+            st.session_state.books_page = pages
+            books, total = get_available_books(pages - 1)
 
         if books:
-            st.write(f"**{len(books)} books** in our database:")
-            for book in sorted(books):
+            st.write(f"**{total} books** in our database:")
+            if pages > 1:
+                st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, key="books_page")
+            for book in books:
                 st.write(f"• {book}")
         else:
             st.warning("Could not load book list. Make sure the API is running.")
@@ -71,14 +162,19 @@ def main():
 
         st.markdown("---")
         st.markdown("### 🔧 API Status")
-        try:
-            health_response = requests.get(f"{API_BASE_URL}/health", timeout=5)
-            if health_response.status_code == 200:
-                st.success("✅ API Connected")
-            else:
-                st.error("❌ API Issues")
-        except:
+        status = get_api_status()
+        if status == "ready":
+            st.success("✅ API Connected")
+        elif status == "starting":
+            st.info("⏳ API Starting")
+        elif status == "offline":
             st.error("❌ API Offline")
+        else:
+            st.error("❌ API Issues")
+
+    # The backend keeps the conversation under this id, so follow-up questions have context
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
 
     # Initialize chat history
     if "messages" not in st.session_state:
@@ -101,22 +197,33 @@ def main():
         with st.chat_message("user"):
             st.markdown(prompt)
 
-        # Get AI response
+        # Stream the AI response as it is generated
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                response_data = call_chat_api(prompt)
+            placeholder = st.empty()
+            placeholder.markdown("_Thinking..._")
+            response = ""
+            response_data = {}
+
+            for event, data in stream_chat_api(prompt, st.session_state.session_id):
+                if event == "token":
+                    response += data["content"]
+                    placeholder.markdown(response + "▌")
+                elif event == "tool_call":
+                    placeholder.markdown((response or "") + "\n\n_Looking up a detailed summary..._")
+                elif event in ("done", "error"):
+                    response_data = data
 
             if "error" in response_data:
                 response = f"Sorry, I encountered an error: {response_data['error']}"
-                st.error(response)
+                placeholder.error(response)
             else:
-                response = response_data.get("response", "I'm sorry, I couldn't generate a response.")
+                response = response_data.get("response") or response or "I'm sorry, I couldn't generate a response."
 
                 # Check for inappropriate content warning
                 if response_data.get("inappropriate_content", False):
                     st.warning("⚠️ Please keep our conversation respectful!")
 
-                st.markdown(response)
+                placeholder.markdown(response)
 
                 # Show recommended books if available
                 if response_data.get("recommended_books"):
@@ -129,6 +236,11 @@ def main():
 
     # Clear chat button
     if st.button("🗑️ Clear Chat", type="secondary"):
+        try:
+            get_http_session().delete(f"{API_BASE_URL}/sessions/{st.session_state.session_id}", timeout=5)
+        except requests.exceptions.RequestException:
+            pass
+        st.session_state.session_id = uuid.uuid4().hex
         st.session_state.messages = []
         st.session_state.messages.append({
             "role": "assistant",
@@ -0,0 +1,61 @@
+import os
+
+# Offline configuration, set before any backend module reads the environment
+os.environ.update(
+    OPENAI_API_KEY='offline',
+    EMBEDDING_PROVIDER='fake',
+    EMBEDDING_CACHE_PATH='',
+    VECTOR_BACKEND='numpy',
+    INDEX_SNAPSHOTS='false',
+    SEARCH_MODE='hybrid',
+    PASSAGE_TOKENS='0',
+    NUMPY_QUANTIZATION='none',
+    SESSION_BACKEND='memory'
+)
+
+import pytest
+
+BOOKS = [
+    ("Dune", "Desert planet Arrakis, spice melange and Paul Atreides among the Fremen."),
+    ("The Hobbit", "Bilbo Baggins joins dwarves on a quest to take back their treasure from the dragon Smaug."),
+    ("1984", "Winston Smith lives under Big Brother, surveillance and the Thought Police."),
+    ("Pride and Prejudice", "Elizabeth Bennet and the proud Mr. Darcy in Regency England society."),
+]
+
+
+def write_catalog(path, books=BOOKS):
+    with open(path, 'w', encoding='utf-8') as file:
+        for title, summary in books:
+            file.write(f"## Title: {title}\n{summary}\n\n")
+    return str(path)
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    return write_catalog(tmp_path / 'catalog.txt')
+
+
+@pytest.fixture
+def vector_store(tmp_path, catalog):
+    from backend.vector_store import VectorStore
+
+    store = VectorStore(path=str(tmp_path / 'index'))
+    store.load_books_from_file(catalog)
+    return store
+
+
+@pytest.fixture
+def stub_gateway():
+    """Gateway whose async client talks to the offline OpenAI stub in-process"""
+    import httpx
+    import openai
+
+    from backend.openai_client import OpenAIGateway
+    from benchmarks.stub_openai import create_app
+
+    gateway = OpenAIGateway(api_key='offline', tokens_per_minute=60000)
+    gateway.async_client = openai.AsyncOpenAI(
+        api_key='offline', base_url='http://stub/v1', max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(latency_ms=0, token_interval_ms=0)))
+    )
+    return gateway
@@ -0,0 +1,44 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import api
+
+
+@pytest.fixture
+def client(vector_store, monkeypatch):
+    from backend.chat_bot import SmartLibrarian
+
+    librarian = SmartLibrarian(vector_store=vector_store)
+    monkeypatch.setattr(api, 'librarian', librarian)
+    # Without the lifespan, so no librarian is started from the configured catalog
+    yield TestClient(api.app)
+    librarian.close()
+
+
+def test_chat_batch_rejects_blank_messages_before_any_work(client, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("blank batch reached the librarian")
+
+    monkeypatch.setattr(api.librarian, 'aget_book_recommendations_batch', fail)
+    response = client.post("/chat/batch", json={"messages": ["a desert planet", "  ", ""]})
+
+    assert response.status_code == 400
+    assert response.json()['detail'] == "Messages cannot be empty (items 1, 2)"
+
+
+def test_chat_batch_rejects_an_empty_list(client):
+    assert client.post("/chat/batch", json={"messages": []}).status_code == 400
+
+
+def test_chat_batch_streams_one_line_per_message(client, monkeypatch):
+    async def batch(messages, mode, concurrency):
+        for index, message in enumerate(messages):
+            yield {"index": index, "query": message}
+
+    monkeypatch.setattr(api.librarian, 'aget_book_recommendations_batch', batch)
+    response = client.post("/chat/batch", json={"messages": ["a desert planet", "a hobbit"]})
+
+    assert response.status_code == 200
+    assert [json.loads(line)['index'] for line in response.text.splitlines()] == [0, 1]
@@ -0,0 +1,85 @@
+import asyncio
+import json
+
+import pytest
+
+
+@pytest.fixture
+def librarian(vector_store):
+    from backend.chat_bot import SmartLibrarian
+
+    librarian = SmartLibrarian(vector_store=vector_store)
+    yield librarian
+    librarian.close()
+
+
+def collect(librarian, message):
+    async def run():
+        return [event async for event in librarian.astream_book_recommendation(message)]
+    return asyncio.run(run())
+
+
+def test_done_event_reports_usage_of_every_completion(librarian, stub_gateway, monkeypatch):
+    monkeypatch.setattr(librarian, 'openai', stub_gateway)
+    events = collect(librarian, "a book about a desert planet")
+
+    assert events[-1]['event'] == 'done'
+    usage = events[-1]['data']['usage']
+    completions = 2 if any(event['event'] == 'tool_call' for event in events) else 1
+    assert usage['llm_calls'] == completions
+    assert usage['total_tokens'] == usage['prompt_tokens'] + usage['completion_tokens'] > 0
+
+
+def test_retrieval_failure_ends_stream_with_error_event(librarian, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("embedding service unavailable")
+
+    monkeypatch.setattr(librarian, '_retrieve', fail)
+    events = collect(librarian, "a book about a desert planet")
+
+    assert [event['event'] for event in events] == ['error']
+    assert "embedding service unavailable" in events[0]['data']['response']
+
+
+def test_failures_are_counted_without_writing_to_stdout(librarian, monkeypatch, capsys):
+    from backend.metrics import METRICS
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("embedding service unavailable")
+
+    monkeypatch.setattr(librarian, '_retrieve', fail)
+    capsys.readouterr()
+    collect(librarian, "a book about a desert planet")
+
+    assert capsys.readouterr().out == ""
+    assert 'librarian_errors_total{type="RuntimeError"}' in METRICS.render()
+
+
+def test_cache_lookup_failure_ends_stream_with_error_event(librarian, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("cache embedding failed")
+
+    monkeypatch.setattr(librarian.response_cache, 'lookup', fail)
+    events = collect(librarian, "a book about a desert planet")
+
+    assert events[-1]['event'] == 'error'
+
+
+def test_chat_stream_endpoint_sends_error_event(librarian, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from backend import api
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("embedding service unavailable")
+
+    monkeypatch.setattr(librarian, '_retrieve', fail)
+    monkeypatch.setattr(api, 'librarian', librarian)
+
+    # Without the lifespan, so no librarian is started from the configured catalog
+    response = TestClient(api.app).post("/chat/stream", json={"message": "a book about a desert planet"})
+
+    assert response.status_code == 200
+    events = [block.split('\n') for block in response.text.strip().split('\n\n')]
+    assert events[-1][0] == 'event: error'
+    assert "embedding service unavailable" in json.loads(events[-1][1][len('data: '):])['response']
@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+from backend.content_filter import DEFAULT_WORDS, ProfanityFilter, load_word_list
+
+WORD_LIST = os.path.join(os.path.dirname(__file__), '..', 'data', 'inappropriate_words.txt')
+
+
+@pytest.fixture(scope='module')
+def profanity_filter():
+    return ProfanityFilter(load_word_list(WORD_LIST))
+
+
+@pytest.mark.parametrize('text', [
+    'shit', 'SHIT!', 'what the fuck', 'damned', 'pissing', 'fuckers', 'bitches',
+    'shitty', 'sh1tty', 'bullshitting', 'a$$hole', 'Fück this',
+])
+def test_blocks_banned_words_and_inflections(profanity_filter, text):
+    assert profanity_filter.contains(text)
+
+
+@pytest.mark.parametrize('text', [
+    'Scunthorpe United', 'a book about assassins', 'cocktail recipes', 'Dickens', 'a classic',
+    'passionate romance', 'shiitake mushrooms', 'scrapbook', '',
+    'The Damnation of Theron Ware', 'Pissarro paintings', 'Ashitaka and San',
+])
+def test_allows_banned_words_inside_longer_words(profanity_filter, text):
+    assert not profanity_filter.contains(text)
+
+
+@pytest.mark.parametrize('text', [
+    'motherfucking', 'shithead', 'goddamn', 'GODDAMNED', 'bullshit', 'horseshit', 'dipsh1t',
+    'sonofabitch', 'fuckwit', 'dumbasshole',
+])
+def test_blocks_compounds_of_marked_words(profanity_filter, text):
+    assert profanity_filter.contains(text)
+
+
+def test_compound_markers_choose_which_end_may_have_extra_letters():
+    content_filter = ProfanityFilter(['*damn', 'shit*', 'cunt'])
+    assert content_filter.find('goddamn shithead') == ['goddamn', 'shithead']
+    assert not content_filter.contains('damnation bullshit Scunthorpe')
+
+
+def test_find_returns_normalized_matches(profanity_filter):
+    assert profanity_filter.find('Sh1tty and DAMNED') == ['shitty', 'damned']
+
+
+def test_default_list_matches_the_shipped_file():
+    assert ProfanityFilter.from_file('missing-file.txt').words == ProfanityFilter(DEFAULT_WORDS).words
+    assert set(DEFAULT_WORDS) <= set(ProfanityFilter(load_word_list(WORD_LIST)).words)
+
+
+def test_empty_list_matches_nothing():
+    assert not ProfanityFilter([]).contains('shit')
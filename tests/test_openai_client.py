@@ -0,0 +1,56 @@
+import asyncio
+
+from backend.openai_client import TokenBucket
+
+MESSAGES = [{"role": "user", "content": "Recommend a book about a desert planet."}]
+
+
+def record_adjustments(gateway, monkeypatch):
+    adjustments = []
+    adjust = gateway.token_bucket.adjust
+    monkeypatch.setattr(gateway.token_bucket, 'adjust', lambda amount: adjustments.append(amount) or adjust(amount))
+    return adjustments
+
+
+def test_completion_settles_token_bucket(stub_gateway, monkeypatch):
+    adjustments = record_adjustments(stub_gateway, monkeypatch)
+    response = asyncio.run(stub_gateway.achat_completion(model="gpt-4o-mini", messages=MESSAGES, max_tokens=50))
+
+    estimate = stub_gateway._estimate_chat_tokens({"messages": MESSAGES, "max_tokens": 50})
+    assert adjustments == [response.usage.total_tokens - estimate]
+
+
+def test_stream_settles_token_bucket_from_usage_chunk(stub_gateway, monkeypatch):
+    adjustments = record_adjustments(stub_gateway, monkeypatch)
+
+    async def read():
+        stream = await stub_gateway.achat_completion(
+            model="gpt-4o-mini", messages=MESSAGES, max_tokens=50, stream=True
+        )
+        return [chunk async for chunk in stream]
+
+    chunks = asyncio.run(read())
+    usage = chunks[-1].usage
+    assert not chunks[-1].choices
+    assert usage.completion_tokens == len(chunks) - 3
+
+    estimate = stub_gateway._estimate_chat_tokens({"messages": MESSAGES, "max_tokens": 50})
+    assert adjustments == [usage.total_tokens - estimate]
+
+
+def test_reserve_takes_at_most_the_capacity():
+    bucket = TokenBucket(rate_per_minute=600)
+    wait, taken = bucket.reserve(5000)
+    assert taken == bucket.capacity == 10
+    assert wait == 0.0
+
+
+def test_large_request_is_settled_against_what_was_reserved(stub_gateway, monkeypatch):
+    stub_gateway.token_bucket = TokenBucket(rate_per_minute=600)
+    adjustments = record_adjustments(stub_gateway, monkeypatch)
+    messages = [{"role": "user", "content": "a long question " * 200}]
+    response = asyncio.run(stub_gateway.achat_completion(model="gpt-4o-mini", messages=messages, max_tokens=50))
+
+    assert stub_gateway._estimate_chat_tokens({"messages": messages, "max_tokens": 50}) > 10
+    # Only the capacity was taken up front, so the whole rest of the usage is charged
+    assert adjustments == [response.usage.total_tokens - 10]
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+from backend.embeddings import FakeEmbeddingFunction
+from backend.response_cache import ResponseCache, normalize_query
+
+RESULT = {'response': "Try Dune.", 'recommended_books': ["Dune"], 'usage': {'total_tokens': 120}}
+
+
+@pytest.fixture
+def embedder():
+    return FakeEmbeddingFunction()
+
+
+@pytest.fixture
+def cache(embedder):
+    return ResponseCache(embedder, max_entries=4, similarity_threshold=0.9)
+
+
+def test_normalize_query_ignores_case_punctuation_and_spacing():
+    assert normalize_query("  Books like DUNE?! ") == normalize_query("books like dune")
+
+
+def test_exact_hit_on_normalized_query(cache):
+    cache.store("Books like Dune", 'tool', RESULT, 2.0, catalog_version=1)
+    hit, vector = cache.lookup("books like dune!", 'tool', catalog_version=1)
+
+    assert hit['response'] == RESULT['response'] and hit['cached'] == 'exact'
+    assert 'usage' not in hit
+    assert vector is None
+    assert cache.stats()['saved_tokens'] == 120
+
+
+def test_semantic_hit_and_mode_separation(cache):
+    cache.store("desert planet spice fremen novel", 'tool', RESULT, 1.0, catalog_version=1)
+
+    hit, _ = cache.lookup("fremen spice desert planet novel please", 'tool', catalog_version=1)
+    assert hit['cached'] == 'semantic'
+    assert cache.lookup("desert planet spice fremen novel", 'rag', catalog_version=1)[0] is None
+
+
+def test_catalog_version_change_invalidates_entries(cache):
+    cache.store("Books like Dune", 'tool', RESULT, 1.0, catalog_version=1)
+    assert cache.lookup("Books like Dune", 'tool', catalog_version=1)[0] is not None
+
+    assert cache.lookup("Books like Dune", 'tool', catalog_version=2)[0] is None
+    assert cache.stats()['entries'] == 0
+    # A stale store after the change does not bring the old catalog back
+    cache.store("Books like Dune", 'tool', RESULT, 1.0, catalog_version=1)
+    assert cache.lookup("Books like Dune", 'tool', catalog_version=2)[0] is None
+
+
+def test_expired_entries_miss(embedder):
+    cache = ResponseCache(embedder, ttl_seconds=-1)
+    cache.store("Books like Dune", 'tool', RESULT, 1.0, catalog_version=1)
+    assert cache.lookup("Books like Dune", 'tool', catalog_version=1)[0] is None
+
+
+def test_least_recently_used_entry_is_evicted(embedder):
+    cache = ResponseCache(embedder, max_entries=2, similarity_threshold=1.1)
+    for query in ("dune", "the hobbit", "nineteen eighty four"):
+        cache.store(query, 'tool', RESULT, 1.0, catalog_version=1)
+
+    assert cache.lookup("dune", 'tool', catalog_version=1)[0] is None
+    assert cache.lookup("the hobbit", 'tool', catalog_version=1)[0] is not None
+    assert cache.stats()['entries'] == 2
+
+
+def test_disabled_cache_never_embeds(embedder):
+    cache = ResponseCache(embedder, max_entries=0)
+    cache.store("Books like Dune", 'tool', RESULT, 1.0, catalog_version=1)
+    assert cache.lookup("Books like Dune", 'tool', catalog_version=1) == (None, None)
+    assert embedder.calls == 0
+
+
+def test_miss_returns_the_raw_query_embedding_for_store(cache, embedder):
+    hit, vector = cache.lookup("Books like Dune?", 'tool', catalog_version=1)
+    assert hit is None
+    np.testing.assert_allclose(vector, embedder(["Books like Dune?"])[0])
+
+    calls = embedder.calls
+    cache.store("Books like Dune?", 'tool', RESULT, 1.0, catalog_version=1, vector=vector)
+    assert embedder.calls == calls
+
+
+def test_recommendation_embeds_the_query_once(vector_store, monkeypatch):
+    from backend.chat_bot import SmartLibrarian
+
+    librarian = SmartLibrarian(vector_store=vector_store)
+    embedded, searched = [], []
+    embedding_function = librarian.response_cache.embedding_function
+    search_books = vector_store.search_books
+
+    def embed(texts):
+        embedded.extend(texts)
+        return embedding_function(texts)
+
+    def search(query, **kwargs):
+        searched.append(kwargs.get('query_embedding'))
+        return search_books(query, **kwargs)
+
+    def recommend(user_query, books, mode, session=None):
+        return dict(RESULT, recommended_books=[book['title'] for book in books])
+
+    monkeypatch.setattr(librarian.response_cache, 'embedding_function', embed)
+    monkeypatch.setattr(vector_store, 'search_books', search)
+    monkeypatch.setattr(librarian, '_recommend_from_books', recommend)
+    try:
+        result = librarian.get_book_recommendation("A desert planet and its spice", mode='tool')
+        assert result['recommended_books'][0] == "Dune"
+        assert embedded == ["A desert planet and its spice"]
+        assert searched[0] is not None
+
+        assert librarian.get_book_recommendation("a desert planet, and its spice", mode='tool')['cached'] == 'exact'
+        assert len(embedded) == 1
+    finally:
+        librarian.close()
@@ -0,0 +1,51 @@
+import pytest
+
+from backend.vector_store import VectorStore, content_hash
+
+CATALOG = """## Title: The Hobbit
+Author: J.R.R. Tolkien
+Genre: Fantasy
+Bilbo Baggins joins dwarves on a quest to take back their treasure from the dragon Smaug.
+## Title: The Lord of the Rings
+Author: J.R.R. Tolkien
+Genre: Fantasy
+Frodo carries the One Ring across Middle-earth to destroy it.
+## Title: Dune
+Author: Frank Herbert
+Genre: Science Fiction
+Desert planet Arrakis, spice melange and Paul Atreides among the Fremen.
+## Title: Pride and Prejudice
+Elizabeth Bennet and the proud Mr. Darcy in Regency England society.
+"""
+
+
+@pytest.fixture
+def store(tmp_path):
+    path = tmp_path / 'catalog.txt'
+    path.write_text(CATALOG, encoding='utf-8')
+    store = VectorStore(path=str(tmp_path / 'index'))
+    store.load_books_from_file(str(path))
+    return store
+
+
+@pytest.mark.parametrize('mode', ['vector', 'hybrid', 'lexical'])
+def test_filters_restrict_results_to_matching_books(store, mode):
+    books = store.search_books("a quest across a desert", n_results=4, filters={'genre': 'Fantasy'}, mode=mode)
+    assert {book['title'] for book in books} <= {"The Hobbit", "The Lord of the Rings"}
+
+    filters = {'author': 'Frank Herbert', 'genre': 'Science Fiction'}
+    books = store.search_books("a quest on a desert planet", n_results=4, filters=filters, mode=mode)
+    assert [book['title'] for book in books] == ["Dune"]
+
+
+def test_search_columns_returns_parallel_lists_per_query(store):
+    columns = store.search_columns(["dragon treasure", "desert spice"], n_results=2, mode='vector')
+    assert [column['titles'][0] for column in columns] == ["The Hobbit", "Dune"]
+    assert all(len(column['titles']) == len(column['summaries']) == len(column['distances']) == 2
+               for column in columns)
+
+
+def test_metadata_only_changes_the_hash_of_books_that_have_it():
+    book = {'title': "Dune", 'summary': "Desert planet."}
+    assert content_hash(dict(book, author=None, genre=None)) == content_hash(book)
+    assert content_hash(dict(book, genre="Science Fiction")) != content_hash(book)
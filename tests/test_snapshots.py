@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+from backend.embeddings import FakeEmbeddingFunction
+from backend.snapshots import SnapshotManager
+
+from conftest import BOOKS, write_catalog
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = SnapshotManager(str(tmp_path / 'snapshots'), FakeEmbeddingFunction(), keep=2)
+    yield manager
+    manager.close()
+
+
+def test_nothing_is_served_before_the_first_build(manager):
+    assert manager.published() is None
+    assert manager.load_current() is False
+    with pytest.raises(RuntimeError):
+        manager.store()
+
+
+def test_build_publishes_and_load_current_serves_it(manager, catalog):
+    manifest = manager.build(catalog, neighbors=0)
+    assert manifest['name'] == 'v000001' and manifest['books'] == len(BOOKS)
+    assert manager.published() == 'v000001'
+
+    assert manager.load_current() is True
+    assert manager.current.version == 1
+    assert manager.store().search_books("desert planet spice", n_results=1)[0]['title'] == "Dune"
+
+
+def test_incremental_build_embeds_only_changed_books(manager, catalog, tmp_path):
+    manager.build(catalog, neighbors=0)
+    changed = write_catalog(tmp_path / 'changed.txt', BOOKS[:3] + [("Emma", "Emma Woodhouse plays matchmaker.")])
+
+    manifest = manager.build(changed, neighbors=0)
+    report = manifest['report']
+    assert manifest['base'] == 'v000001' and manifest['version'] == 2
+    assert (report['added'], report['deleted'], report['unchanged']) == (1, 1, 3)
+
+
+def test_pinned_request_keeps_its_snapshot_across_a_swap(manager, catalog, tmp_path):
+    manager.build(catalog, neighbors=0)
+    manager.load_current()
+    old = manager.current
+
+    with manager.pin() as pinned:
+        assert pinned is old and old.refs == 1
+        manager.build(write_catalog(tmp_path / 'changed.txt', BOOKS[:2]), neighbors=0)
+        manager.load_current()
+
+        assert manager.current.name == 'v000002'
+        # The pinned request still sees the old catalog; the swap waits for it
+        assert manager.store() is old.vector_store
+        assert old.retired and not old.closed
+        assert manager.stats()['retired'] == [{'name': 'v000001', 'requests': 1}]
+
+    assert old.closed
+    assert manager.stats()['retired'] == []
+    assert manager.store() is manager.current.vector_store
+    assert manager.store().catalog_version == 2
+
+
+def test_prune_keeps_the_newest_and_the_served_snapshots(manager, catalog):
+    for _ in range(4):
+        manager.build(catalog, neighbors=0)
+
+    assert manager.snapshots() == ['v000003', 'v000004']
+    assert manager.published() == 'v000004'
+    assert not any(name.startswith('.staging-') for name in os.listdir(manager.root))
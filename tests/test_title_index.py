@@ -0,0 +1,101 @@
+import pytest
+
+from backend.title_index import TitleIndex, normalize_title
+from backend.vector_store import book_id_for_title
+
+
+def index_of(*titles):
+    index = TitleIndex()
+    for title in titles:
+        index.add(book_id_for_title(title), title)
+    return index
+
+
+def test_normalize_title_folds_case_accents_and_punctuation():
+    assert normalize_title("  Les Misérables!  ") == "les miserables"
+    assert normalize_title("DUNE") == normalize_title("Dune.")
+
+
+def test_add_remove_and_lookup():
+    index = index_of("Dune", "The Hobbit")
+    assert len(index) == 2
+    assert index.lookup("the hobbit") == book_id_for_title("The Hobbit")
+    assert index.title_for(book_id_for_title("Dune")) == "Dune"
+
+    index.remove(book_id_for_title("The Hobbit"))
+    assert index.lookup("The Hobbit") is None
+    assert index.fuzzy_lookup("The Hobit") is None
+    assert index.titles() == ["Dune"]
+
+
+def test_readding_a_title_is_a_no_op():
+    index = index_of("Dune")
+    digest = index.digest()
+    index.add(book_id_for_title("Dune"), "Dune")
+    assert len(index) == 1 and index.digest() == digest
+
+
+def test_titles_sharing_a_normalized_key_survive_each_others_removal():
+    index = index_of("Dune", "DUNE!")
+    assert index.lookup("dune") == book_id_for_title("DUNE!")
+
+    index.remove(book_id_for_title("DUNE!"))
+    assert index.lookup("Dune") == book_id_for_title("Dune")
+    assert index.fuzzy_lookup("Dune") == (book_id_for_title("Dune"), 1.0)
+    assert index.fuzzy_lookup("Dunes")[0] == book_id_for_title("Dune")
+
+    index.remove(book_id_for_title("Dune"))
+    assert index.lookup("Dune") is None
+    assert index.fuzzy_lookup("Dunes") is None
+
+
+def test_renamed_title_moves_to_its_new_key():
+    index = TitleIndex()
+    index.add("book_1", "The Hobbit")
+    index.add("book_1", "The Lord of the Rings")
+    assert index.lookup("The Hobbit") is None
+    assert index.lookup("the lord of the rings") == "book_1"
+
+
+def test_fuzzy_lookup_resolves_misspelled_and_partial_titles():
+    index = index_of("The Lord of the Rings", "Harry Potter and the Philosopher's Stone", "Pride and Prejudice")
+    book_id, similarity = index.fuzzy_lookup("Lord of the Rngs")
+    assert book_id == book_id_for_title("The Lord of the Rings") and similarity < 1.0
+    assert index.fuzzy_lookup("harry potter philosophers stone")[0] == \
+        book_id_for_title("Harry Potter and the Philosopher's Stone")
+    assert index.fuzzy_lookup("Quantum Chromodynamics") is None
+
+
+@pytest.mark.parametrize('query, title', [
+    ("Harry Potter", "Harry Potter and the "),
+    ("Harry Poter", "Harry Potter and the "),
+    ("Narnia", "The Chronicles of Narnia"),
+    ("Lion Witch Wardrobe", "The Chronicles of Narnia"),
+    ("Mockingbrd", "To Kill a Mockingbird"),
+])
+def test_fuzzy_lookup_resolves_partial_titles(query, title):
+    index = index_of("Harry Potter and the Philosopher's Stone", "Harry Potter and the Chamber of Secrets",
+                     "The Chronicles of Narnia: The Lion, the Witch and the Wardrobe", "To Kill a Mockingbird",
+                     "The Lord of the Rings")
+    book_id, similarity = index.fuzzy_lookup(query)
+    assert index.title_for(book_id).startswith(title)
+    assert similarity < 1.0
+
+
+def test_partial_match_never_beats_the_whole_title():
+    index = index_of("Harry Potter", "Harry Potter and the Chamber of Secrets")
+    assert index.fuzzy_lookup("Harry Potter") == (book_id_for_title("Harry Potter"), 1.0)
+    assert index.fuzzy_lookup("Chamber of Secrets")[0] == book_id_for_title("Harry Potter and the Chamber of Secrets")
+    # Runs made only of stopwords do not count as partial titles
+    assert index.fuzzy_lookup("of the and", 0.6) is None
+
+
+def test_sorted_titles_and_digest_track_changes():
+    index = index_of("b book", "A book")
+    assert index.sorted_titles() == ["A book", "b book"]
+    digest = index.digest()
+    assert index_of("A book", "b book").digest() == digest
+
+    index.remove(book_id_for_title("A book"))
+    assert index.sorted_titles() == ["b book"]
+    assert index.digest() != digest